@@ -0,0 +1,123 @@
+"""Admission control for the CPU-heavy voice endpoints.
+
+Without a limit, a burst of ``/voice-command`` uploads runs every decode and
+recognition at once: the box sits at 100% CPU, every request slows down,
+and even ``/health`` times out until the platform restarts the instance.
+An ``AdmissionGate`` lets a fixed number of requests run and parks a bounded
+number of others in a wait queue. Everything beyond that is shed right away
+with a 503 and a ``Retry-After`` hint, so admitted requests keep their
+latency and throughput stays flat under overload.
+
+Shedding is deadline aware. The gate keeps a moving average of how long a
+request holds its slot. A request that would not get a slot within
+``max_wait`` seconds, judged by its place in the queue, is rejected at once
+instead of waiting out its deadline first. A waiter that still misses
+``max_wait`` is shed when it expires. Stdlib only.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
+
+from metrics import Counter, Histogram
+
+VOICE_COMMAND_CONCURRENCY = int(os.environ.get("VOICE_COMMAND_CONCURRENCY", "4"))
+VOICE_COMMAND_QUEUE_SIZE = int(os.environ.get("VOICE_COMMAND_QUEUE_SIZE", "2"))
+VOICE_COMMAND_MAX_WAIT = float(os.environ.get("VOICE_COMMAND_MAX_WAIT", "5"))
+
+SERVICE_TIME_SMOOTHING = 0.2  # Weight of the newest request in the service time average
+
+ADMISSION_ADMITTED = Counter("admission_admitted_total", "Requests admitted by admission control", ["endpoint"])
+ADMISSION_SHED = Counter("admission_shed_total", "Requests rejected by admission control", ["endpoint", "reason"])
+ADMISSION_WAIT_SECONDS = Histogram("admission_wait_seconds", "Time admitted requests waited for a slot",
+                                   ["endpoint"])
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; ``retry_after`` is a whole number of seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionGate:
+    """Concurrency limit with a bounded, deadline-aware wait queue for one endpoint"""
+
+    def __init__(self, name: str, concurrency: int = VOICE_COMMAND_CONCURRENCY,
+                 queue_size: int = VOICE_COMMAND_QUEUE_SIZE, max_wait: float = VOICE_COMMAND_MAX_WAIT):
+        self.name = name
+        self.concurrency = max(concurrency, 1)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self._cond = threading.Condition()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "deadline": 0, "timeout": 0}
+        self.service_seconds = 0.0
+
+    def _expected_wait(self, position: int) -> float:
+        """Seconds until the waiter at a queue position (0 = next) gets a slot (caller holds the lock)"""
+        return (position // self.concurrency + 1) * self.service_seconds
+
+    def _reject(self, reason: str, position: int) -> Overloaded:
+        """Count a shed request (caller holds the lock)"""
+        self.shed[reason] += 1
+        ADMISSION_SHED.inc(endpoint=self.name, reason=reason)
+        retry_after = max(1, math.ceil(self._expected_wait(position)))
+        return Overloaded(f"{self.name} is overloaded ({reason})", retry_after)
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Hold a slot for the block, waiting in the queue if needed, or raise Overloaded"""
+        started = time.monotonic()
+        with self._cond:
+            if self.active >= self.concurrency:
+                position = self.waiting
+                if position >= self.queue_size:
+                    raise self._reject("queue_full", position)
+                if self._expected_wait(position) > self.max_wait:
+                    raise self._reject("deadline", position)
+                deadline = started + self.max_wait
+                self.waiting += 1
+                try:
+                    while self.active >= self.concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise self._reject("timeout", self.waiting - 1)
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+        admitted = time.monotonic()
+        ADMISSION_ADMITTED.inc(endpoint=self.name)
+        ADMISSION_WAIT_SECONDS.observe(admitted - started, endpoint=self.name)
+        try:
+            yield
+        finally:
+            held = time.monotonic() - admitted
+            with self._cond:
+                self.active -= 1
+                if self.service_seconds:
+                    self.service_seconds += SERVICE_TIME_SMOOTHING * (held - self.service_seconds)
+                else:
+                    self.service_seconds = held
+                self._cond.notify()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return slot usage, queue depth and shed counters"""
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "active": self.active,
+                "waiting": self.waiting,
+                "queue_capacity": self.queue_size,
+                "max_wait_seconds": self.max_wait,
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "avg_service_seconds": self.service_seconds,
+            }
@@ -0,0 +1,153 @@
+"""Shared text analyzer used to index and to query every FAQ engine.
+
+All engines (BM25, the keyword matcher, TF-IDF and the sharded variants)
+turn text into terms the same way, at build time and at query time:
+
+1. lowercase, then one translate pass with a precompiled table that
+   deletes apostrophes ("don't" -> "dont") and turns other punctuation into
+   spaces, so "claim?" and "claim" are the same word;
+2. split on whitespace;
+3. per word: drop stop words, stem with a light suffix stripper
+   ("policies" -> "policy", "claims" -> "claim", "losses" -> "loss") and
+   drop terms shorter than two characters.
+
+Step 3 is memoized per word (``normalize_word``). ``TermLookup`` adds an LRU
+cache from raw query words straight to an engine's vocabulary entry,
+including typo correction, so a warm query costs one translate, one split
+and a dict hit per word. ``FAQ_ANALYZER_CACHE_SIZE`` bounds both caches.
+Stdlib only (the ultra-simple chatbot must not pull in extra packages).
+
+Changing anything here changes the indexed terms: bump ``ANALYZER_VERSION``
+so prebuilt index artifacts are rebuilt.
+"""
+import os
+from functools import lru_cache
+from typing import Any, List, Mapping, Optional, Tuple
+
+ANALYZER_VERSION = 1
+ANALYZER_CACHE_SIZE = int(os.environ.get("FAQ_ANALYZER_CACHE_SIZE", "50000"))
+MIN_TERM_LENGTH = 2
+
+# Function words only; domain words ("fire", "amount", "bill") must stay searchable
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing dont down during each few for from further had has have having he her here
+hers herself him himself his how i if im in into is it its itself ive just me more most my myself no nor not now
+of off on once only or other our ours ourselves out over own same she should so some such than that thats the
+their theirs them themselves then there these they this those through to too under until up very was we were
+what whats when where which while who whom why will with would you your yours yourself yourselves
+""".split())
+
+_APOSTROPHES = "'‘’ʼ"
+_SEPARATORS = "!\"#$%&()*+,-./:;<=>?@[\\]^_`{|}~“”–—… "
+TRANSLATE_TABLE = str.maketrans({**dict.fromkeys(_APOSTROPHES), **dict.fromkeys(_SEPARATORS, " ")})
+_ASCII_SEPARATORS = bytes(c for c in _SEPARATORS.encode("utf-8") if c < 128)
+ASCII_TABLE = bytes.maketrans(_ASCII_SEPARATORS, b" " * len(_ASCII_SEPARATORS))
+
+
+def split_words(text: str) -> List[str]:
+    """Lowercase and split text into raw words, treating punctuation as a separator"""
+    text = text.lower()
+    if text.isascii():
+        # bytes.translate is a plain table lookup, about 3x faster than str.translate
+        return text.encode("ascii").translate(ASCII_TABLE, b"'").decode("ascii").split()
+    return text.translate(TRANSLATE_TABLE).split()
+
+
+def stem(word: str) -> str:
+    """Light plural stemmer (Porter step 1a with "ies" -> "y"); leaves "ss", "us" and "is" endings"""
+    if len(word) <= 3 or not word.endswith("s"):
+        return word
+    if word.endswith("sses"):
+        return word[:-2]
+    if word.endswith("ies"):
+        return word[:-3] + "y" if len(word) > 4 else word
+    if word.endswith(("ss", "us", "is")):
+        return word
+    return word[:-1]
+
+
+@lru_cache(maxsize=ANALYZER_CACHE_SIZE)
+def normalize_word(word: str) -> Optional[str]:
+    """Map a raw word to its indexed term, or None for stop words and fragments"""
+    if word in STOP_WORDS:
+        return None
+    if not word.isalnum():  # Symbols the translate table does not cover
+        word = "".join(c for c in word if c.isalnum())
+    term = stem(word)
+    return term if len(term) >= MIN_TERM_LENGTH else None
+
+
+def analyze(text: str) -> List[str]:
+    """Split text into indexed terms (duplicates kept, in order)"""
+    terms = []
+    for word in split_words(text):
+        term = normalize_word(word)
+        if term is not None:
+            terms.append(term)
+    return terms
+
+
+class TermLookup:
+    """LRU cache from raw query words to an engine's vocabulary entries.
+
+    ``vocabulary`` maps terms to whatever the engine looks up per term (a term
+    id, a postings list). Words missing from it are corrected with ``speller``
+    when one is given.
+    """
+
+    def __init__(self, vocabulary: Mapping[str, Any], speller=None, cache_size: int = ANALYZER_CACHE_SIZE):
+        self.vocabulary = vocabulary
+        self.speller = speller
+        self.lookup = lru_cache(maxsize=cache_size)(self._lookup)
+
+    def _lookup(self, word: str) -> Optional[Tuple[str, Any]]:
+        """(term, vocabulary entry) for a raw word; the entry is None for unknown terms"""
+        term = normalize_word(word)
+        if term is None:
+            return None
+        entry = self.vocabulary.get(term)
+        if entry is None and self.speller is not None:
+            corrected = self.speller.lookup(term)
+            if corrected is not None:
+                return corrected, self.vocabulary[corrected]
+        return term, entry
+
+    def terms(self, text: str) -> List[Tuple[str, Any]]:
+        """(term, entry) pairs for every indexed word of text, unknown terms included"""
+        lookup = self.lookup
+        return [found for found in map(lookup, split_words(text)) if found is not None]
+
+    def entries(self, text: str) -> List[Any]:
+        """Vocabulary entries of the known (or corrected) terms of text, duplicates kept"""
+        lookup = self.lookup
+        return [found[1] for found in map(lookup, split_words(text)) if found is not None and found[1] is not None]
+
+    def stats(self):
+        """Return cache counters"""
+        info = self.lookup.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
+
+
+def tfidf_vectors(lookup: TermLookup, queries: List[str], idf):
+    """Vectorize queries like a fitted TfidfVectorizer (raw tf * idf, unit rows) through the lookup cache"""
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    indptr, indices, tfs = [0], [], []
+    for query in queries:
+        counts = {}
+        for term_id in lookup.entries(query):
+            counts[term_id] = counts.get(term_id, 0) + 1
+        indices += counts
+        tfs += counts.values()
+        indptr.append(len(indices))
+
+    indices = np.asarray(indices, dtype=np.int32)
+    data = np.asarray(tfs, dtype=np.float64) * np.asarray(idf)[indices]
+    lengths = np.diff(indptr)
+    # A trailing zero keeps every row start a valid reduceat index; empty rows get norm 1
+    squares = np.add.reduceat(np.append(data * data, 0.0), indptr[:-1])
+    norms = np.sqrt(np.where(lengths > 0, squares, 1.0))
+    data /= np.repeat(norms, lengths)
+    return csr_matrix((data, indices, np.asarray(indptr, dtype=np.int32)), shape=(len(queries), len(idf)))
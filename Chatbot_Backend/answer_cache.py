@@ -0,0 +1,156 @@
+"""Bounded LRU/TTL cache for chatbot answers.
+
+Chat traffic is dominated by a handful of repeated questions, so each chatbot
+keeps an ``answer_cache`` in front of its matching methods
+(``find_best_match_id``/``find_best_match_ids``). Entries are keyed on the
+normalized query and dropped when the dataset file changes on disk.
+
+Both methods read and fill the same entries, so every engine must return the
+same result for a query alone and inside any batch;
+``benchmarks/check_batch_parity.py`` checks this over the whole dataset.
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+CACHE_MAX_SIZE = int(os.environ.get("CHAT_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("CHAT_CACHE_TTL", "3600"))
+
+
+def normalize_query(user_query: str) -> str:
+    """Normalize a query for cache lookups (case and whitespace insensitive)"""
+    return " ".join(user_query.lower().split())
+
+
+def dataset_version(csv_path: str) -> Tuple[int, int]:
+    """Return a cheap fingerprint (mtime, size) of the dataset file"""
+    stat = os.stat(csv_path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class AnswerCache:
+    """Thread-safe LRU cache with per-entry TTL and hit/miss/eviction counters.
+
+    When ``version`` is given it is polled at most every ``check_interval``
+    seconds and the cache is cleared whenever the returned value changes.
+    """
+
+    def __init__(self, max_size: int = CACHE_MAX_SIZE, ttl: float = CACHE_TTL_SECONDS,
+                 version: Optional[Callable[[], Hashable]] = None, check_interval: float = 1.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._version_fn = version
+        self._check_interval = check_interval
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = self._read_version()
+        self._next_check = time.monotonic() + check_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _read_version(self) -> Optional[Hashable]:
+        if self._version_fn is None:
+            return None
+        try:
+            return self._version_fn()
+        except OSError:
+            return None
+
+    def _check_version(self, now: float):
+        """Clear the cache if the dataset version changed (caller holds the lock)"""
+        if self._version_fn is None or now < self._next_check:
+            return
+        self._next_check = now + self._check_interval
+        version = self._read_version()
+        if version != self._version:
+            self._version = version
+            self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self._entries.clear()
+        self.invalidations += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries when full"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters for the stats endpoint"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def cached_match(method):
+    """Serve a chatbot's single-query match method from its ``answer_cache``"""
+    @functools.wraps(method)
+    def wrapper(self, user_query: str, threshold: float = 0.2):
+        key = (normalize_query(user_query), threshold)
+        result = self.answer_cache.get(key)
+        if result is None:
+            result = method(self, user_query, threshold)
+            self.answer_cache.put(key, result)
+        return result
+    return wrapper
+
+
+def cached_matches(method):
+    """Serve a chatbot's batch match method from its ``answer_cache``, scoring only the misses"""
+    @functools.wraps(method)
+    def wrapper(self, user_queries, threshold: float = 0.2):
+        keys = [(normalize_query(query), threshold) for query in user_queries]
+        results = [self.answer_cache.get(key) for key in keys]
+        missing = [slot for slot, result in enumerate(results) if result is None]
+        if missing:
+            fresh = method(self, [user_queries[slot] for slot in missing], threshold)
+            for slot, result in zip(missing, fresh):
+                results[slot] = result
+                self.answer_cache.put(keys[slot], result)
+        return results
+    return wrapper
@@ -1,11 +1,21 @@
 import csv
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, Response, request, jsonify
 import logging
-from typing import Tuple
-import json
+from typing import List, Optional, Tuple
 import os
 
+from answer_cache import AnswerCache, cached_match, cached_matches, dataset_version
+from cors import CorsPolicy, default_allowed_origins
+from dedup import consolidate
+from hot_reload import ChatbotReloader, is_admin_authorized
+from response_table import NO_MATCH_ANSWER, ResponseTable, render_batch
+from metrics import CHAT_STAGE_SECONDS, CONTENT_TYPE, REGISTRY, log_sampled, record_chat_match
+from bm25_index import BM25Index
+from lsh_index import maybe_build_lsh
+from spell_correct import build_speller
+from sharded_index import FAQ_SHARDS, ShardedFAQChatBot
+from index_artifact import DEFAULT_INDEX_PATH, load_artifact
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,64 +25,49 @@ app = Flask(__name__)
 # Get the frontend URL from environment variable
 prod_frontend_url = os.environ.get("FRONTEND_URL")
 
-# Define allowed origins - include common Vercel domains
-allowed_origins = [
-    "http://localhost:3000",
-    "https://localhost:3000"
-]
-
-# Add production frontend URL if provided
-if prod_frontend_url:
-    allowed_origins.append(prod_frontend_url)
-
-# Add common Vercel domains
-vercel_domains = [
-    "https://*.vercel.app",
-    "https://*.vercel.app/*"
-]
-allowed_origins.extend(vercel_domains)
-
-# Configure CORS with more permissive settings for development
-CORS(app, 
-     resources={r"/*": {"origins": allowed_origins}},
-     supports_credentials=True,
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"])
-
-# Add CORS headers to all responses
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
-    if origin:
-        # Allow any Vercel domain
-        if origin.endswith('.vercel.app') or origin in allowed_origins:
-            response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+# Local development, the production frontend and Vercel deployments; compiled once
+# and applied to every response (preflights are answered before routing)
+allowed_origins = default_allowed_origins(prod_frontend_url)
+cors = CorsPolicy(allowed_origins)
+cors.install(app)
 
 # Add root endpoint to handle 404 errors
-@app.route("/", methods=["GET", "OPTIONS"])
+@app.route("/", methods=["GET"])
 def root():
     """Root endpoint"""
-    if request.method == "OPTIONS":
-        return jsonify({"status": "preflight"}), 200
     return jsonify({
         "message": "InsureEase Chatbot API",
         "status": "running",
         "endpoints": {
             "health": "/api/health",
-            "chat": "/api/chat"
+            "chat": "/api/chat",
+            "chat_batch": "/api/chat/batch",
+            "cache_stats": "/api/cache/stats",
+            "index": "/api/index",
+            "metrics": "/metrics"
         }
     }), 200
 
 class UltraSimpleFAQChatBot:
-    """Ultra-simple FAQ Chatbot using basic keyword matching"""
+    """Ultra-simple FAQ Chatbot using BM25 keyword matching"""
     
-    def __init__(self, csv_path: str):
-        self.faq_data = self._load_data(csv_path)
-        self._create_keyword_index()
+    def __init__(self, csv_path: str, index_path: str = DEFAULT_INDEX_PATH):
+        self.answer_cache = AnswerCache(version=lambda: dataset_version(csv_path))
+        artifact = load_artifact(index_path, csv_path, engine="bm25")
+        if artifact is not None:
+            # Postings and answers stay in the read-only mapping shared by all workers
+            self.keyword_index = artifact.bm25_index()
+            self.answers = artifact.answers()
+            self.responses = artifact.response_table()
+            self.consolidation = artifact.meta.get("consolidation")
+        else:
+            self.faq_data = self._load_data(csv_path)
+            self.answers = [entry['answer'] for entry in self.faq_data]
+            self.responses = ResponseTable.from_answers(self.answers)
+            self._create_keyword_index()
+        index = self.keyword_index
+        index.lsh = maybe_build_lsh(index.postings_offsets, index.postings_docs, index.num_docs)
+        index.speller = build_speller(index.term_counts())
         
     def _load_data(self, csv_path: str) -> list:
         """Load FAQ data using standard CSV module"""
@@ -91,75 +86,97 @@ class UltraSimpleFAQChatBot:
                 raise ValueError("No valid FAQ data found")
                 
             logger.info(f"Loaded {len(faq_data)} FAQ entries")
-            return faq_data
+            
+            # One entry per group of duplicate questions, so ids are entry positions from here on
+            entries = consolidate([entry['question'] for entry in faq_data], [entry['answer'] for entry in faq_data])
+            self.consolidation = entries.summary
+            return [{'question': question, 'answer': answer}
+                    for question, answer in zip(entries.questions, entries.answers)]
             
         except Exception as e:
             logger.error(f"Error loading data: {str(e)}")
             raise
 
     def _create_keyword_index(self):
-        """Create a simple keyword index for matching"""
-        self.keyword_index = {}
-        
-        for idx, entry in enumerate(self.faq_data):
-            question = entry['question']
-            words = question.split()
-            
-            for word in words:
-                # Clean word and only consider meaningful words
-                clean_word = ''.join(c for c in word if c.isalnum()).lower()
-                if len(clean_word) > 3:  # Only consider words longer than 3 characters
-                    if clean_word not in self.keyword_index:
-                        self.keyword_index[clean_word] = []
-                    self.keyword_index[clean_word].append(idx)
-        
-    def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
-        """Find the best matching FAQ answer using simple keyword matching"""
-        user_query = user_query.lower().strip()
-        user_words = user_query.split()
+        """Build the BM25 inverted index over the FAQ questions"""
+        self.keyword_index = BM25Index(entry['question'] for entry in self.faq_data)
+        logger.info(f"Indexed {len(self.keyword_index.vocabulary)} terms "
+                    f"({len(self.keyword_index.postings_docs)} postings)")
         
-        # Score each FAQ entry based on keyword matches
-        scores = {}
+    @cached_match
+    def find_best_match_id(self, user_query: str, threshold: float = 0.2) -> Tuple[Optional[int], float]:
+        """Find the best matching FAQ id using BM25 keyword scoring (None if nothing matches)"""
+        best_idx, confidence = self.keyword_index.best_match(user_query.lower().strip())
         
-        for word in user_words:
-            # Clean word
-            clean_word = ''.join(c for c in word if c.isalnum()).lower()
-            if len(clean_word) > 3 and clean_word in self.keyword_index:
-                for idx in self.keyword_index[clean_word]:
-                    if idx not in scores:
-                        scores[idx] = 0
-                    scores[idx] += 1
+        if best_idx is not None and confidence > threshold:
+            return best_idx, float(confidence)
         
-        if not scores:
-            return "I'm sorry, I don't have an answer for that. Please contact our support team.", 0.0
-        
-        # Find the entry with the highest score
-        best_idx = max(scores, key=scores.get)
-        best_score = scores[best_idx]
-        
-        # Calculate confidence (normalize by number of words in user query)
-        confidence = min(best_score / len(user_words), 1.0)
-        
-        if confidence > threshold:
-            return self.faq_data[best_idx]["answer"], float(confidence)
-        
-        return "I'm sorry, I don't have an answer for that. Please contact our support team.", 0.0
+        return None, 0.0
+
+    @cached_matches
+    def find_best_match_ids(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[Optional[int], float]]:
+        """Find the best matching FAQ id for each query, exactly as find_best_match_id would"""
+        results = []
+        for best_idx, confidence in self.keyword_index.best_matches([q.lower().strip() for q in user_queries]):
+            if best_idx is not None and confidence > threshold:
+                results.append((best_idx, float(confidence)))
+            else:
+                results.append((None, 0.0))
+        return results
+
+    def find_top_k_ids(self, user_query: str, k: int = 5, threshold: float = 0.2) -> List[Tuple[int, float]]:
+        """Return up to k FAQ ids above the threshold with their confidence, best first (MaxScore pruned)"""
+        return [(best_idx, float(confidence))
+                for best_idx, confidence in self.keyword_index.search(user_query.lower().strip(), k)
+                if confidence > threshold]
+
+    def find_top_k(self, user_query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to k matching FAQ answers with their confidence, best first"""
+        return [(self.answers[idx], confidence) for idx, confidence in self.find_top_k_ids(user_query, k, threshold=0.0)]
+
+    def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
+        """Find the best matching FAQ answer using BM25 keyword scoring"""
+        best_idx, confidence = self.find_best_match_id(user_query, threshold)
+        if best_idx is None:
+            return NO_MATCH_ANSWER, 0.0
+        return self.answers[best_idx], confidence
+
+    def find_best_matches(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[str, float]]:
+        """Find the best matching FAQ answer for each query"""
+        return [(NO_MATCH_ANSWER, 0.0) if best_idx is None else (self.answers[best_idx], confidence)
+                for best_idx, confidence in self.find_best_match_ids(user_queries, threshold)]
+
+# Initialize chatbot (rebuilt in the background when the dataset changes)
+DATASET_PATH = "insurance_dataset.csv"
+
+def create_chatbot():
+    """Build the chatbot, split across FAQ_SHARDS worker processes when more than one is configured"""
+    if FAQ_SHARDS > 1:
+        return ShardedFAQChatBot(DATASET_PATH, engine="bm25")
+    return UltraSimpleFAQChatBot(DATASET_PATH)
+
+# Spawned shard workers re-import this module as __mp_main__; only the server builds a chatbot
+if __name__ != "__mp_main__":
+    try:
+        reloader = ChatbotReloader(create_chatbot, DATASET_PATH)
+        logger.info("Ultra-simple FAQ Chatbot initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize chatbot: {str(e)}")
+        raise
+
+# Maximum number of queries accepted by /api/chat/batch
+MAX_BATCH_QUERIES = int(os.environ.get("CHAT_BATCH_MAX_QUERIES", "100"))
+
+# Largest number of ranked matches a /api/chat request may ask for with "k"
+MAX_TOP_K = int(os.environ.get("CHAT_MAX_TOP_K", "20"))
 
-# Initialize chatbot
-try:
-    chatbot = UltraSimpleFAQChatBot("insurance_dataset.csv")
-    logger.info("Ultra-simple FAQ Chatbot initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize chatbot: {str(e)}")
-    raise
+def json_body(body: bytes) -> Response:
+    """Wrap a pre-serialized JSON body in a response"""
+    return Response(body, mimetype="application/json")
 
-@app.route("/api/chat", methods=["POST", "OPTIONS"])
+@app.route("/api/chat", methods=["POST"])
 def handle_chat():
     """Handle chat requests"""
-    if request.method == "OPTIONS":
-        response = jsonify({"status": "preflight"})
-        return response
-        
     try:
         data = request.get_json()
         if not data or 'query' not in data:
@@ -168,23 +185,28 @@ def handle_chat():
         user_query = data['query'].strip()
         if not user_query:
             return jsonify({"error": "Empty query"}), 400
+        k = data.get('k')
+        if k is not None and (type(k) is not int or not 1 <= k <= MAX_TOP_K):
+            return jsonify({"error": f"k must be an integer from 1 to {MAX_TOP_K}"}), 400
             
-        logger.info(f"Received query: {user_query}")
-        
-        response, confidence = chatbot.find_best_match(user_query)
+        chatbot = reloader.current
+        if k is not None:
+            # Up to k matches above the confidence threshold, best first, in the batch response format
+            matches = chatbot.find_top_k_ids(user_query, k)
+            faq_id, confidence = matches[0] if matches else (None, 0.0)
+            record_chat_match(faq_id, confidence)
+            log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence, k=k)
+            with CHAT_STAGE_SECONDS.time(stage="serialize"):
+                body = render_batch(chatbot.responses.render(faq_id, confidence) for faq_id, confidence in matches)
+            return json_body(body)
         
-        logger.info(f"Response: {response[:100]}... (confidence: {confidence})")
+        faq_id, confidence = chatbot.find_best_match_id(user_query)
+        record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence)
         
-        # Parse the response if it's JSON (for navigation)
-        try:
-            response_data = json.loads(response)
-            return jsonify(response_data)
-        except json.JSONDecodeError:
-            return jsonify({
-                "response": response,
-                "confidence": confidence,
-                "status": "success"
-            })
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = chatbot.responses.render(faq_id, confidence)
+        return json_body(body)
             
     except Exception as e:
         logger.error(f"Error handling request: {str(e)}")
@@ -193,6 +215,65 @@ def handle_chat():
             "status": "error"
         }), 500
 
+@app.route("/api/chat/batch", methods=["POST"])
+def handle_chat_batch():
+    """Handle a batch of chat queries, returning results in request order"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('queries'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+            
+        user_queries = data['queries']
+        if len(user_queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"Too many queries (max {MAX_BATCH_QUERIES})"}), 400
+        if not all(isinstance(query, str) and query.strip() for query in user_queries):
+            return jsonify({"error": "Empty query"}), 400
+            
+        chatbot = reloader.current
+        matches = chatbot.find_best_match_ids([query.strip() for query in user_queries])
+        for faq_id, confidence in matches:
+            record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat_batch", queries=len(user_queries),
+                    matched=sum(faq_id is not None for faq_id, _ in matches))
+        
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = render_batch(chatbot.responses.render(faq_id, confidence)
+                                for faq_id, confidence in matches)
+        return json_body(body)
+            
+    except Exception as e:
+        logger.error(f"Error handling batch request: {str(e)}")
+        return jsonify({
+            "response": "Sorry, I encountered an error processing your request.",
+            "status": "error"
+        }), 500
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    """Report answer cache hits, misses and evictions"""
+    return jsonify(reloader.current.answer_cache.stats()), 200
+
+@app.route("/api/index", methods=["GET"])
+def index_status():
+    """Report the active FAQ index version and build duration"""
+    return jsonify(reloader.status()), 200
+
+@app.route("/api/admin/reload", methods=["POST"])
+def reload_index():
+    """Rebuild the FAQ index in the background and swap it in when ready"""
+    if not is_admin_authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Unauthorized"}), 401
+    started = reloader.reload()
+    return jsonify({
+        "status": "reloading" if started else "reload already in progress",
+        "index": reloader.status()
+    }), 202
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms and match counters in Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
@@ -1,65 +1,69 @@
 import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from sklearn.preprocessing import normalize
+from flask import Flask, Response, request, jsonify
 import numpy as np
 import logging
-from typing import Tuple, Dict, Any
-import json
+from typing import Tuple, Dict, Any, List, Optional
 import os
 
+from analyzer import TermLookup, tfidf_vectors
+from answer_cache import AnswerCache, cached_match, cached_matches, dataset_version
+from cors import CorsPolicy, default_allowed_origins
+from dedup import consolidate
+from hot_reload import ChatbotReloader, is_admin_authorized
+from response_table import NO_MATCH_ANSWER, ResponseTable, render_answer, render_batch
+from metrics import CHAT_STAGE_SECONDS, CONTENT_TYPE, REGISTRY, log_sampled, record_chat_match
+from index_artifact import DEFAULT_INDEX_PATH, TFIDF_PARAMS, load_artifact
+from lsh_index import maybe_build_lsh
+from spell_correct import build_speller
+from sharded_index import FAQ_SHARDS, ShardedFAQChatBot
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Answered with status 200 when matching itself fails, like find_best_match does
+ERROR_ANSWER = "I encountered an error processing your request."
+ERROR_BODY = render_answer(ERROR_ANSWER, 0.0)
+
 app = Flask(__name__)
 
 # Get the frontend URL from environment variable
 prod_frontend_url = os.environ.get("FRONTEND_URL")
 
-# Define allowed origins - include common Vercel domains
-allowed_origins = [
-    "http://localhost:3000",
-    "https://localhost:3000"
-]
-
-# Add production frontend URL if provided
-if prod_frontend_url:
-    allowed_origins.append(prod_frontend_url)
-
-# Add common Vercel domains
-vercel_domains = [
-    "https://*.vercel.app",
-    "https://*.vercel.app/*"
-]
-allowed_origins.extend(vercel_domains)
-
-# Configure CORS with more permissive settings for development
-CORS(app, 
-     resources={r"/api/*": {"origins": allowed_origins}},
-     supports_credentials=True,
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"])
-
-# Add CORS headers to all responses
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
-    if origin in allowed_origins or any(origin.endswith('.vercel.app') for origin in allowed_origins if '*' in origin):
-        response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+# Local development, the production frontend and Vercel deployments; compiled once
+# and applied to every response (preflights are answered before routing)
+allowed_origins = default_allowed_origins(prod_frontend_url)
+cors = CorsPolicy(allowed_origins)
+cors.install(app)
 
 class FAQChatBot:
     """FAQ Chatbot using TF-IDF and cosine similarity"""
     
-    def __init__(self, csv_path: str):
-        self.faq_df = self._load_data(csv_path)
-        self.vectorizer = TfidfVectorizer(stop_words='english')
-        self._train_model()
+    def __init__(self, csv_path: str, index_path: str = DEFAULT_INDEX_PATH):
+        self.answer_cache = AnswerCache(version=lambda: dataset_version(csv_path))
+        artifact = load_artifact(index_path, csv_path, engine="tfidf")
+        if artifact is not None:
+            # Matrix and answers stay in the read-only mapping shared by all workers
+            self.vectorizer, self.term_doc_matrix = artifact.tfidf_model()
+            self.tfidf_matrix = self.term_doc_matrix.T
+            self.answers = artifact.answers()
+            self.responses = artifact.response_table()
+            self.consolidation = artifact.meta.get("consolidation")
+        else:
+            self.faq_df = self._load_data(csv_path)
+            self.vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+            self._train_model()
+            self.responses = ResponseTable.from_answers(self.answers)
+        self.speller = build_speller(dict(zip(self.vectorizer.get_feature_names_out(),
+                                              np.diff(self.term_doc_matrix.indptr).tolist())))
+        self.terms = TermLookup(self.vectorizer.vocabulary_, self.speller)
+        self.lsh = maybe_build_lsh(self.term_doc_matrix.indptr, self.term_doc_matrix.indices,
+                                   self.term_doc_matrix.shape[1])
+        if self.lsh is not None:
+            # Doc-major rows so a candidate subset can be scored with one small product
+            self.doc_matrix = self.tfidf_matrix.tocsr()
         
     def _load_data(self, csv_path: str) -> pd.DataFrame:
         """Load and preprocess FAQ data"""
@@ -70,7 +74,11 @@ class FAQChatBot:
             
             df = df.dropna(subset=['Question', 'Answer'])
             df['Question'] = df['Question'].str.strip().str.lower()
-            return df
+            
+            # One entry per group of duplicate questions, so ids are entry positions from here on
+            entries = consolidate(df['Question'].tolist(), df['Answer'].tolist())
+            self.consolidation = entries.summary
+            return pd.DataFrame({'Question': entries.questions, 'Answer': entries.answers})
             
         except Exception as e:
             logger.error(f"Error loading data: {str(e)}")
@@ -79,43 +87,144 @@ class FAQChatBot:
     def _train_model(self):
         """Train the TF-IDF model"""
         questions = self.faq_df["Question"].tolist()
-        self.tfidf_matrix = self.vectorizer.fit_transform(questions)
+        self.answers = self.faq_df["Answer"].tolist()
+        # Rows are unit length, so cosine similarity reduces to a sparse dot product
+        self.tfidf_matrix = normalize(self.vectorizer.fit_transform(questions), norm='l2', copy=False)
+        # Term-major copy (row t holds the postings of term t) for term-at-a-time scoring
+        self.term_doc_matrix = self.tfidf_matrix.T.tocsr()
+
+    @staticmethod
+    def _select_top_k(doc_ids: np.ndarray, values: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the top-k (doc indices, scores) from one row of sparse scores, best first"""
+        if len(values) > k:
+            # Keep everything tied with the k-th best score so ties resolve to the lowest index
+            cutoff = values[np.argpartition(values, -k)[-k:]].min()
+            keep = values >= cutoff
+            doc_ids, values = doc_ids[keep], values[keep]
+        
+        order = np.lexsort((doc_ids, -values))[:k]
+        return doc_ids[order], values[order]
+
+    def _top_k_indices(self, query_matrix, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Return the top-k (doc indices, scores) for each row of a vectorized query batch"""
+        if self.lsh is not None:
+            return [self._top_k_row(query_matrix[row], k) for row in range(query_matrix.shape[0])]
+        # Only documents sharing a term with a query end up in its sparse row
+        scores = (query_matrix @ self.term_doc_matrix).tocsr()
+        results = []
+        for row in range(scores.shape[0]):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            results.append(self._select_top_k(scores.indices[start:end], scores.data[start:end], k))
+        return results
+
+    def _top_k_row(self, query_row, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k for one query, scoring only its LSH candidates when there are any"""
+        candidates = self.lsh.candidates(query_row.indices)
+        if candidates is None:
+            scores = (query_row @ self.term_doc_matrix).tocsr()
+            return self._select_top_k(scores.indices, scores.data, k)
+        values = (self.doc_matrix[candidates] @ query_row.T).toarray().ravel()
+        keep = values > 0
+        return self._select_top_k(candidates[keep], values[keep], k)
+
+    def _vectorize(self, user_queries: List[str]):
+        """TF-IDF rows for queries, with misspelled words corrected to vocabulary terms"""
+        return tfidf_vectors(self.terms, user_queries, self.vectorizer.idf_)
+
+    def find_top_k_ids(self, user_query: str, k: int = 5, threshold: float = 0.2) -> List[Tuple[int, float]]:
+        """Return up to k FAQ ids scoring above the threshold with their similarity, best first"""
+        with CHAT_STAGE_SECONDS.time(stage="tokenize"):
+            query_vec = self._vectorize([user_query])
+        with CHAT_STAGE_SECONDS.time(stage="score"):
+            doc_ids, scores = self._top_k_indices(query_vec, k)[0]
+        return [(int(idx), float(score)) for idx, score in zip(doc_ids, scores) if score > threshold]
+
+    def find_top_k(self, user_query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to k matching FAQ answers with their similarity scores, best first"""
+        return [(self.answers[idx], score) for idx, score in self.find_top_k_ids(user_query, k, threshold=0.0)]
+
+    @cached_match
+    def find_best_match_id(self, user_query: str, threshold: float = 0.2) -> Tuple[Optional[int], float]:
+        """Find the best matching FAQ id with confidence score (None if nothing matches)"""
+        with CHAT_STAGE_SECONDS.time(stage="tokenize"):
+            query_vec = self._vectorize([user_query])
+        with CHAT_STAGE_SECONDS.time(stage="score"):
+            doc_ids, scores = self._top_k_indices(query_vec, 1)[0]
+        
+        if len(scores) and scores[0] > threshold:
+            return int(doc_ids[0]), float(scores[0])
+        return None, 0.0
+
+    @cached_matches
+    def find_best_match_ids(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[Optional[int], float]]:
+        """Find the best matching FAQ id for each query in one vectorized pass"""
+        with CHAT_STAGE_SECONDS.time(stage="tokenize"):
+            query_matrix = self._vectorize(user_queries)
+        with CHAT_STAGE_SECONDS.time(stage="score"):
+            top_matches = self._top_k_indices(query_matrix, 1)
+        results = []
+        for doc_ids, scores in top_matches:
+            if len(scores) and scores[0] > threshold:
+                results.append((int(doc_ids[0]), float(scores[0])))
+            else:
+                results.append((None, 0.0))
+        return results
+
+    def find_best_matches(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[str, float]]:
+        """Find the best matching FAQ answer for each query"""
+        try:
+            return [(NO_MATCH_ANSWER, 0.0) if best_idx is None else (self.answers[best_idx], confidence)
+                    for best_idx, confidence in self.find_best_match_ids(user_queries, threshold)]
+            
+        except Exception as e:
+            logger.error(f"Error finding batch matches: {str(e)}")
+            return [(ERROR_ANSWER, 0.0)] * len(user_queries)
         
     def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
         """Find the best matching FAQ answer with confidence score"""
-        user_query = user_query.lower().strip()
-        
         # If not a navigation command, proceed with regular FAQ matching
         try:
-            query_vec = self.vectorizer.transform([user_query])
-            similarity_scores = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-            
-            best_match_idx = np.argmax(similarity_scores)
-            confidence = similarity_scores[best_match_idx]
+            best_idx, confidence = self.find_best_match_id(user_query, threshold)
             
-            if confidence > threshold:
-                return self.faq_df.iloc[best_match_idx]["Answer"], float(confidence)
-            return "I'm sorry, I don't have an answer for that. Please contact our support team.", 0.0
+            if best_idx is not None:
+                return self.answers[best_idx], confidence
+            return NO_MATCH_ANSWER, 0.0
             
         except Exception as e:
             logger.error(f"Error finding match: {str(e)}")
-            return "I encountered an error processing your request.", 0.0
+            return ERROR_ANSWER, 0.0
+
+# Initialize chatbot (rebuilt in the background when the dataset changes)
+DATASET_PATH = "insurance_dataset.csv"
+
+def create_chatbot():
+    """Build the chatbot, split across FAQ_SHARDS worker processes when more than one is configured"""
+    if FAQ_SHARDS > 1:
+        return ShardedFAQChatBot(DATASET_PATH, engine="tfidf")
+    return FAQChatBot(DATASET_PATH)
+
+# Spawned shard workers re-import this module as __mp_main__; only the server builds a chatbot
+if __name__ != "__mp_main__":
+    try:
+        reloader = ChatbotReloader(create_chatbot, DATASET_PATH)
+        logger.info("FAQ Chatbot initialized successfully")
+    except Exception as e:
+        logger.error(f"Failed to initialize chatbot: {str(e)}")
+        raise
+
+# Maximum number of queries accepted by /api/chat/batch
+MAX_BATCH_QUERIES = int(os.environ.get("CHAT_BATCH_MAX_QUERIES", "100"))
 
-# Initialize chatbot
-try:
-    chatbot = FAQChatBot("insurance_dataset.csv")
-    logger.info("FAQ Chatbot initialized successfully")
-except Exception as e:
-    logger.error(f"Failed to initialize chatbot: {str(e)}")
-    raise
+# Largest number of ranked matches a /api/chat request may ask for with "k"
+MAX_TOP_K = int(os.environ.get("CHAT_MAX_TOP_K", "20"))
 
-@app.route("/api/chat", methods=["POST", "OPTIONS"])
+def json_body(body: bytes) -> Response:
+    """Wrap a pre-serialized JSON body in a response"""
+    return Response(body, mimetype="application/json")
+
+@app.route("/api/chat", methods=["POST"])
 def handle_chat():
     """Handle chat requests"""
-    if request.method == "OPTIONS":
-        response = jsonify({"status": "preflight"})
-        return response
-        
     try:
         data = request.get_json()
         if not data or 'query' not in data:
@@ -124,19 +233,36 @@ def handle_chat():
         user_query = data['query'].strip()
         if not user_query:
             return jsonify({"error": "Empty query"}), 400
+        k = data.get('k')
+        if k is not None and (type(k) is not int or not 1 <= k <= MAX_TOP_K):
+            return jsonify({"error": f"k must be an integer from 1 to {MAX_TOP_K}"}), 400
             
-        response, confidence = chatbot.find_best_match(user_query)
+        chatbot = reloader.current
+        if k is not None:
+            # Up to k matches above the confidence threshold, best first, in the batch response format
+            try:
+                matches = chatbot.find_top_k_ids(user_query, k)
+            except Exception as e:
+                logger.error(f"Error finding match: {str(e)}")
+                return json_body(render_batch([ERROR_BODY]))
+            faq_id, confidence = matches[0] if matches else (None, 0.0)
+            record_chat_match(faq_id, confidence)
+            log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence, k=k)
+            with CHAT_STAGE_SECONDS.time(stage="serialize"):
+                body = render_batch(chatbot.responses.render(faq_id, confidence) for faq_id, confidence in matches)
+            return json_body(body)
         
-        # Parse the response if it's JSON (for navigation)
         try:
-            response_data = json.loads(response)
-            return jsonify(response_data)
-        except json.JSONDecodeError:
-            return jsonify({
-                "response": response,
-                "confidence": confidence,
-                "status": "success"
-            })
+            faq_id, confidence = chatbot.find_best_match_id(user_query)
+        except Exception as e:
+            logger.error(f"Error finding match: {str(e)}")
+            return json_body(ERROR_BODY)
+        record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence)
+        
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = chatbot.responses.render(faq_id, confidence)
+        return json_body(body)
             
     except Exception as e:
         logger.error(f"Error handling request: {str(e)}")
@@ -145,6 +271,69 @@ def handle_chat():
             "status": "error"
         }), 500
 
+@app.route("/api/chat/batch", methods=["POST"])
+def handle_chat_batch():
+    """Handle a batch of chat queries, returning results in request order"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('queries'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+            
+        user_queries = data['queries']
+        if len(user_queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"Too many queries (max {MAX_BATCH_QUERIES})"}), 400
+        if not all(isinstance(query, str) and query.strip() for query in user_queries):
+            return jsonify({"error": "Empty query"}), 400
+            
+        chatbot = reloader.current
+        try:
+            matches = chatbot.find_best_match_ids([query.strip() for query in user_queries])
+        except Exception as e:
+            logger.error(f"Error finding batch matches: {str(e)}")
+            return json_body(render_batch([ERROR_BODY] * len(user_queries)))
+        for faq_id, confidence in matches:
+            record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat_batch", queries=len(user_queries),
+                    matched=sum(faq_id is not None for faq_id, _ in matches))
+        
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = render_batch(chatbot.responses.render(faq_id, confidence)
+                                for faq_id, confidence in matches)
+        return json_body(body)
+            
+    except Exception as e:
+        logger.error(f"Error handling batch request: {str(e)}")
+        return jsonify({
+            "response": "Sorry, I encountered an error processing your request.",
+            "status": "error"
+        }), 500
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    """Report answer cache hits, misses and evictions"""
+    return jsonify(reloader.current.answer_cache.stats()), 200
+
+@app.route("/api/index", methods=["GET"])
+def index_status():
+    """Report the active FAQ index version and build duration"""
+    return jsonify(reloader.status()), 200
+
+@app.route("/api/admin/reload", methods=["POST"])
+def reload_index():
+    """Rebuild the FAQ index in the background and swap it in when ready"""
+    if not is_admin_authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Unauthorized"}), 401
+    started = reloader.reload()
+    return jsonify({
+        "status": "reloading" if started else "reload already in progress",
+        "index": reloader.status()
+    }), 202
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms and match counters in Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
@@ -1,11 +1,21 @@
 import pandas as pd
-from flask import Flask, request, jsonify
-from flask_cors import CORS
+from flask import Flask, Response, request, jsonify
 import logging
-from typing import Tuple
-import json
+import heapq
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import List, Optional, Tuple
 import os
 
+from analyzer import TermLookup, analyze
+from answer_cache import AnswerCache, cached_match, cached_matches, dataset_version
+from cors import CorsPolicy, default_allowed_origins
+from dedup import consolidate
+from hot_reload import ChatbotReloader, is_admin_authorized
+from response_table import NO_MATCH_ANSWER, ResponseTable, render_batch
+from metrics import CHAT_STAGE_SECONDS, CONTENT_TYPE, REGISTRY, log_sampled, record_chat_match
+from spell_correct import build_speller
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -15,46 +25,20 @@ app = Flask(__name__)
 # Get the frontend URL from environment variable
 prod_frontend_url = os.environ.get("FRONTEND_URL")
 
-# Define allowed origins - include common Vercel domains
-allowed_origins = [
-    "http://localhost:3000",
-    "https://localhost:3000"
-]
-
-# Add production frontend URL if provided
-if prod_frontend_url:
-    allowed_origins.append(prod_frontend_url)
-
-# Add common Vercel domains
-vercel_domains = [
-    "https://*.vercel.app",
-    "https://*.vercel.app/*"
-]
-allowed_origins.extend(vercel_domains)
-
-# Configure CORS with more permissive settings for development
-CORS(app, 
-     resources={r"/api/*": {"origins": allowed_origins}},
-     supports_credentials=True,
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"])
-
-# Add CORS headers to all responses
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
-    if origin in allowed_origins or any(origin.endswith('.vercel.app') for origin in allowed_origins if '*' in origin):
-        response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+# Local development, the production frontend and Vercel deployments; compiled once
+# and applied to every response (preflights are answered before routing)
+allowed_origins = default_allowed_origins(prod_frontend_url)
+cors = CorsPolicy(allowed_origins)
+cors.install(app)
 
 class SimpleFAQChatBot:
     """Simple FAQ Chatbot using keyword matching"""
     
     def __init__(self, csv_path: str):
+        self.answer_cache = AnswerCache(version=lambda: dataset_version(csv_path))
         self.faq_df = self._load_data(csv_path)
+        self.answers = self.faq_df['Answer'].tolist()
+        self.responses = ResponseTable.from_answers(self.answers)
         self._create_keyword_index()
         
     def _load_data(self, csv_path: str) -> pd.DataFrame:
@@ -66,7 +50,11 @@ class SimpleFAQChatBot:
             
             df = df.dropna(subset=['Question', 'Answer'])
             df['Question'] = df['Question'].str.strip().str.lower()
-            return df
+            
+            # One entry per group of duplicate questions, so ids are entry positions from here on
+            entries = consolidate(df['Question'].tolist(), df['Answer'].tolist())
+            self.consolidation = entries.summary
+            return pd.DataFrame({'Question': entries.questions, 'Answer': entries.answers})
             
         except Exception as e:
             logger.error(f"Error loading data: {str(e)}")
@@ -76,61 +64,134 @@ class SimpleFAQChatBot:
         """Create a simple keyword index for matching"""
         self.keyword_index = {}
         
-        for idx, row in self.faq_df.iterrows():
-            question = row['Question'].lower()
-            words = question.split()
-            
-            for word in words:
-                if len(word) > 3:  # Only consider words longer than 3 characters
-                    if word not in self.keyword_index:
-                        self.keyword_index[word] = []
-                    self.keyword_index[word].append(idx)
-        
-    def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
-        """Find the best matching FAQ answer using keyword matching"""
-        user_query = user_query.lower().strip()
-        user_words = user_query.split()
+        # Index by entry position so ids line up with self.answers
+        for idx, question in enumerate(self.faq_df['Question']):
+            for word in analyze(question):
+                if word not in self.keyword_index:
+                    self.keyword_index[word] = []
+                self.keyword_index[word].append(idx)
+        # Most times one question repeats each keyword: a query occurrence adds at most that much
+        self.max_repeats = {word: max(Counter(ids).values()) for word, ids in self.keyword_index.items()}
+        self.speller = build_speller({word: len(ids) for word, ids in self.keyword_index.items()})
+        self.terms = TermLookup(self.keyword_index, self.speller)
+
+    def _query_words(self, user_query: str) -> List[Tuple[str, List[int]]]:
+        """Map a query to its indexed keywords and their postings, correcting misspelled ones"""
+        return [(word, ids) for word, ids in self.terms.terms(user_query) if ids is not None]
+
+    def _contains(self, word: str, idx: int) -> int:
+        """How many times entry idx uses a keyword (its postings are sorted)"""
+        ids = self.keyword_index[word]
+        return bisect_right(ids, idx) - bisect_left(ids, idx)
+
+    def _top_k(self, user_query: str, k: int) -> List[Tuple[int, float]]:
+        """Top-k FAQ ids by keyword matches with their confidence, best first"""
+        with CHAT_STAGE_SECONDS.time(stage="tokenize"):
+            user_words = self._query_words(user_query)
         
         # Score each FAQ entry based on keyword matches
         scores = {}
         
-        for word in user_words:
-            if len(word) > 3 and word in self.keyword_index:
-                for idx in self.keyword_index[word]:
-                    if idx not in scores:
-                        scores[idx] = 0
-                    scores[idx] += 1
-        
-        if not scores:
-            return "I'm sorry, I don't have an answer for that. Please contact our support team.", 0.0
-        
-        # Find the entry with the highest score
-        best_idx = max(scores, key=scores.get)
-        best_score = scores[best_idx]
+        with CHAT_STAGE_SECONDS.time(stage="score"):
+            counts = Counter(word for word, _ in user_words)
+            # Rarest keywords first. Once the k-th best score is out of reach of everything the
+            # remaining keywords could add, they can only raise entries already scored, so the
+            # long postings of common words are probed per entry instead of walked
+            remaining = sum(count * self.max_repeats[word] for word, count in counts.items())
+            pruning = False
+            for word in sorted(counts, key=lambda word: len(self.keyword_index[word])):
+                count = counts[word]
+                if not pruning and len(scores) >= k:
+                    pruning = remaining < heapq.nlargest(k, scores.values())[-1]
+                if pruning:
+                    for idx in scores:
+                        scores[idx] += count * self._contains(word, idx)
+                else:
+                    for idx in self.keyword_index[word]:
+                        scores[idx] = scores.get(idx, 0) + count
+                remaining -= count * self.max_repeats[word]
+            
+            if not scores:
+                return []
+            # Ties go to the entry matching the earliest query word, then the lowest id
+            cutoff = heapq.nlargest(k, scores.values())[-1]
+            tied = [idx for idx, score in scores.items() if score >= cutoff]
+            words = list(counts)
+            best = sorted(tied, key=lambda idx: (-scores[idx], next(pos for pos, word in enumerate(words)
+                                                                    if self._contains(word, idx)), idx))[:k]
         
         # Calculate confidence (normalize by number of words in user query)
-        confidence = min(best_score / len(user_words), 1.0)
+        total_words = len(user_query.split())
+        return [(idx, min(scores[idx] / total_words, 1.0)) for idx in best]
         
-        if confidence > threshold:
-            return self.faq_df.iloc[best_idx]["Answer"], float(confidence)
+    @cached_match
+    def find_best_match_id(self, user_query: str, threshold: float = 0.2) -> Tuple[Optional[int], float]:
+        """Find the best matching FAQ id using keyword matching (None if nothing matches)"""
+        matches = self._top_k(user_query, 1)
+        if matches and matches[0][1] > threshold:
+            return matches[0][0], float(matches[0][1])
         
-        return "I'm sorry, I don't have an answer for that. Please contact our support team.", 0.0
+        return None, 0.0
+
+    def find_top_k_ids(self, user_query: str, k: int = 5, threshold: float = 0.2) -> List[Tuple[int, float]]:
+        """Return up to k FAQ ids above the threshold with their confidence, best first"""
+        return [(idx, float(confidence)) for idx, confidence in self._top_k(user_query, k) if confidence > threshold]
+
+    def find_top_k(self, user_query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to k matching FAQ answers with their confidence, best first"""
+        return [(self.answers[idx], confidence) for idx, confidence in self.find_top_k_ids(user_query, k, threshold=0.0)]
+
+    @cached_matches
+    def find_best_match_ids(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[Optional[int], float]]:
+        """Find the best matching FAQ id for each query, exactly as find_best_match_id would.
+
+        Each query is ranked on its own by ``_top_k`` so ties break the same way whatever
+        else is in the batch; both paths fill the same answer cache.
+        """
+        results = []
+        for query in user_queries:
+            matches = self._top_k(query, 1)
+            if matches and matches[0][1] > threshold:
+                results.append((matches[0][0], float(matches[0][1])))
+            else:
+                results.append((None, 0.0))
+        return results
+
+    def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
+        """Find the best matching FAQ answer using keyword matching"""
+        best_idx, confidence = self.find_best_match_id(user_query, threshold)
+        if best_idx is None:
+            return NO_MATCH_ANSWER, 0.0
+        return self.answers[best_idx], confidence
+
+    def find_best_matches(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[str, float]]:
+        """Find the best matching FAQ answer for each query"""
+        return [(NO_MATCH_ANSWER, 0.0) if best_idx is None else (self.answers[best_idx], confidence)
+                for best_idx, confidence in self.find_best_match_ids(user_queries, threshold)]
+
+# Initialize chatbot (rebuilt in the background when the dataset changes)
+DATASET_PATH = "insurance_dataset.csv"
 
-# Initialize chatbot
 try:
-    chatbot = SimpleFAQChatBot("insurance_dataset.csv")
+    reloader = ChatbotReloader(lambda: SimpleFAQChatBot(DATASET_PATH), DATASET_PATH)
     logger.info("Simple FAQ Chatbot initialized successfully")
 except Exception as e:
     logger.error(f"Failed to initialize chatbot: {str(e)}")
     raise
 
-@app.route("/api/chat", methods=["POST", "OPTIONS"])
+# Maximum number of queries accepted by /api/chat/batch
+MAX_BATCH_QUERIES = int(os.environ.get("CHAT_BATCH_MAX_QUERIES", "100"))
+
+# Largest number of ranked matches a /api/chat request may ask for with "k"
+MAX_TOP_K = int(os.environ.get("CHAT_MAX_TOP_K", "20"))
+
+def json_body(body: bytes) -> Response:
+    """Wrap a pre-serialized JSON body in a response"""
+    return Response(body, mimetype="application/json")
+
+@app.route("/api/chat", methods=["POST"])
 def handle_chat():
     """Handle chat requests"""
-    if request.method == "OPTIONS":
-        response = jsonify({"status": "preflight"})
-        return response
-        
     try:
         data = request.get_json()
         if not data or 'query' not in data:
@@ -139,19 +200,28 @@ def handle_chat():
         user_query = data['query'].strip()
         if not user_query:
             return jsonify({"error": "Empty query"}), 400
+        k = data.get('k')
+        if k is not None and (type(k) is not int or not 1 <= k <= MAX_TOP_K):
+            return jsonify({"error": f"k must be an integer from 1 to {MAX_TOP_K}"}), 400
             
-        response, confidence = chatbot.find_best_match(user_query)
+        chatbot = reloader.current
+        if k is not None:
+            # Up to k matches above the confidence threshold, best first, in the batch response format
+            matches = chatbot.find_top_k_ids(user_query, k)
+            faq_id, confidence = matches[0] if matches else (None, 0.0)
+            record_chat_match(faq_id, confidence)
+            log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence, k=k)
+            with CHAT_STAGE_SECONDS.time(stage="serialize"):
+                body = render_batch(chatbot.responses.render(faq_id, confidence) for faq_id, confidence in matches)
+            return json_body(body)
         
-        # Parse the response if it's JSON (for navigation)
-        try:
-            response_data = json.loads(response)
-            return jsonify(response_data)
-        except json.JSONDecodeError:
-            return jsonify({
-                "response": response,
-                "confidence": confidence,
-                "status": "success"
-            })
+        faq_id, confidence = chatbot.find_best_match_id(user_query)
+        record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence)
+        
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = chatbot.responses.render(faq_id, confidence)
+        return json_body(body)
             
     except Exception as e:
         logger.error(f"Error handling request: {str(e)}")
@@ -160,6 +230,65 @@ def handle_chat():
             "status": "error"
         }), 500
 
+@app.route("/api/chat/batch", methods=["POST"])
+def handle_chat_batch():
+    """Handle a batch of chat queries, returning results in request order"""
+    try:
+        data = request.get_json()
+        if not data or not isinstance(data.get('queries'), list):
+            return jsonify({"error": "Invalid request format"}), 400
+            
+        user_queries = data['queries']
+        if len(user_queries) > MAX_BATCH_QUERIES:
+            return jsonify({"error": f"Too many queries (max {MAX_BATCH_QUERIES})"}), 400
+        if not all(isinstance(query, str) and query.strip() for query in user_queries):
+            return jsonify({"error": "Empty query"}), 400
+            
+        chatbot = reloader.current
+        matches = chatbot.find_best_match_ids([query.strip() for query in user_queries])
+        for faq_id, confidence in matches:
+            record_chat_match(faq_id, confidence)
+        log_sampled(logger, "chat_batch", queries=len(user_queries),
+                    matched=sum(faq_id is not None for faq_id, _ in matches))
+        
+        with CHAT_STAGE_SECONDS.time(stage="serialize"):
+            body = render_batch(chatbot.responses.render(faq_id, confidence)
+                                for faq_id, confidence in matches)
+        return json_body(body)
+            
+    except Exception as e:
+        logger.error(f"Error handling batch request: {str(e)}")
+        return jsonify({
+            "response": "Sorry, I encountered an error processing your request.",
+            "status": "error"
+        }), 500
+
+@app.route("/api/cache/stats", methods=["GET"])
+def cache_stats():
+    """Report answer cache hits, misses and evictions"""
+    return jsonify(reloader.current.answer_cache.stats()), 200
+
+@app.route("/api/index", methods=["GET"])
+def index_status():
+    """Report the active FAQ index version and build duration"""
+    return jsonify(reloader.status()), 200
+
+@app.route("/api/admin/reload", methods=["POST"])
+def reload_index():
+    """Rebuild the FAQ index in the background and swap it in when ready"""
+    if not is_admin_authorized(request.headers.get('Authorization')):
+        return jsonify({"error": "Unauthorized"}), 401
+    started = reloader.reload()
+    return jsonify({
+        "status": "reloading" if started else "reload already in progress",
+        "index": reloader.status()
+    }), 202
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms and match counters in Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint"""
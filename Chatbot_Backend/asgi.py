@@ -0,0 +1,361 @@
+"""ASGI entry points for the chat and voice services.
+
+Run with any ASGI server, one process per core::
+
+    uvicorn asgi:create_chat_app --factory --host 0.0.0.0 --port $PORT
+    uvicorn asgi:create_voice_app --factory --host 0.0.0.0 --port $PORT
+
+The hot routes (``/api/chat``, ``/api/health``, ``/voice-command``,
+``/test-command`` and ``/health``) are served natively. Request bodies are
+read on the event loop, so a slow client or a large upload only holds a
+coroutine. Blocking work (FAQ matching, audio decoding, speech recognition)
+runs on bounded thread pools sized by ``CHAT_EXECUTOR_WORKERS`` and
+``VOICE_EXECUTOR_WORKERS``. A single process can therefore keep many
+keep-alive connections open and have many network recognitions in flight,
+where a sync worker is limited to its thread count.
+
+Every other route of the Flask app (batch chat, metrics, voice jobs, audio,
+admin) goes through a small WSGI bridge on the same pool, so its behaviour
+and CORS headers are unchanged. Stdlib only; the ASGI server is the one
+extra dependency.
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from cors import CorsPolicy
+from metrics import CHAT_STAGE_SECONDS, log_sampled, record_chat_match
+from response_table import render_batch
+
+logger = logging.getLogger(__name__)
+
+CHAT_EXECUTOR_WORKERS = int(os.environ.get("CHAT_EXECUTOR_WORKERS", "4"))
+VOICE_EXECUTOR_WORKERS = int(os.environ.get("VOICE_EXECUTOR_WORKERS", "32"))
+MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+
+Headers = List[Tuple[bytes, bytes]]
+JSON_HEADERS: Headers = [(b"content-type", b"application/json")]
+
+
+class Request(NamedTuple):
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+    read_seconds: float
+
+
+class Reply(NamedTuple):
+    status: int
+    body: bytes
+    headers: Headers
+
+
+class BodyTooLarge(Exception):
+    """Raised when a request body exceeds ASGI_MAX_BODY_BYTES"""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client goes away before sending its whole body"""
+
+
+def json_reply(payload, status: int = 200) -> Reply:
+    """Serialize like Flask's jsonify (compact, sorted keys)"""
+    body = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    return Reply(status, body, list(JSON_HEADERS))
+
+
+def cors_headers(origin: Optional[str], cors: CorsPolicy, preflight: bool = False) -> Headers:
+    """The CORS headers the Flask apps add, from the app's shared policy"""
+    headers = cors.preflight_headers(origin) if preflight else cors.headers(origin) + [("Vary", "Origin")]
+    return [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+
+async def read_body(receive, limit: int) -> bytes:
+    """Collect the request body without blocking the event loop"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+def parse_multipart(body: bytes, content_type: str) -> Dict[str, Tuple[Optional[str], bytes]]:
+    """Split a multipart/form-data body into {field name: (filename, data)}"""
+    header = Message()
+    header["content-type"] = content_type
+    boundary = header.get_param("boundary")
+    if not boundary:
+        return {}
+    fields = {}
+    for part in body.split(b"--" + boundary.encode("latin-1"))[1:]:
+        if part.startswith(b"--"):
+            break  # Closing delimiter
+        head, _, data = part.partition(b"\r\n\r\n")
+        disposition = Message()
+        for line in head.decode("latin-1").strip().split("\r\n"):
+            name, _, value = line.partition(":")
+            disposition[name.strip()] = value.strip()
+        field = disposition.get_param("name", header="content-disposition")
+        if field:
+            filename = disposition.get_param("filename", header="content-disposition")
+            fields[field] = (filename, data[:-2] if data.endswith(b"\r\n") else data)
+    return fields
+
+
+def _wsgi_environ(scope, headers: Headers, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in headers:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value.decode("latin-1")
+        elif key != "CONTENT_LENGTH":
+            key = f"HTTP_{key}"
+            value = value.decode("latin-1")
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(wsgi_app, environ: dict) -> Reply:
+    """Call a WSGI app to completion (runs on an executor thread)"""
+    started = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                              for name, value in response_headers]
+
+    result = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return Reply(started["status"], body, started["headers"])
+
+
+Handler = Callable[[Request], Awaitable[Reply]]
+
+
+class AsgiService:
+    """ASGI app serving some routes natively and bridging the rest to a Flask app"""
+
+    def __init__(self, wsgi_app, routes: Dict[Tuple[str, str], Handler], cors: CorsPolicy,
+                 executor: ThreadPoolExecutor):
+        self.wsgi_app = wsgi_app
+        self.routes = routes
+        self.cors = cors
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        started = time.perf_counter()
+        raw_headers = scope.get("headers", [])
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in raw_headers}
+        origin = headers.get("origin")
+        if CorsPolicy.is_preflight(scope["method"], origin, headers.get("access-control-request-method")):
+            await send({"type": "http.response.start", "status": 204,
+                        "headers": cors_headers(origin, self.cors, preflight=True)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        handler = self.routes.get((scope["method"], scope["path"]))
+        try:
+            if int(headers.get("content-length") or 0) > MAX_BODY_BYTES:
+                raise BodyTooLarge()
+            body = await read_body(receive, MAX_BODY_BYTES)
+        except ClientDisconnected:
+            return
+        except BodyTooLarge:
+            reply = json_reply({"error": "Request body too large"}, 413)
+            handler = None
+        else:
+            if handler is None:
+                loop = asyncio.get_running_loop()
+                reply = await loop.run_in_executor(self.executor, run_wsgi, self.wsgi_app,
+                                                   _wsgi_environ(scope, raw_headers, body))
+            else:
+                read_seconds = time.perf_counter() - started
+                reply = await handler(Request(scope["method"], scope["path"], headers, body, read_seconds))
+
+        response_headers = list(reply.headers)
+        if handler is not None or reply.status == 413:
+            # Bridged responses already carry the Flask app's CORS headers
+            response_headers += cors_headers(origin, self.cors)
+        if not any(name == b"content-length" for name, _ in response_headers):
+            response_headers.append((b"content-length", str(len(reply.body)).encode("ascii")))
+        await send({"type": "http.response.start", "status": reply.status, "headers": response_headers})
+        await send({"type": "http.response.body", "body": reply.body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def _json_payload(request: Request):
+    try:
+        return json.loads(request.body) if request.body else None
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def create_chat_app() -> AsgiService:
+    """ASGI app for the BM25 chat service (app.py)"""
+    import app as chat_service
+
+    executor = ThreadPoolExecutor(CHAT_EXECUTOR_WORKERS, thread_name_prefix="chat")
+
+    async def chat(request: Request) -> Reply:
+        data = _json_payload(request)
+        if not isinstance(data, dict) or not isinstance(data.get("query"), str):
+            return json_reply({"error": "Invalid request format"}, 400)
+        user_query = data["query"].strip()
+        if not user_query:
+            return json_reply({"error": "Empty query"}, 400)
+        k = data.get("k")
+        if k is not None and (type(k) is not int or not 1 <= k <= chat_service.MAX_TOP_K):
+            return json_reply({"error": f"k must be an integer from 1 to {chat_service.MAX_TOP_K}"}, 400)
+
+        try:
+            chatbot = chat_service.reloader.current
+            loop = asyncio.get_running_loop()
+            if k is not None:
+                matches = await loop.run_in_executor(executor, chatbot.find_top_k_ids, user_query, k)
+                faq_id, confidence = matches[0] if matches else (None, 0.0)
+            else:
+                faq_id, confidence = await loop.run_in_executor(executor, chatbot.find_best_match_id, user_query)
+            record_chat_match(faq_id, confidence)
+            log_sampled(logger, "chat", query=user_query, faq_id=faq_id, confidence=confidence, k=k)
+            with CHAT_STAGE_SECONDS.time(stage="serialize"):
+                if k is not None:
+                    body = render_batch(chatbot.responses.render(faq_id, confidence) for faq_id, confidence in matches)
+                else:
+                    body = chatbot.responses.render(faq_id, confidence)
+            return Reply(200, body, list(JSON_HEADERS))
+        except Exception as e:
+            logger.error(f"Error handling request: {str(e)}")
+            return json_reply({"response": "Sorry, I encountered an error processing your request.",
+                               "status": "error"}, 500)
+
+    async def health(request: Request) -> Reply:
+        return json_reply({"status": "healthy"})
+
+    routes = {
+        ("POST", "/api/chat"): chat,
+        ("GET", "/api/health"): health,
+    }
+    return AsgiService(chat_service.app, routes, chat_service.cors, executor)
+
+
+def create_voice_app() -> AsgiService:
+    """ASGI app for the voice navigation service (voice_nav_backend.py)"""
+    import voice_nav_backend as voice
+
+    executor = ThreadPoolExecutor(VOICE_EXECUTOR_WORKERS, thread_name_prefix="voice")
+
+    def read_upload(request: Request) -> Tuple[bytes, str]:
+        fields = parse_multipart(request.body, request.headers.get("content-type", ""))
+        if "file" not in fields:
+            raise voice.UploadError("No file uploaded")
+        filename, data = fields["file"]
+        if not filename:
+            raise voice.UploadError("Empty file")
+        file_ext = os.path.splitext(filename)[1]
+        if not file_ext:
+            raise voice.UploadError("Invalid file format")
+        if not data:
+            raise voice.UploadError("Empty file")
+        voice.check_upload_limits(data)
+        return data, file_ext
+
+    def busy_reply(retry_after: int) -> Reply:
+        reply = json_reply({"error": "Voice service is busy, please try again"}, 503)
+        return reply._replace(headers=reply.headers + [(b"retry-after", str(retry_after).encode("ascii"))])
+
+    async def voice_command(request: Request) -> Reply:
+        voice.VOICE_STAGE_SECONDS.observe(request.read_seconds, stage="upload")
+        try:
+            data, file_ext = read_upload(request)
+            loop = asyncio.get_running_loop()
+            # Waiting for an admission slot happens on the executor, never on the event loop
+            result = await loop.run_in_executor(executor, voice.run_admitted_voice_command, data, file_ext)
+            return json_reply({"response": result})
+        except voice.UploadTooLarge as e:
+            return json_reply({"error": str(e)}, 413)
+        except voice.UploadError as e:
+            return json_reply({"error": str(e)}, 400)
+        except voice.Overloaded as e:
+            return busy_reply(e.retry_after)
+        except voice.DecoderBusy:
+            return busy_reply(1)
+        except Exception as e:
+            voice.VOICE_ERRORS.inc(stage="voice_command")
+            logger.error(f"Error processing voice command: {str(e)}")
+            return json_reply({"error": "Failed to process command"}, 500)
+
+    async def test_command(request: Request) -> Reply:
+        data = _json_payload(request)
+        if not isinstance(data, dict) or "text" not in data:
+            return json_reply({"error": "No text provided"}, 400)
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, voice.process_command, data["text"])
+            return json_reply({"response": result})
+        except Exception as e:
+            voice.VOICE_ERRORS.inc(stage="test_command")
+            logger.error(f"Error in test-command: {str(e)}")
+            return json_reply({"error": str(e)}, 500)
+
+    async def health(request: Request) -> Reply:
+        return json_reply({"status": "healthy", "service": "voice-navigation"})
+
+    routes = {
+        ("POST", "/voice-command"): voice_command,
+        ("POST", "/test-command"): test_command,
+        ("GET", "/health"): health,
+    }
+    return AsgiService(voice.app, routes, voice.cors, executor)
@@ -0,0 +1,114 @@
+"""In-memory audio ingestion for /voice-command.
+
+Uploads are read straight from the request stream into memory. Uploads that
+are already 16-bit PCM WAV go to the recognizer untouched; everything else is
+decoded once through pydub/ffmpeg (piped over stdin) and serialized to WAV in
+memory. Only when piping fails (e.g. containers that need a seekable input)
+is the upload written to a private per-request scratch directory, so
+concurrent requests never share files.
+
+Uploads are capped at ``VOICE_MAX_UPLOAD_BYTES`` and ``VOICE_MAX_SECONDS``.
+``clip_seconds`` reads the duration a clip declares in its header (WAV
+chunks, or any container PyAV can probe) so long recordings are refused
+before any decoding work.
+"""
+import io
+import logging
+import os
+import struct
+import tempfile
+import wave
+from typing import Optional
+
+from pydub import AudioSegment
+
+try:
+    import av
+except ImportError:  # PyAV is optional; only WAV durations are known before decoding
+    av = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_FOLDER = "uploads"
+VOICE_MAX_UPLOAD_BYTES = int(os.environ.get("VOICE_MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+VOICE_MAX_SECONDS = float(os.environ.get("VOICE_MAX_SECONDS", "30"))
+
+
+def read_upload(file_storage) -> bytes:
+    """Read an uploaded file from the request stream into memory"""
+    return file_storage.stream.read()
+
+
+def is_pcm16_wav(data: bytes) -> bool:
+    """Return True if data is a WAV file the recognizer can read as-is (16-bit PCM)"""
+    if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+        return False
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            return wav.getsampwidth() == 2 and wav.getnframes() > 0
+    except (wave.Error, EOFError):
+        return False
+
+
+def _wav_seconds(data: bytes) -> Optional[float]:
+    """Duration from the fmt and data chunks of a RIFF/WAVE header, any sample format"""
+    byte_rate = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id, size = data[offset:offset + 4], struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt " and size >= 12 and body + 12 <= len(data):
+            byte_rate = struct.unpack_from("<I", data, body + 8)[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF; count the bytes actually sent
+            available = len(data) - body
+            return (min(size, available) if size else available) / byte_rate
+        offset = body + size + (size & 1)
+    return None
+
+
+def clip_seconds(data: bytes) -> Optional[float]:
+    """Duration declared by an upload without decoding it, or None if unknown"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return _wav_seconds(data)
+    if av is None:
+        return None
+    try:
+        with av.open(io.BytesIO(data)) as container:
+            # Only the header is parsed; recorder output often declares no duration
+            return container.duration / av.time_base if container.duration else None
+    except (av.error.FFmpegError, ValueError):
+        return None
+
+
+def _export_pcm16(audio: AudioSegment) -> io.BytesIO:
+    # pydub writes 16-bit WAV itself, so this does not spawn a second ffmpeg
+    buffer = io.BytesIO()
+    audio.set_sample_width(2).export(buffer, format="wav")
+    buffer.seek(0)
+    return buffer
+
+
+def _decode_from_scratch(data: bytes, file_ext: str) -> io.BytesIO:
+    """Fallback: decode via a file in a private per-request scratch directory"""
+    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=UPLOAD_FOLDER) as scratch:
+        path = os.path.join(scratch, f"upload{file_ext}")
+        with open(path, "wb") as file:
+            file.write(data)
+        return _export_pcm16(AudioSegment.from_file(path))
+
+
+def to_pcm16_wav(data: bytes, file_ext: str) -> io.BytesIO:
+    """Return a 16-bit PCM WAV buffer for an uploaded clip"""
+    if is_pcm16_wav(data):
+        return io.BytesIO(data)
+
+    try:
+        fmt = "wav" if file_ext.lower() == ".wav" else None
+        return _export_pcm16(AudioSegment.from_file(io.BytesIO(data), format=fmt))
+    except Exception as e:
+        logger.warning(f"In-memory decode failed, retrying from scratch file: {str(e)}")
+        return _decode_from_scratch(data, file_ext)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark per-query tokenization: the old per-engine tokenizers vs the shared analyzer.
+
+Usage (from Chatbot_Backend/):
+
+    python benchmarks/bench_analyzer.py -n 20
+
+Queries are the dataset questions with one word misspelled and the question
+mark dropped or swapped for "!" (like chat input). Each row times one pass
+over all of them and reports microseconds per query (best of -n rounds):
+
+- ``legacy-bm25``: the old BM25 tokenizer (per-character generator join per word)
+- ``legacy-keyword``: the old keyword matcher (``lower().split()``)
+- ``legacy-tfidf``: ``TfidfVectorizer(stop_words="english").transform`` for one query
+- ``analyze-cold`` / ``analyze-warm``: ``analyzer.analyze`` with the word cache cleared / filled
+- ``lookup-warm``: ``TermLookup.terms``, query words straight to term ids (what BM25 runs)
+- ``tfidf-vectors``: ``analyzer.tfidf_vectors`` for one query (what the TF-IDF engine runs)
+
+The legacy-tfidf and tfidf-vectors rows need scikit-learn and are skipped without it.
+"""
+
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from analyzer import TermLookup, analyze, normalize_word, tfidf_vectors  # noqa: E402
+from bm25_index import BM25Index  # noqa: E402
+
+DATASET_PATH = os.path.join(BACKEND_DIR, "insurance_dataset.csv")
+
+
+def legacy_bm25_tokenize(text):
+    terms = []
+    for word in text.lower().split():
+        clean_word = ''.join(c for c in word if c.isalnum())
+        if len(clean_word) > 3:
+            terms.append(clean_word)
+    return terms
+
+
+def legacy_keyword_tokenize(text):
+    return [word for word in text.lower().strip().split() if len(word) > 3]
+
+
+def load_queries(seed=7):
+    """Dataset questions made to look like typed chat input"""
+    rng = random.Random(seed)
+    with open(DATASET_PATH, newline="", encoding="utf-8") as file:
+        questions = [row["Question"] for row in csv.DictReader(file) if row.get("Question")]
+    queries = []
+    for question in questions:
+        words = question.rstrip("?").split()
+        pos = rng.randrange(len(words))
+        word = words[pos]
+        if len(word) > 5:  # Swap two letters, a typical typo
+            i = rng.randrange(1, len(word) - 1)
+            words[pos] = word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        queries.append(" ".join(words) + rng.choice(["?", "", "!"]))
+    return questions, queries
+
+
+def best_time(run, queries, rounds, before=None):
+    """Best wall time of one pass over queries across rounds, in microseconds per query"""
+    best = float("inf")
+    for _ in range(rounds):
+        if before is not None:
+            before()
+        started = time.perf_counter()
+        for query in queries:
+            run(query)
+        best = min(best, time.perf_counter() - started)
+    return best / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    questions, queries = load_queries()
+    index = BM25Index(questions)
+    lookup = TermLookup(index.vocabulary)
+    results = [
+        ("legacy-bm25", best_time(legacy_bm25_tokenize, queries, args.rounds)),
+        ("legacy-keyword", best_time(legacy_keyword_tokenize, queries, args.rounds)),
+        ("analyze-cold", best_time(analyze, queries, args.rounds, before=normalize_word.cache_clear)),
+        ("analyze-warm", best_time(analyze, queries, args.rounds)),
+        ("lookup-warm", best_time(lookup.terms, queries, args.rounds)),
+    ]
+    try:
+        from sklearn.feature_extraction.text import TfidfVectorizer
+    except ImportError:
+        print("legacy-tfidf / tfidf-vectors skipped: scikit-learn not installed")
+    else:
+        legacy = TfidfVectorizer(stop_words="english").fit(questions)
+        shared = TfidfVectorizer(analyzer=analyze).fit(questions)
+        shared_lookup = TermLookup(shared.vocabulary_)
+        results.append(("legacy-tfidf", best_time(lambda query: legacy.transform([query]), queries, args.rounds)))
+        results.append(("tfidf-vectors", best_time(lambda query: tfidf_vectors(shared_lookup, [query], shared.idf_),
+                                                   queries, args.rounds)))
+
+    print(f"{len(queries)} queries, best of {args.rounds} rounds")
+    print(f"{'tokenizer':<16} {'us/query':>9}")
+    for name, micros in results:
+        print(f"{name:<16} {micros:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark audio decoding: per-call pydub/ffmpeg path vs the warm decoder pool.
+
+Usage (from Chatbot_Backend/):
+
+    python benchmarks/bench_decoder.py --clip recording.webm -n 200 -c 4
+
+Without --clip a 1.5s tone is synthesized and encoded to WebM/Opus (needs
+PyAV). The per-call path needs ffmpeg and ffprobe on PATH and is skipped
+otherwise.
+"""
+
+import argparse
+import io
+import math
+import os
+import shutil
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_pipeline import to_pcm16_wav  # noqa: E402
+from decoder_pool import DecoderPool  # noqa: E402
+
+
+def synthesize_clip(seconds=1.5, rate=48000):
+    """Encode a tone to WebM/Opus in memory, like a browser MediaRecorder upload"""
+    import av
+
+    buffer = io.BytesIO()
+    with av.open(buffer, "w", format="webm") as container:
+        stream = container.add_stream("libopus", rate=rate)
+        stream.layout = "mono"
+        samples = int(seconds * rate)
+        pcm = bytearray()
+        for i in range(samples):
+            value = int(8000 * math.sin(2 * math.pi * 440 * i / rate))
+            pcm += value.to_bytes(2, "little", signed=True)
+        frame = av.AudioFrame(format="s16", layout="mono", samples=samples)
+        frame.planes[0].update(bytes(pcm))
+        frame.sample_rate = rate
+        for packet in stream.encode(frame):
+            container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+    return buffer.getvalue()
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(name, decode, data, file_ext, iterations, concurrency):
+    """Time `iterations` decodes across `concurrency` threads and print latency stats"""
+    decode(data, file_ext)  # warm up (starts pool workers, loads codecs)
+
+    def timed(_):
+        started = time.perf_counter()
+        decode(data, file_ext)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(iterations)))
+    elapsed = time.perf_counter() - started
+
+    print(f"{name:<10} p50 {percentile(latencies, 50):8.2f} ms   p99 {percentile(latencies, 99):8.2f} ms   "
+          f"mean {statistics.mean(latencies):8.2f} ms   {iterations / elapsed:8.1f} clips/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clip", help="audio file to decode (default: synthesized WebM/Opus tone)")
+    parser.add_argument("-n", "--iterations", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=2)
+    parser.add_argument("-w", "--workers", type=int, default=2, help="decoder pool size")
+    args = parser.parse_args()
+
+    if args.clip:
+        with open(args.clip, "rb") as file:
+            data = file.read()
+        file_ext = os.path.splitext(args.clip)[1]
+    else:
+        data, file_ext = synthesize_clip(), ".webm"
+    print(f"Clip: {len(data)} bytes ({file_ext}), {args.iterations} decodes, concurrency {args.concurrency}")
+
+    if shutil.which("ffmpeg") and shutil.which("ffprobe"):
+        run("per-call", to_pcm16_wav, data, file_ext, args.iterations, args.concurrency)
+    else:
+        print("per-call   skipped: ffmpeg/ffprobe not found on PATH")
+
+    pool = DecoderPool(workers=args.workers, queue_size=max(args.concurrency, 1) * 2)
+    try:
+        run("pool", pool.decode, data, file_ext, args.iterations, args.concurrency)
+        print(f"Pool stats: {pool.stats()}")
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Benchmark the three FAQ matchers on synthetic corpora seeded from the dataset.
+
+Usage (from Chatbot_Backend/):
+
+    python benchmarks/bench_matchers.py --sizes 1000,10000,100000 --output bench.json
+    python benchmarks/bench_matchers.py --baseline bench.json --max-regression 0.25
+
+For each engine and corpus size this reports index build time, memory held by
+the built index, single-query p50/p99 latency and throughput, batch
+throughput, and top-1 accuracy on a labeled query set (queries are dataset
+questions with a word dropped, labeled with the row they came from) plus
+top-1 agreement with the first engine. The ``bm25-lsh`` and ``tfidf-lsh``
+variants force the LSH candidate stage on at every size, and ``bm25-sharded``
+/ ``tfidf-sharded`` serve the corpus from ``--shards`` worker processes (their
+memory figure covers the front process only). With --baseline the run exits with
+status 1 when any metric regresses past the configured limits.
+
+Synthetic rows recombine the real questions: some words are swapped for
+other dataset words and a synthetic product term is added from a pool that
+grows with the corpus, so the vocabulary scales the way a real catalogue
+would. Everything is seeded, so runs are reproducible.
+"""
+
+import argparse
+import csv
+import gc
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)  # The app modules load insurance_dataset.csv relative to this directory
+
+import lsh_index  # noqa: E402
+from answer_cache import AnswerCache  # noqa: E402
+from index_artifact import load_faq_entries  # noqa: E402
+from sharded_index import ShardedFAQChatBot  # noqa: E402
+
+DATASET_PATH = "insurance_dataset.csv"
+DEFAULT_LSH_MIN_DOCS = lsh_index.LSH_MIN_DOCS
+
+# engine name -> (module, chatbot class, takes an index_path)
+ENGINES = {
+    "bm25": ("app", "UltraSimpleFAQChatBot", True),
+    "keyword": ("app_simple", "SimpleFAQChatBot", False),
+    "tfidf": ("app8", "FAQChatBot", True),
+}
+# Variants that force the LSH candidate stage on regardless of corpus size
+LSH_ENGINES = {"bm25-lsh": "bm25", "tfidf-lsh": "tfidf"}
+# Variants served by sharded_index worker processes (--shards of them)
+SHARDED_ENGINES = {"bm25-sharded": "bm25", "tfidf-sharded": "tfidf"}
+SHARDS = os.cpu_count() or 2
+
+
+def load_seed_rows(csv_path):
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        return [(row["Question"].strip(), row["Answer"].strip())
+                for row in csv.DictReader(file) if row.get("Question") and row.get("Answer")]
+
+
+def synthesize_corpus(seed_rows, size, seed):
+    """Return `size` (question, answer) rows recombined from the seed rows"""
+    rng = random.Random(seed)
+    vocabulary = sorted({word for question, _ in seed_rows for word in question.lower().rstrip("?").split()
+                         if len(word) > 3})
+    term_pool = max(int(math.sqrt(size) * 4), 16)
+
+    rows = list(seed_rows[:size])
+    while len(rows) < size:
+        question, answer = seed_rows[rng.randrange(len(seed_rows))]
+        words = question.rstrip("?").split()
+        for position in range(len(words)):
+            if rng.random() < 0.25:
+                words[position] = rng.choice(vocabulary)
+        words.insert(rng.randrange(len(words) + 1), f"plan{rng.randrange(term_pool)}")
+        rows.append((" ".join(words) + "?", f"{answer} (ref {len(rows)})"))
+    return rows
+
+
+def labeled_queries(rows, count, seed):
+    """Pick `count` rows and derive a query from each by dropping one word"""
+    rng = random.Random(seed + 1)
+    queries = []
+    for row_id in rng.sample(range(len(rows)), min(count, len(rows))):
+        words = rows[row_id][0].rstrip("?").split()
+        if len(words) > 3:
+            del words[rng.randrange(len(words))]
+        queries.append((" ".join(words), row_id))
+    return queries
+
+
+def write_csv(rows, path):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Question", "Answer"])
+        writer.writerows(rows)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def build_chatbot(engine, csv_path, scratch):
+    if engine in SHARDED_ENGINES:
+        chatbot = ShardedFAQChatBot(csv_path, engine=SHARDED_ENGINES[engine], shards=SHARDS)
+        chatbot.answer_cache = AnswerCache(max_size=0)
+        return chatbot
+    lsh_index.LSH_MIN_DOCS = 0 if engine in LSH_ENGINES else DEFAULT_LSH_MIN_DOCS
+    module_name, class_name, takes_index = ENGINES[LSH_ENGINES.get(engine, engine)]
+    cls = getattr(importlib.import_module(module_name), class_name)
+    # A missing artifact path forces a fresh build from the CSV
+    chatbot = cls(csv_path, index_path=os.path.join(scratch, "missing.bin")) if takes_index else cls(csv_path)
+    chatbot.answer_cache = AnswerCache(max_size=0)  # Measure matching, not the answer cache
+    return chatbot
+
+
+def close_chatbot(chatbot):
+    if hasattr(chatbot, "close"):
+        chatbot.close()  # Sharded engines hold worker processes
+
+
+def bench_engine(engine, csv_path, scratch, queries, measure_memory):
+    """Build one engine on the corpus and measure it"""
+    gc.collect()
+    started = time.perf_counter()
+    chatbot = build_chatbot(engine, csv_path, scratch)
+    build_seconds = time.perf_counter() - started
+
+    memory_bytes = None
+    if measure_memory:
+        close_chatbot(chatbot)
+        del chatbot
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        chatbot = build_chatbot(engine, csv_path, scratch)
+        gc.collect()
+        memory_bytes = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+    texts = [query for query, _ in queries]
+    for query in texts[:20]:
+        chatbot.find_best_match_id(query)  # Warm up
+
+    latencies, predictions = [], []
+    started = time.perf_counter()
+    for query in texts:
+        query_started = time.perf_counter()
+        faq_id, _ = chatbot.find_best_match_id(query)
+        latencies.append(time.perf_counter() - query_started)
+        predictions.append(faq_id)
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chatbot.find_best_match_ids(texts)
+    batch_elapsed = time.perf_counter() - started
+    close_chatbot(chatbot)
+
+    # Labels are entry ids: duplicate synthetic questions share one entry
+    correct = sum(faq_id is not None and faq_id == label
+                  for faq_id, (_, label) in zip(predictions, queries))
+    return {
+        "build_seconds": build_seconds,
+        "memory_mb": None if memory_bytes is None else memory_bytes / 2 ** 20,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "qps": len(texts) / elapsed,
+        "batch_qps": len(texts) / batch_elapsed,
+        "accuracy": correct / len(queries),
+        "predictions": predictions,
+    }
+
+
+def check_regressions(results, baseline, max_regression, max_accuracy_drop, max_p99_ms):
+    """Return a list of human-readable regression failures"""
+    failures = []
+    slower = 1 + max_regression
+    for key, result in results.items():
+        if max_p99_ms is not None and result["p99_ms"] > max_p99_ms:
+            failures.append(f"{key}: p99 {result['p99_ms']:.2f} ms exceeds {max_p99_ms:.2f} ms")
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        for metric in ("build_seconds", "p50_ms", "p99_ms"):
+            if result[metric] > previous[metric] * slower:
+                failures.append(f"{key}: {metric} {result[metric]:.3f} vs baseline {previous[metric]:.3f}")
+        for metric in ("qps", "batch_qps"):
+            if result[metric] * slower < previous[metric]:
+                failures.append(f"{key}: {metric} {result[metric]:.0f} vs baseline {previous[metric]:.0f}")
+        if previous["accuracy"] - result["accuracy"] > max_accuracy_drop:
+            failures.append(f"{key}: accuracy {result['accuracy']:.3f} vs baseline {previous['accuracy']:.3f}")
+    return failures
+
+
+def main():
+    global SHARDS
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma-separated corpus sizes (up to 1000000)")
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help=f"comma-separated engines to run "
+                             f"({', '.join([*ENGINES, *LSH_ENGINES, *SHARDED_ENGINES])})")
+    parser.add_argument("--shards", type=int, default=SHARDS, help="worker processes for the sharded engines")
+    parser.add_argument("--queries", type=int, default=500, help="labeled queries per corpus")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--no-memory", action="store_true", help="skip the (slow) tracemalloc build")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results from an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed relative slowdown vs the baseline (0.2 = 20%%)")
+    parser.add_argument("--max-accuracy-drop", type=float, default=0.01,
+                        help="allowed absolute top-1 accuracy drop vs the baseline")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any single-query p99 exceeds this")
+    args = parser.parse_args()
+    SHARDS = args.shards
+
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = set(engines) - set(ENGINES) - set(LSH_ENGINES) - set(SHARDED_ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+    logging.disable(logging.INFO)  # Silence per-build index logging
+    for engine in engines:
+        # Keep import cost out of the build timings
+        base_engine = LSH_ENGINES.get(engine) or SHARDED_ENGINES.get(engine) or engine
+        importlib.import_module(ENGINES[base_engine][0])
+
+    seed_rows = load_seed_rows(DATASET_PATH)
+    results = {}
+    print(f"{'engine':<13} {'rows':>8} {'build s':>9} {'mem MB':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'qps':>8} {'batch qps':>10} {'top-1':>6} {'agree':>6}")
+    with tempfile.TemporaryDirectory() as scratch:
+        for size in (int(size) for size in args.sizes.split(",")):
+            rows = synthesize_corpus(seed_rows, size, args.seed)
+            csv_path = os.path.join(scratch, f"faq_{size}.csv")
+            write_csv(rows, csv_path)
+            # The engines index consolidated entries, so label each query with its row's entry
+            entry_of_row = load_faq_entries(csv_path).entry_of_row
+            queries = [(query, entry_of_row[row_id]) for query, row_id in labeled_queries(rows, args.queries, args.seed)]
+
+            reference = None
+            for engine in engines:
+                result = bench_engine(engine, csv_path, scratch, queries, not args.no_memory)
+                predictions = result.pop("predictions")
+                if reference is None:
+                    reference = predictions
+                result["agreement"] = sum(
+                    a == b for a, b in zip(predictions, reference)) / len(predictions)
+                results[f"{engine}@{size}"] = result
+
+                memory = "-" if result["memory_mb"] is None else f"{result['memory_mb']:.1f}"
+                print(f"{engine:<13} {size:>8} {result['build_seconds']:>9.3f} {memory:>8} "
+                      f"{result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} {result['qps']:>8.0f} "
+                      f"{result['batch_qps']:>10.0f} {result['accuracy']:>6.3f} {result['agreement']:>6.3f}")
+            os.remove(csv_path)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"seed": args.seed, "queries": args.queries, "results": results}, file, indent=2)
+
+    if args.baseline or args.max_p99_ms is not None:
+        baseline = {}
+        if args.baseline:
+            with open(args.baseline) as file:
+                baseline = json.load(file)["results"]
+        failures = check_regressions(results, baseline, args.max_regression,
+                                     args.max_accuracy_drop, args.max_p99_ms)
+        for failure in failures:
+            print(f"REGRESSION {failure}")
+        if failures:
+            sys.exit(1)
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
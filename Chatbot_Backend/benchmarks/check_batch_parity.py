@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Check that every FAQ engine answers a query the same way alone and in a batch.
+
+Usage (from Chatbot_Backend/):
+
+    python benchmarks/check_batch_parity.py
+    python benchmarks/check_batch_parity.py --engines keyword,bm25-sharded --batch-size 25
+
+``find_best_match_id`` (``/api/chat``) and ``find_best_match_ids``
+(``/api/chat/batch``) share one answer cache, so whichever path scores a
+query first decides what the other one returns later. That is only correct
+if both paths give the same (id, confidence) for every query whatever else is
+in the batch. The queries are every dataset question plus a variant of each
+with one word dropped. They are shuffled into batches of ``--batch-size`` and
+also sent as one batch of everything. The run exits with status 1 on any
+mismatch and prints the first few.
+"""
+
+import argparse
+import logging
+import random
+import sys
+import tempfile
+
+import bench_matchers
+from bench_matchers import DATASET_PATH, ENGINES, LSH_ENGINES, SHARDED_ENGINES, build_chatbot, close_chatbot
+from index_artifact import load_faq_rows
+
+MAX_REPORTED = 10
+
+
+def parity_queries(seed):
+    """Every dataset question, plus one with a word dropped"""
+    rng = random.Random(seed)
+    queries = []
+    for question in load_faq_rows(DATASET_PATH)[0]:
+        queries.append(question)
+        words = question.rstrip("?").split()
+        if len(words) > 2:
+            del words[rng.randrange(len(words))]
+            queries.append(" ".join(words))
+    return queries
+
+
+def check_engine(engine, queries, batch_size, seed, scratch):
+    """Return the queries whose batch result differs from the single-query result"""
+    chatbot = build_chatbot(engine, DATASET_PATH, scratch)
+    try:
+        single = {query: chatbot.find_best_match_id(query) for query in queries}
+        order = list(queries)
+        random.Random(seed).shuffle(order)
+        batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)] + [order]
+        mismatches = []
+        for batch in batches:
+            for query, result in zip(batch, chatbot.find_best_match_ids(batch)):
+                if result != single[query]:
+                    mismatches.append((query, single[query], result))
+        return mismatches
+    finally:
+        close_chatbot(chatbot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--engines", default=",".join(ENGINES),
+                        help=f"comma-separated engines to check "
+                             f"({', '.join([*ENGINES, *LSH_ENGINES, *SHARDED_ENGINES])})")
+    parser.add_argument("--shards", type=int, default=bench_matchers.SHARDS,
+                        help="worker processes for the sharded engines")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+    bench_matchers.SHARDS = args.shards
+
+    engines = [engine.strip() for engine in args.engines.split(",") if engine.strip()]
+    unknown = set(engines) - set(ENGINES) - set(LSH_ENGINES) - set(SHARDED_ENGINES)
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(sorted(unknown))}")
+    logging.disable(logging.INFO)
+
+    queries = parity_queries(args.seed)
+    failed = False
+    with tempfile.TemporaryDirectory() as scratch:
+        for engine in engines:
+            # Answer caches are off in build_chatbot, so both paths really score every query
+            mismatches = check_engine(engine, queries, args.batch_size, args.seed, scratch)
+            print(f"{engine:<13} {len(queries)} queries, {len(mismatches)} batch mismatches")
+            for query, single, batched in mismatches[:MAX_REPORTED]:
+                print(f"  {query!r}: alone {single}, batched {batched}")
+            failed = failed or bool(mismatches)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
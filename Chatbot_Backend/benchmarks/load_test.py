@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Closed-loop HTTP load test comparing the Flask (WSGI) and ASGI serving modes.
+
+Start the servers to compare, then point the load test at them:
+
+    gunicorn app:app --bind 127.0.0.1:5000 --workers 1 --threads 8
+    uvicorn asgi:create_chat_app --factory --host 127.0.0.1 --port 8000
+    python benchmarks/load_test.py --scenario chat \\
+        --target flask=http://127.0.0.1:5000 --target asgi=http://127.0.0.1:8000
+
+For the voice scenarios start voice_nav_backend (or asgi:create_voice_app)
+with SPEECH_BACKEND=stub STUB_DELAY_MS=200 TTS_BACKEND=stub, so each
+recognition waits like a network call to the Google recognizer would.
+
+Each of --concurrency virtual users keeps one keep-alive connection open and
+sends requests back to back for --duration seconds (reconnecting when the
+server closes the connection). The report gives throughput, p50/p99 latency
+and errors per target and concurrency level, plus each target's throughput
+relative to the first one.
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import math
+import os
+import statistics
+import sys
+import time
+import wave
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_PATH = os.path.join(BACKEND_DIR, "insurance_dataset.csv")
+
+SCENARIOS = ("chat", "health", "test-command", "voice-command")
+
+
+def tone_wav(seconds=1.0, rate=16000, frequency=440):
+    """A short 16-bit PCM tone, which the VAD keeps and the stub recognizer accepts"""
+    frames = bytearray()
+    for i in range(int(seconds * rate)):
+        frames += int(6000 * math.sin(2 * math.pi * frequency * i / rate)).to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def build_requests(scenario):
+    """Return a list of (method, path, content type, body) requests to cycle through"""
+    if scenario == "health":
+        return [("GET", "/api/health", None, b"")]
+    if scenario == "chat":
+        with open(DATASET_PATH, newline="", encoding="utf-8") as file:
+            questions = [row["Question"] for row in csv.DictReader(file) if row.get("Question")]
+        return [("POST", "/api/chat", "application/json", json.dumps({"query": question}).encode("utf-8"))
+                for question in questions[:200]]
+    if scenario == "test-command":
+        return [("POST", "/test-command", "application/json", json.dumps({"text": text}).encode("utf-8"))
+                for text in ("show my policy", "file a claim", "open vault", "car insurance", "weather")]
+    boundary = "loadtestboundary"
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"clip.wav\"\r\n"
+            f"Content-Type: audio/wav\r\n\r\n").encode("latin-1") + tone_wav() + f"\r\n--{boundary}--\r\n".encode()
+    return [("POST", "/voice-command", f"multipart/form-data; boundary={boundary}", body)]
+
+
+async def read_response(reader):
+    """Read one HTTP/1.x response; returns (status, keep_alive)"""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("Server closed the connection")
+    version, status = status_line.split()[:2]
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif "content-length" in headers:
+        await reader.readexactly(int(headers["content-length"]))
+    else:
+        await reader.read()  # Body runs until the server closes the connection
+        return int(status), False
+
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection != "close" and (version == b"HTTP/1.1" or connection == "keep-alive")
+    return int(status), keep_alive
+
+
+async def virtual_user(host, port, requests, offset, deadline, latencies, errors):
+    reader = writer = None
+    position = offset
+    while time.perf_counter() < deadline:
+        method, path, content_type, body = requests[position % len(requests)]
+        position += 1
+        head = f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: keep-alive\r\n"
+        if content_type:
+            head += f"Content-Type: {content_type}\r\n"
+        head += f"Content-Length: {len(body)}\r\n\r\n"
+        started = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(head.encode("latin-1") + body)
+            await writer.drain()
+            status, keep_alive = await read_response(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError):
+            errors["connection"] = errors.get("connection", 0) + 1
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+            await asyncio.sleep(0.01)
+            continue
+        latencies.append(time.perf_counter() - started)
+        if status >= 400:
+            errors[status] = errors.get(status, 0) + 1
+        if not keep_alive:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run_level(url, requests, concurrency, duration):
+    parts = urlsplit(url)
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    await asyncio.gather(*(virtual_user(parts.hostname, parts.port or 80, requests, user, deadline, latencies, errors)
+                           for user in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    ordered = sorted(latencies) or [0.0]
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(ordered) * 1000,
+        "p99_ms": ordered[min(len(ordered) - 1, int(0.99 * (len(ordered) - 1)))] * 1000,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", action="append", required=True,
+                        help="label=base URL of a running server (repeatable)")
+    parser.add_argument("--scenario", choices=SCENARIOS, default="chat")
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated virtual user counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency level")
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args()
+
+    targets = []
+    for target in args.target:
+        label, _, url = target.rpartition("=")
+        targets.append((label or url, url))
+    requests = build_requests(args.scenario)
+    levels = [int(level) for level in args.concurrency.split(",")]
+
+    results = {}
+    print(f"{'target':<10} {'users':>6} {'requests':>9} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'vs first':>9}  errors")
+    for concurrency in levels:
+        baseline = None
+        for label, url in targets:
+            result = asyncio.run(run_level(url, requests, concurrency, args.duration))
+            results[f"{label}@{concurrency}"] = result
+            baseline = baseline or result["rps"] or None
+            relative = f"{result['rps'] / baseline:.2f}x" if baseline else "-"
+            errors = ", ".join(f"{key}: {count}" for key, count in result["errors"].items()) or "-"
+            print(f"{label:<10} {concurrency:>6} {result['requests']:>9} {result['rps']:>9.0f} "
+                  f"{result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f} {relative:>9}  {errors}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"scenario": args.scenario, "duration": args.duration, "results": results}, file,
+                      indent=2, default=str)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+"""BM25 inverted index with compact array-backed postings.
+
+Only uses the standard library (``array``) so the ultra-simple deployment,
+which ships without numpy, can keep using it. On large corpora an optional
+``lsh`` candidate index (see ``lsh_index``) narrows each query to a few
+documents that are then scored exactly, and an optional ``speller`` (see
+``spell_correct``) maps misspelled query words to indexed terms. Documents
+and queries go through the shared ``analyzer``; query words are resolved to
+term ids through its per-index LRU cache. Queries are answered with MaxScore
+pruning (see ``max_score``), which skips the postings of documents that
+cannot reach the top k; batches run the same path per query.
+"""
+import heapq
+import math
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import max_score
+from analyzer import TermLookup, analyze
+from metrics import CHAT_STAGE_SECONDS
+
+
+def bm25_idf(num_docs: int, doc_freq: int) -> float:
+    """BM25 inverse document frequency (always positive)"""
+    return math.log(1 + (num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+
+class BM25Index:
+    """Inverted index scored with Okapi BM25.
+
+    Postings are stored in CSR layout: the postings of term ``t`` live in
+    ``postings_docs[postings_offsets[t]:postings_offsets[t + 1]]`` (sorted by
+    doc id) with the matching term frequencies in ``postings_tfs``. IDF values
+    and per-document length norms are precomputed at build time; each term's
+    highest posting score (its MaxScore upper bound) on first use.
+    """
+
+    def __init__(self, documents: Iterable[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lsh = None
+        self._build(documents)
+        self.speller = None
+        self.upper_bounds: Dict[int, float] = {}
+
+    def _build(self, documents: Iterable[str]):
+        """Tokenize documents and build postings, IDF and length norms"""
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths = array('I')
+
+        for doc_id, text in enumerate(documents):
+            counts = Counter(analyze(text))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_postings.setdefault(term, []).append((doc_id, tf))
+
+        self.num_docs = len(self.doc_lengths)
+        self.avg_doc_length = (sum(self.doc_lengths) / self.num_docs) if self.num_docs else 0.0
+
+        self.vocabulary: Dict[str, int] = {}
+        self.postings_offsets = array('I', [0])
+        self.postings_docs = array('I')
+        self.postings_tfs = array('H')
+        self.idf = array('d')
+
+        for term_id, term in enumerate(sorted(term_postings)):
+            postings = term_postings[term]
+            self.vocabulary[term] = term_id
+            for doc_id, tf in postings:
+                self.postings_docs.append(doc_id)
+                self.postings_tfs.append(min(tf, 0xFFFF))
+            self.postings_offsets.append(len(self.postings_docs))
+            self.idf.append(self._idf(len(postings)))
+
+        # IDF of a term that never occurs, used to penalise unknown query words
+        self.max_idf = self._idf(0)
+
+        # k1 * (1 - b + b * dl / avgdl), the length-dependent part of the BM25 denominator
+        avg = self.avg_doc_length or 1.0
+        self.doc_norms = array('d', (self.k1 * (1 - self.b + self.b * dl / avg) for dl in self.doc_lengths))
+
+    @classmethod
+    def from_arrays(cls, terms: Sequence[str], postings_offsets: Sequence[int], postings_docs: Sequence[int],
+                    postings_tfs: Sequence[int], idf: Sequence[float], doc_lengths: Sequence[int],
+                    doc_norms: Sequence[float], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Rebuild an index from prebuilt arrays (e.g. memoryviews over a mapped artifact)"""
+        index = cls.__new__(cls)
+        index.k1 = k1
+        index.b = b
+        index.vocabulary = {term: term_id for term_id, term in enumerate(terms)}
+        index.postings_offsets = postings_offsets
+        index.postings_docs = postings_docs
+        index.postings_tfs = postings_tfs
+        index.idf = idf
+        index.doc_lengths = doc_lengths
+        index.doc_norms = doc_norms
+        index.num_docs = len(doc_lengths)
+        index.avg_doc_length = (sum(doc_lengths) / index.num_docs) if index.num_docs else 0.0
+        index.max_idf = index._idf(0)
+        index.lsh = None
+        index.speller = None
+        index.upper_bounds = {}
+        return index
+
+    @property
+    def speller(self):
+        """Typo corrector for unknown query terms (None to disable)"""
+        return self.terms.speller
+
+    @speller.setter
+    def speller(self, speller):
+        # Cached lookups depend on the speller, so start a fresh cache
+        self.terms = TermLookup(self.vocabulary, speller)
+
+    def _idf(self, doc_freq: int) -> float:
+        """BM25 inverse document frequency (always positive)"""
+        return bm25_idf(self.num_docs, doc_freq)
+
+    def apply_global_stats(self, num_docs: int, doc_freqs: Dict[str, int], avg_doc_length: float):
+        """Re-weight a shard's index with corpus-wide statistics so scores compare across shards"""
+        for term, term_id in self.vocabulary.items():
+            self.idf[term_id] = bm25_idf(num_docs, doc_freqs[term])
+        self.max_idf = bm25_idf(num_docs, 0)
+        self.avg_doc_length = avg_doc_length
+        avg = avg_doc_length or 1.0
+        self.doc_norms = array('d', (self.k1 * (1 - self.b + self.b * dl / avg) for dl in self.doc_lengths))
+        self.upper_bounds = {}
+
+    def postings(self, term_id: int) -> Tuple[memoryview, memoryview]:
+        """Return zero-copy views over the doc ids and term frequencies of a term"""
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        return memoryview(self.postings_docs)[start:end], memoryview(self.postings_tfs)[start:end]
+
+    def term_counts(self) -> Dict[str, int]:
+        """Return the document frequency of every indexed term"""
+        offsets = self.postings_offsets
+        return {term: offsets[term_id + 1] - offsets[term_id] for term, term_id in self.vocabulary.items()}
+
+    def _query_terms(self, query: str) -> Tuple[List[int], float]:
+        """Map a query to known term ids and the score used to normalise confidence"""
+        term_ids = []
+        ideal_score = 0.0
+        # Corrected typos resolve to their vocabulary term, so each distinct pair is one term
+        for _, term_id in set(self.terms.terms(query)):
+            if term_id is None:
+                ideal_score += self.max_idf
+            else:
+                term_ids.append(term_id)
+                ideal_score += self.idf[term_id]
+        return term_ids, ideal_score
+
+    def _posting_list(self, term_id: int) -> max_score.PostingList:
+        """A term's postings with their BM25 weights and upper bound, for MaxScore"""
+        start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+        docs, tfs, norms = self.postings_docs, self.postings_tfs, self.doc_norms
+        idf = self.idf[term_id]
+        k1_plus_one = self.k1 + 1
+
+        def weight(pos: int) -> float:
+            tf = tfs[pos]
+            return idf * tf * k1_plus_one / (tf + norms[docs[pos]])
+
+        upper_bound = self.upper_bounds.get(term_id)
+        if upper_bound is None:
+            upper_bound = self.upper_bounds[term_id] = max(map(weight, range(start, end)), default=0.0)
+        return max_score.PostingList(docs, start, end, upper_bound, weight)
+
+    def best_match(self, query: str) -> Tuple[Optional[int], float]:
+        """Return the best scoring doc id and a confidence in [0, 1].
+
+        Confidence is the BM25 score divided by the score an average-length
+        document containing every query term once would get, so unknown query
+        words lower it. Returns ``(None, 0.0)`` when nothing matches.
+        """
+        matches = self.search(query, 1)
+        return matches[0] if matches else (None, 0.0)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Return up to k (doc id, confidence) pairs, best first, ties to the lowest doc id"""
+        started = time.perf_counter()
+        term_ids, ideal_score = self._query_terms(query)
+        tokenized = time.perf_counter()
+        CHAT_STAGE_SECONDS.observe(tokenized - started, stage="tokenize")
+        if not term_ids:
+            return []
+
+        candidates = None
+        if self.lsh is not None:
+            candidates = self.lsh.candidates(term_ids)
+            scanned = time.perf_counter()
+            CHAT_STAGE_SECONDS.observe(scanned - tokenized, stage="candidates")
+            tokenized = scanned
+        if candidates is not None:
+            matches = self._score_candidates(term_ids, candidates.tolist(), k)
+        else:
+            matches = max_score.top_k([self._posting_list(term_id) for term_id in term_ids], k)
+        CHAT_STAGE_SECONDS.observe(time.perf_counter() - tokenized, stage="score")
+        return [(doc_id, min(score / ideal_score, 1.0)) for doc_id, score in matches]
+
+    def best_matches(self, queries: List[str]) -> List[Tuple[Optional[int], float]]:
+        """Return ``best_match`` for each query.
+
+        Each query runs through ``search`` on its own: summing a shared accumulator per
+        batch adds the term weights in a batch-dependent order, so scores (and near ties)
+        could differ from the single-query answer in the last bits. MaxScore per query is
+        also about twice as fast as that accumulator pass on the FAQ dataset.
+        """
+        return [self.best_match(query) for query in queries]
+
+    def top_k(self, terms: Iterable[str], k: int) -> List[Tuple[int, float]]:
+        """Return up to k (doc id, raw BM25 score) pairs for already tokenized terms, best first"""
+        term_ids = {self.vocabulary.get(term) for term in terms} - {None}
+        return max_score.top_k([self._posting_list(term_id) for term_id in term_ids], k)
+
+    def _score_candidates(self, term_ids: List[int], candidates: List[int],
+                          k: int) -> List[Tuple[int, float]]:
+        """Exact BM25 scores restricted to sorted candidate doc ids; returns the top k (doc id, raw score)"""
+        scores = dict.fromkeys(candidates, 0.0)
+        docs, tfs, norms = self.postings_docs, self.postings_tfs, self.doc_norms
+        k1_plus_one = self.k1 + 1
+        for term_id in term_ids:
+            idf = self.idf[term_id]
+            start, end = self.postings_offsets[term_id], self.postings_offsets[term_id + 1]
+            if end - start <= len(candidates):
+                # Short postings list: walk it and keep the candidates
+                for pos in range(start, end):
+                    doc_id = docs[pos]
+                    if doc_id in scores:
+                        tf = tfs[pos]
+                        scores[doc_id] += idf * tf * k1_plus_one / (tf + norms[doc_id])
+            else:
+                # Long postings list (a common term): binary-search each candidate in it
+                for doc_id in candidates:
+                    pos = bisect_left(docs, doc_id, start, end)
+                    if pos < end and docs[pos] == doc_id:
+                        tf = tfs[pos]
+                        scores[doc_id] += idf * tf * k1_plus_one / (tf + norms[doc_id])
+        return heapq.nlargest(k, ((doc_id, score) for doc_id, score in scores.items() if score > 0.0),
+                              key=lambda item: (item[1], -item[0]))
@@ -0,0 +1,89 @@
+"""Aho-Corasick matcher for voice command phrases.
+
+All command phrases are compiled into a single automaton, so matching a
+transcript costs one pass over its characters no matter how many commands
+exist. A phrase only counts when it sits on word boundaries ("car" does not
+match inside "scar"), and the longest matching phrase wins, so
+"car insurance" beats "car". Ties go to the earliest occurrence, then to the
+phrase that comes first in the command table.
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class CommandMatcher:
+    """Multi-pattern matcher with word-boundary, longest-match semantics"""
+
+    def __init__(self, phrases: Iterable[str]):
+        self.phrases: List[str] = []
+        # Per state: outgoing transitions, failure link, pattern ending here, next state with an output
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[int] = [-1]
+        self._output_link: List[int] = [0]
+
+        for phrase in phrases:
+            phrase = phrase.lower().strip()
+            if phrase and phrase not in self.phrases:
+                self._add(phrase, len(self.phrases))
+                self.phrases.append(phrase)
+        self._link()
+
+    def _add(self, phrase: str, pattern_id: int):
+        state = 0
+        for char in phrase:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(-1)
+                self._output_link.append(0)
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] = pattern_id
+
+    def _link(self):
+        """Compute failure and output links breadth-first"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                self._output_link[next_state] = fail if self._output[fail] >= 0 else self._output_link[fail]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, int]]:
+        """Return every word-bounded (start, end, pattern_id) match in text"""
+        text = text.lower()
+        matches = []
+        state = 0
+        last = len(text) - 1
+        for pos, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+
+            if pos < last and text[pos + 1].isalnum():
+                continue  # No phrase can end mid-word
+            match_state = state if self._output[state] >= 0 else self._output_link[state]
+            while match_state:
+                pattern_id = self._output[match_state]
+                start = pos + 1 - len(self.phrases[pattern_id])
+                if start == 0 or not text[start - 1].isalnum():
+                    matches.append((start, pos + 1, pattern_id))
+                match_state = self._output_link[match_state]
+        return matches
+
+    def best_match(self, text: str) -> Optional[str]:
+        """Return the longest word-bounded phrase found in text, or None"""
+        best = None
+        for start, end, pattern_id in self.find_all(text):
+            key = (end - start, -start, -pattern_id)
+            if best is None or key > best[0]:
+                best = (key, pattern_id)
+        return self.phrases[best[1]] if best else None
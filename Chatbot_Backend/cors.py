@@ -0,0 +1,122 @@
+"""Shared CORS layer for the Flask apps and the ASGI entry points.
+
+The allowed-origin rules are compiled once: exact origins go into a set and
+wildcard entries such as ``https://*.vercel.app`` into one anchored regex
+(``*`` matches a single host label sequence, never a path). Per-origin
+decisions and the resulting header lists are memoized, so a request only
+costs a dict lookup.
+
+Browser preflights (``OPTIONS`` with ``Origin`` and
+``Access-Control-Request-Method``) are answered before routing with an empty
+204 that carries ``Access-Control-Max-Age`` (``CORS_MAX_AGE`` seconds,
+default 7200, the most Chromium honours). Browsers then reuse the preflight
+for later requests instead of sending an ``OPTIONS`` before every chat
+message or test command. Stdlib only.
+"""
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+CORS_MAX_AGE = int(os.environ.get("CORS_MAX_AGE", "7200"))
+ORIGIN_CACHE_SIZE = 1024
+
+ALLOW_HEADERS = "Content-Type,Authorization"
+ALLOW_METHODS = "GET,PUT,POST,DELETE,OPTIONS"
+
+HeaderList = List[Tuple[str, str]]
+
+
+def default_allowed_origins(frontend_url: Optional[str]) -> List[str]:
+    """Local development origins, the configured frontend and Vercel deployments"""
+    origins = [
+        "http://localhost:3000",
+        "https://localhost:3000"
+    ]
+    if frontend_url:
+        origins.append(frontend_url.rstrip("/"))
+    origins.append("https://*.vercel.app")
+    return origins
+
+
+def _compile_pattern(origin: str) -> str:
+    """Regex source for a wildcard origin; a trailing path ("/*") never applies to an Origin header"""
+    origin = origin.rstrip("*").rstrip("/") if origin.endswith("/*") else origin.rstrip("/")
+    return re.escape(origin).replace(r"\*", r"[^/:]+")
+
+
+class CorsPolicy:
+    """Compiled allowed-origin rules with memoized response and preflight headers"""
+
+    def __init__(self, allowed_origins: Iterable[str], max_age: int = CORS_MAX_AGE):
+        self.allowed_origins = list(allowed_origins)
+        self.max_age = max_age
+        self.exact = frozenset(origin.rstrip("/") for origin in self.allowed_origins if "*" not in origin)
+        patterns = [_compile_pattern(origin) for origin in self.allowed_origins if "*" in origin]
+        self.pattern = re.compile("|".join(patterns)) if patterns else None
+
+        self._base: HeaderList = [
+            ("Access-Control-Allow-Headers", ALLOW_HEADERS),
+            ("Access-Control-Allow-Methods", ALLOW_METHODS),
+            ("Access-Control-Allow-Credentials", "true"),
+        ]
+        self._headers: Dict[Optional[str], HeaderList] = {}
+        self._preflight: Dict[Optional[str], HeaderList] = {}
+        self._lock = threading.Lock()
+
+    def allows(self, origin: Optional[str]) -> bool:
+        """Whether a request Origin may read responses"""
+        if not origin:
+            return False
+        return origin in self.exact or (self.pattern is not None and self.pattern.fullmatch(origin) is not None)
+
+    def _remember(self, cache: Dict[Optional[str], HeaderList], origin: Optional[str],
+                  headers: HeaderList) -> HeaderList:
+        with self._lock:
+            if len(cache) >= ORIGIN_CACHE_SIZE:
+                cache.clear()  # Arbitrary Origin values must not grow the cache without bound
+            cache[origin] = headers
+        return headers
+
+    def headers(self, origin: Optional[str]) -> HeaderList:
+        """CORS headers for a response to a request from origin"""
+        cached = self._headers.get(origin)
+        if cached is not None:
+            return cached
+        headers = list(self._base)
+        if self.allows(origin):
+            headers.insert(0, ("Access-Control-Allow-Origin", origin))
+        return self._remember(self._headers, origin, headers)
+
+    def preflight_headers(self, origin: Optional[str]) -> HeaderList:
+        """Headers for a preflight answer, including Access-Control-Max-Age"""
+        cached = self._preflight.get(origin)
+        if cached is not None:
+            return cached
+        headers = self.headers(origin) + [("Access-Control-Max-Age", str(self.max_age)), ("Vary", "Origin")]
+        return self._remember(self._preflight, origin, headers)
+
+    @staticmethod
+    def is_preflight(method: str, origin: Optional[str], request_method: Optional[str]) -> bool:
+        """A browser preflight carries Origin and Access-Control-Request-Method"""
+        return method == "OPTIONS" and bool(origin) and bool(request_method)
+
+    def install(self, app) -> None:
+        """Answer preflights before routing and add CORS headers to every Flask response"""
+        from flask import request
+
+        @app.before_request
+        def answer_preflight():
+            origin = request.headers.get("Origin")
+            if self.is_preflight(request.method, origin, request.headers.get("Access-Control-Request-Method")):
+                response = app.response_class(status=204, headers=self.preflight_headers(origin))
+                del response.headers["Content-Type"]  # An empty 204 has no media type
+                return response
+            return None
+
+        @app.after_request
+        def add_cors_headers(response):
+            for name, value in self.headers(request.headers.get("Origin")):
+                response.headers[name] = value
+            response.vary.add("Origin")
+            return response
@@ -0,0 +1,257 @@
+"""Pool of warm, long-lived audio decoder processes.
+
+Decoding through pydub forks an ffmpeg process for every upload, and under
+load process spawning dominates /voice-command latency. The pool keeps a few
+worker processes alive that decode in-process with PyAV (libav bindings), so
+a job costs one pipe round-trip instead of an ffmpeg spawn. Workers fall back
+to the pydub path only for clips PyAV cannot handle. Without PyAV a worker
+would still spawn ffmpeg per clip, so the pool is not started at all: clips
+are decoded in the request thread and a warning is logged.
+
+The pool has a bounded number of slots (running + queued jobs), a per-job
+timeout after which the stuck worker is killed and replaced, and restarts
+workers that crash; a job whose worker turns out to be dead (even one that
+died while idle) is retried once on its replacement. Workers are started lazily on first use with the
+``spawn`` start method, so they never inherit the web worker's threads.
+"""
+import atexit
+import io
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import wave
+from typing import Any, Dict, Optional
+
+from audio_pipeline import is_pcm16_wav, to_pcm16_wav
+
+try:
+    import av
+except ImportError:  # PyAV is optional; without it the pool is disabled
+    av = None
+
+logger = logging.getLogger(__name__)
+
+DECODER_WORKERS = int(os.environ.get("DECODER_WORKERS", "2"))
+DECODER_QUEUE_SIZE = int(os.environ.get("DECODER_QUEUE_SIZE", "8"))
+DECODER_TIMEOUT_SECONDS = float(os.environ.get("DECODER_TIMEOUT", "10"))
+
+
+class DecoderError(Exception):
+    """Raised when a clip cannot be decoded"""
+
+
+class DecoderBusy(DecoderError):
+    """Raised when every worker is busy and the wait queue is full"""
+
+
+class DecoderTimeout(DecoderError):
+    """Raised when a job does not finish within its timeout"""
+
+
+def _decode_with_av(data: bytes) -> bytes:
+    """Decode any libav-supported clip to mono 16-bit PCM WAV bytes"""
+    pcm = bytearray()
+    with av.open(io.BytesIO(data)) as container:
+        stream = container.streams.audio[0]
+        rate = stream.rate
+        resampler = av.AudioResampler(format="s16", layout="mono", rate=rate)
+        for frame in container.decode(stream):
+            for out in resampler.resample(frame):
+                pcm += bytes(out.planes[0])[:out.samples * 2]
+        for out in resampler.resample(None):
+            pcm += bytes(out.planes[0])[:out.samples * 2]
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(bytes(pcm))
+    return buffer.getvalue()
+
+
+def decode_clip(data: bytes, file_ext: str) -> bytes:
+    """Decode an uploaded clip to 16-bit PCM WAV bytes (runs inside a worker)"""
+    if av is not None:
+        try:
+            return _decode_with_av(data)
+        except (av.error.FFmpegError, IndexError, ValueError):
+            pass  # Let ffmpeg have a go (IndexError: no audio stream found)
+    return to_pcm16_wav(data, file_ext).getvalue()
+
+
+def _worker_main(conn):
+    """Worker loop: receive (data, ext) jobs and reply with (ok, payload)"""
+    while True:
+        try:
+            data, file_ext = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send((True, decode_clip(data, file_ext)))
+        except Exception as e:
+            conn.send((False, str(e)))
+
+
+class _Worker:
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self):
+        self.conn.close()
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=1)
+
+
+class DecoderPool:
+    """Bounded pool of decoder processes with per-job timeouts and restart-on-crash"""
+
+    def __init__(self, workers: int = DECODER_WORKERS, queue_size: int = DECODER_QUEUE_SIZE,
+                 timeout: float = DECODER_TIMEOUT_SECONDS):
+        if workers > 0 and av is None:
+            logger.warning("PyAV is not installed, decoding voice uploads in the request thread "
+                           "(the decoder pool needs PyAV to avoid an ffmpeg process per clip)")
+            workers = 0
+        self.size = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = threading.BoundedSemaphore(workers + queue_size) if workers > 0 else None
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._started = False
+        self.waiting = 0
+        self.jobs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.rejected = 0
+
+    def _ensure_started(self):
+        if self._started:
+            return
+        with self._lock:
+            if not self._started:
+                for _ in range(self.size):
+                    worker = _Worker(self._context)
+                    self._workers.append(worker)
+                    self._idle.put(worker)
+                atexit.register(self.close)
+                self._started = True
+
+    def _restart(self, worker: _Worker) -> Optional[_Worker]:
+        """Replace a dead or stuck worker; None once close() has emptied the pool"""
+        worker.stop()
+        with self._lock:
+            if worker not in self._workers:
+                return None
+        replacement = _Worker(self._context)
+        with self._lock:
+            closed = worker not in self._workers
+            if not closed:
+                self._workers[self._workers.index(worker)] = replacement
+                self.restarts += 1
+        if closed:
+            replacement.stop()
+            return None
+        return replacement
+
+    def _release(self, worker: Optional[_Worker]):
+        """Hand a worker back to the idle queue, unless the pool was closed meanwhile"""
+        if worker is None:
+            return
+        with self._lock:
+            if worker in self._workers:
+                self._idle.put(worker)
+                return
+        worker.stop()
+
+    def decode(self, data: bytes, file_ext: str, timeout: Optional[float] = None) -> io.BytesIO:
+        """Return a 16-bit PCM WAV buffer for an uploaded clip"""
+        if is_pcm16_wav(data):
+            return io.BytesIO(data)
+        if self._slots is None:
+            return to_pcm16_wav(data, file_ext)  # Pool disabled: decode in the request thread
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise DecoderBusy("All audio decoders are busy")
+
+        try:
+            self._ensure_started()
+            deadline = time.monotonic() + (timeout or self.timeout)
+            with self._lock:
+                self.waiting += 1
+            try:
+                worker = self._idle.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                with self._lock:
+                    self.timeouts += 1
+                raise DecoderTimeout("Timed out waiting for an audio decoder")
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+
+            try:
+                for attempt in range(2):
+                    try:
+                        worker.conn.send((data, file_ext))
+                        if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                            with self._lock:
+                                self.timeouts += 1
+                            worker = self._restart(worker)
+                            raise DecoderTimeout("Audio decoding timed out")
+                        ok, payload = worker.conn.recv()
+                        break
+                    except (EOFError, OSError) as e:
+                        # The worker died, possibly while idle: replace it and retry the job once
+                        worker = self._restart(worker)
+                        if worker is None:
+                            raise DecoderError("Audio decoder pool is closed")
+                        if attempt:
+                            raise DecoderError(f"Audio decoder crashed: {e}")
+            finally:
+                self._release(worker)
+
+            with self._lock:
+                self.jobs += 1
+                if not ok:
+                    self.failures += 1
+            if not ok:
+                raise DecoderError(payload)
+            return io.BytesIO(payload)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        with self._lock:
+            return {
+                "workers": self.size,
+                "alive": sum(worker.process.is_alive() for worker in self._workers),
+                "engine": "pyav" if self.size else "ffmpeg",
+                "waiting": self.waiting,
+                "jobs": self.jobs,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "rejected": self.rejected,
+            }
+
+    def close(self):
+        """Stop every worker process"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._started = False
+            while not self._idle.empty():
+                self._idle.get_nowait()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,179 @@
+"""Build-time consolidation of duplicate and near-duplicate FAQ questions.
+
+The dataset repeats questions: the same text several times, or variants that
+differ only in articles, quoting or punctuation ("What is a pet insurance?" /
+"What is 'pet insurance'?"). Indexed separately, each copy adds postings and
+scoring work, and ties always go to the first copy anyway. Every loader
+therefore runs the rows through ``consolidate`` before indexing.
+
+Each question is reduced by the shared ``analyzer`` to a set of shingles
+(its terms and adjacent term pairs). Negations ("no", "not", "nor",
+"don't") are stop words for matching but kept here, and rows only merge
+when they use the same negations, so "is flood damage covered" and "is
+flood damage not covered" stay apart. Rows with identical analyzed terms are
+exact duplicates. Otherwise a row joins an earlier entry when the Jaccard
+similarity of their shingle sets reaches ``FAQ_DEDUP_THRESHOLD`` (default
+0.8). Word order matters through the pairs, so "event cancellation" and
+"cancellation of events" stay apart. Candidates come from a prefix-filtered
+inverted index over the rarest shingles, so only rows that can reach the
+threshold are compared. Clusters are anchored on their first row, whose
+answer they keep, and never chain through other members.
+
+An entry's question is its first row's text plus the terms only its variants
+have, so every wording still matches and repeated terms are not counted
+twice. ``FAQ_DEDUP=0`` keeps one entry per row. Prebuilt index artifacts
+record ``dedup_settings()`` and are rebuilt when they change; bump
+``DEDUP_VERSION`` when the rules here change.
+"""
+import logging
+import math
+import os
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+from analyzer import normalize_word, split_words
+
+logger = logging.getLogger(__name__)
+
+DEDUP_ENABLED = os.environ.get("FAQ_DEDUP", "1") != "0"
+DEDUP_THRESHOLD = float(os.environ.get("FAQ_DEDUP_THRESHOLD", "0.8"))
+DEDUP_VERSION = 2
+NEGATIONS = frozenset({"no", "not", "nor", "dont"})  # Stop words that flip a question's meaning
+REPORT_EXAMPLES = 5
+
+
+class FAQEntries(NamedTuple):
+    questions: List[str]
+    answers: List[str]
+    entry_of_row: List[int]
+    summary: Dict
+
+
+def dedup_settings(enabled: bool = DEDUP_ENABLED, threshold: float = DEDUP_THRESHOLD) -> Dict[str, Any]:
+    """Settings that decide how rows are consolidated (stored in and checked against index artifacts)"""
+    return {"version": DEDUP_VERSION, "enabled": enabled, "threshold": threshold if enabled else None}
+
+
+def dedup_terms(text: str) -> List[str]:
+    """Analyzed terms of a question, with negations kept"""
+    terms = []
+    for word in split_words(text):
+        term = word if word in NEGATIONS else normalize_word(word)
+        if term is not None:
+            terms.append(term)
+    return terms
+
+
+def shingles(terms: Sequence[str]) -> frozenset:
+    """Terms and adjacent term pairs of an analyzed question"""
+    return frozenset(terms) | frozenset(f"{a} {b}" for a, b in zip(terms, terms[1:]))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    overlap = len(a & b)
+    return overlap / (len(a) + len(b) - overlap) if a or b else 1.0
+
+
+def _prefix_length(size: int, threshold: float) -> int:
+    """Rarest shingles two sets must share one of to possibly reach the threshold"""
+    return size - math.ceil(threshold * size - 1e-9) + 1
+
+
+def consolidate(questions: Sequence[str], answers: Sequence[str],
+                threshold: float = DEDUP_THRESHOLD, enabled: bool = DEDUP_ENABLED) -> FAQEntries:
+    """Collapse duplicate and near-duplicate questions into one entry each"""
+    if not enabled:
+        summary = {"rows": len(questions), "entries": len(questions), "exact_duplicates": 0,
+                   "near_duplicates": 0, "differing_answers": 0, "threshold": None}
+        return FAQEntries(list(questions), list(answers), list(range(len(questions))), summary)
+
+    analyzed = [dedup_terms(question) for question in questions]
+    negations = [NEGATIONS.intersection(terms) for terms in analyzed]
+
+    # Exact duplicates: identical analyzed terms (case, punctuation and stop words aside)
+    first_row: Dict[Tuple[str, ...], int] = {}
+    unique_rows: List[int] = []
+    leader_of_row = list(range(len(questions)))
+    for row, terms in enumerate(analyzed):
+        key = tuple(terms)
+        if key and key in first_row:  # Questions made only of stop words say nothing about each other
+            leader_of_row[row] = first_row[key]
+        else:
+            first_row[key] = row
+            unique_rows.append(row)
+    exact = len(questions) - len(unique_rows)
+
+    # Near duplicates: compare each distinct question only with earlier leaders sharing a rare shingle
+    sets = {row: shingles(analyzed[row]) for row in unique_rows}
+    frequency: Dict[str, int] = {}
+    for shingle_set in sets.values():
+        for shingle in shingle_set:
+            frequency[shingle] = frequency.get(shingle, 0) + 1
+    # Global order, rarest first: prefixes then hold the most selective shingles
+    rank = {shingle: position for position, shingle in
+            enumerate(sorted(frequency, key=lambda shingle: (frequency[shingle], shingle)))}
+    leaders: List[int] = []
+    prefix_index: Dict[str, List[int]] = {}
+    near = 0
+    examples = []
+    for row in unique_rows:
+        shingle_set = sets[row]
+        if shingle_set:
+            ordered = sorted(shingle_set, key=rank.__getitem__)
+            prefix = ordered[:_prefix_length(len(ordered), threshold)]
+            best, best_similarity = None, 0.0
+            smallest, largest = threshold * len(shingle_set), len(shingle_set) / threshold
+            for candidate in sorted({leader for shingle in prefix for leader in prefix_index.get(shingle, ())}):
+                candidate_set = sets[candidate]
+                if not smallest <= len(candidate_set) <= largest:
+                    continue  # Sizes alone rule out reaching the threshold
+                if negations[candidate] != negations[row]:
+                    continue  # One question negates what the other asks
+                similarity = jaccard(shingle_set, candidate_set)
+                if similarity >= threshold and similarity > best_similarity:  # Ties go to the earliest entry
+                    best, best_similarity = candidate, similarity
+            if best is not None:
+                leader_of_row[row] = best
+                near += 1
+                if len(examples) < REPORT_EXAMPLES:
+                    examples.append([questions[best], questions[row]])
+                continue
+            for shingle in prefix:
+                prefix_index.setdefault(shingle, []).append(row)
+        leaders.append(row)
+
+    # Point exact duplicates of a merged question at its leader too
+    for row in range(len(questions)):
+        leader_of_row[row] = leader_of_row[leader_of_row[row]]
+
+    entry_of_leader = {leader: entry for entry, leader in enumerate(leaders)}
+    entry_of_row = [entry_of_leader[leader_of_row[row]] for row in range(len(questions))]
+    merged_questions = [questions[leader] for leader in leaders]
+    known_terms = [set(analyzed[leader]) for leader in leaders]
+    differing_answers = 0
+    for row, entry in enumerate(entry_of_row):
+        leader = leaders[entry]
+        if row == leader:
+            continue
+        if answers[row] != answers[leader]:
+            differing_answers += 1
+        extra = [term for term in analyzed[row] if term not in known_terms[entry]]
+        if extra:
+            # Analyzed terms re-analyze to themselves, so appending them indexes exactly these terms
+            merged_questions[entry] += " " + " ".join(extra)
+            known_terms[entry].update(extra)
+
+    summary = {
+        "rows": len(questions),
+        "entries": len(leaders),
+        "exact_duplicates": exact,
+        "near_duplicates": near,
+        "differing_answers": differing_answers,
+        "threshold": threshold,
+    }
+    if len(leaders) < len(questions):
+        logger.info(f"Consolidated {len(questions)} FAQ rows into {len(leaders)} entries "
+                    f"({exact} exact and {near} near duplicates, {differing_answers} with a different answer "
+                    f"kept under the first row's)")
+        for kept, merged in examples:
+            logger.info(f"Near-duplicate FAQ question {merged!r} merged into {kept!r}")
+    return FAQEntries(merged_questions, [answers[leader] for leader in leaders], entry_of_row, summary)
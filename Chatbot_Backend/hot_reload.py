@@ -0,0 +1,122 @@
+"""Hot reload of the FAQ dataset with an atomic chatbot swap.
+
+The reloader owns the active chatbot. When the dataset file changes (polled
+every ``FAQ_RELOAD_INTERVAL`` seconds) or an admin asks for it, a replacement
+is built on a background thread and swapped in with a single reference
+assignment. Requests keep using whichever instance they picked up, so they
+never wait on a rebuild.
+
+Each gunicorn worker has its own reloader; the file watcher reloads all of
+them, while the admin endpoint only reaches the worker that served it.
+"""
+import hmac
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from answer_cache import dataset_version
+
+logger = logging.getLogger(__name__)
+
+RELOAD_INTERVAL_SECONDS = float(os.environ.get("FAQ_RELOAD_INTERVAL", "5"))
+# Chatbots holding worker processes (sharded mode) are closed this long after being replaced
+RETIRE_GRACE_SECONDS = 30.0
+ADMIN_TOKEN = os.environ.get("CHATBOT_ADMIN_TOKEN")
+
+
+def is_admin_authorized(auth_header: Optional[str]) -> bool:
+    """Check an ``Authorization: Bearer <token>`` header against CHATBOT_ADMIN_TOKEN"""
+    if not ADMIN_TOKEN or not auth_header or not auth_header.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(auth_header[len("Bearer "):], ADMIN_TOKEN)
+
+
+class ChatbotReloader:
+    """Hold the active chatbot and rebuild it in the background when the dataset changes"""
+
+    def __init__(self, factory: Callable[[], Any], csv_path: str,
+                 poll_interval: float = RELOAD_INTERVAL_SECONDS):
+        self._factory = factory
+        self.csv_path = csv_path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._building = False
+        self._stop = threading.Event()
+        self.version = 0
+        self.last_error: Optional[str] = None
+
+        # The first build is synchronous so the service never starts without an index
+        self._dataset_version = dataset_version(csv_path)
+        started = time.perf_counter()
+        self.current = factory()
+        self._record_build(started)
+
+        if poll_interval > 0:
+            threading.Thread(target=self._watch, name="faq-dataset-watcher", daemon=True).start()
+
+    def _record_build(self, started: float):
+        self.build_seconds = time.perf_counter() - started
+        self.loaded_at = time.time()
+        self.version += 1
+
+    def reload(self) -> bool:
+        """Start a background rebuild; returns False if one is already running"""
+        with self._lock:
+            if self._building:
+                return False
+            self._building = True
+        threading.Thread(target=self._reload, name="faq-index-reload", daemon=True).start()
+        return True
+
+    def _reload(self):
+        try:
+            self._dataset_version = dataset_version(self.csv_path)
+            started = time.perf_counter()
+            chatbot = self._factory()
+            previous = self.current
+            # Single reference assignment: in-flight requests keep the old instance
+            self.current = chatbot
+            if hasattr(previous, "close"):
+                retire = threading.Timer(RETIRE_GRACE_SECONDS, previous.close)
+                retire.daemon = True
+                retire.start()
+            self._record_build(started)
+            self.last_error = None
+            logger.info(f"Reloaded FAQ index v{self.version} in {self.build_seconds:.2f}s")
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"FAQ index reload failed, keeping v{self.version}: {str(e)}")
+        finally:
+            with self._lock:
+                self._building = False
+
+    def _watch(self):
+        """Poll the dataset fingerprint and reload when it changes"""
+        while not self._stop.wait(self.poll_interval):
+            try:
+                changed = dataset_version(self.csv_path) != self._dataset_version
+            except OSError:
+                continue  # The file is being replaced; check again next tick
+            if changed:
+                logger.info(f"{self.csv_path} changed, rebuilding the FAQ index")
+                self.reload()
+
+    def stop(self):
+        """Stop the file watcher"""
+        self._stop.set()
+
+    def status(self) -> Dict[str, Any]:
+        """Return the active index version and build timings"""
+        return {
+            "version": self.version,
+            "build_seconds": round(self.build_seconds, 4),
+            "loaded_at": self.loaded_at,
+            "building": self._building,
+            "dataset": self.csv_path,
+            "watch_interval_seconds": self.poll_interval,
+            "last_error": self.last_error,
+            "shards": self.current.stats() if hasattr(self.current, "stats") else None,
+            "consolidation": getattr(self.current, "consolidation", None),
+        }
@@ -0,0 +1,356 @@
+"""Prebuilt, memory-mapped FAQ index artifact.
+
+Building the index (CSV parsing, tokenizing, fitting TF-IDF) used to happen at
+import time in every gunicorn worker. This module compiles the dataset once
+into a versioned binary file and maps it read-only, so workers start quickly
+and share the index pages through the OS page cache.
+
+Build it as part of the deploy step::
+
+    python index_artifact.py insurance_dataset.csv insurance_index.bin
+
+File layout (little-endian)::
+
+    header   magic (8s) | format version (I) | section count (I)
+    toc      per section: name (32s) | typecode (4s) | offset (Q) | count (Q)
+    data     sections aligned to 8 bytes, each an array of ``typecode`` items
+
+Sections are plain arrays: the BM25 postings in CSR layout, the term-major
+TF-IDF matrix, UTF-8 string blobs with offset arrays for the vocabularies,
+answers and pre-serialized responses, and a JSON ``meta`` blob. The TF-IDF
+sections are only written when scikit-learn is installed; numpy/scipy are
+imported lazily so the ultra-simple deployment can load the BM25 part with
+the standard library. Duplicate questions are consolidated before indexing
+(see ``dedup``), so document ids are entry ids and ``meta`` records what was
+collapsed and with which settings; an artifact built with other ``FAQ_DEDUP``
+settings is rebuilt like one for another dataset.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from analyzer import ANALYZER_VERSION, analyze
+from bm25_index import BM25Index
+from dedup import FAQEntries, consolidate, dedup_settings
+from response_table import ResponseTable
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"FAQIDX\0\0"
+FORMAT_VERSION = 4
+HEADER = struct.Struct("<8sII")
+TOC_ENTRY = struct.Struct("<32s4sQQ")
+ALIGNMENT = 8
+
+DEFAULT_INDEX_PATH = os.environ.get("FAQ_INDEX_PATH", "insurance_index.bin")
+
+# Shared with FAQChatBot so a loaded vectorizer matches a freshly fitted one; terms come from
+# the shared analyzer so TF-IDF indexes the same terms as the keyword engines
+TFIDF_PARAMS = {"analyzer": analyze}
+
+ITEM_SIZES = {"B": 1, "H": 2, "I": 4, "i": 4, "q": 8, "d": 8}
+
+
+def dataset_checksum(csv_path: str) -> str:
+    """Return the SHA-256 of the dataset file, used to detect stale artifacts"""
+    digest = hashlib.sha256()
+    with open(csv_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_faq_rows(csv_path: str) -> Tuple[List[str], List[str]]:
+    """Load (questions, answers) using the same rules as the chatbot loaders"""
+    questions, answers = [], []
+    with open(csv_path, "r", encoding="utf-8") as file:
+        for row in csv.DictReader(file):
+            if row.get("Question") and row.get("Answer"):
+                questions.append(row["Question"].strip().lower())
+                answers.append(row["Answer"].strip())
+    if not questions:
+        raise ValueError("No valid FAQ data found")
+    return questions, answers
+
+
+def load_faq_entries(csv_path: str) -> FAQEntries:
+    """Load the dataset with duplicate questions consolidated into one entry each"""
+    return consolidate(*load_faq_rows(csv_path))
+
+
+def _string_sections(name: str, strings: Sequence[str]) -> List[Tuple[str, str, bytes]]:
+    """Encode strings as a UTF-8 blob plus an offsets array"""
+    offsets = array("I", [0])
+    blob = bytearray()
+    for value in strings:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    return [(f"{name}.offsets", "I", offsets.tobytes()), (f"{name}.blob", "B", bytes(blob))]
+
+
+def _numpy_section(name: str, values) -> Tuple[str, str, bytes]:
+    import numpy as np
+
+    if values.dtype == np.float64:
+        typecode = "d"
+    elif np.issubdtype(values.dtype, np.integer):
+        fits = not len(values) or int(values.max()) < 2 ** 31
+        values = values.astype(np.int32 if fits else np.int64, copy=False)
+        typecode = "i" if fits else "q"
+    else:
+        raise TypeError(f"Unsupported dtype for section {name}: {values.dtype}")
+    return name, typecode, values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes()
+
+
+def _bm25_sections(index: BM25Index) -> List[Tuple[str, str, bytes]]:
+    terms = sorted(index.vocabulary, key=index.vocabulary.get)
+    return _string_sections("bm25.vocab", terms) + [
+        ("bm25.offsets", "I", index.postings_offsets.tobytes()),
+        ("bm25.docs", "I", index.postings_docs.tobytes()),
+        ("bm25.tfs", "H", index.postings_tfs.tobytes()),
+        ("bm25.idf", "d", index.idf.tobytes()),
+        ("bm25.doclens", "I", index.doc_lengths.tobytes()),
+        ("bm25.docnorms", "d", index.doc_norms.tobytes()),
+    ]
+
+
+def _tfidf_sections(questions: List[str]) -> List[Tuple[str, str, bytes]]:
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.preprocessing import normalize
+
+    vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+    term_doc_matrix = normalize(vectorizer.fit_transform(questions), norm="l2", copy=False).T.tocsr()
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    return _tfidf_matrix_sections(terms, vectorizer.idf_, term_doc_matrix)
+
+
+def _tfidf_matrix_sections(terms: Sequence[str], idf, term_doc_matrix) -> List[Tuple[str, str, bytes]]:
+    return _string_sections("tfidf.vocab", terms) + [
+        _numpy_section("tfidf.idf", idf),
+        _numpy_section("tfidf.indptr", term_doc_matrix.indptr),
+        _numpy_section("tfidf.indices", term_doc_matrix.indices),
+        _numpy_section("tfidf.data", term_doc_matrix.data),
+    ]
+
+
+def write_artifact(path: str, sections: List[Tuple[str, str, bytes]]):
+    """Write sections to ``path`` atomically (write to a temp file, then rename)"""
+    header_size = HEADER.size + TOC_ENTRY.size * len(sections)
+    offset = -(-header_size // ALIGNMENT) * ALIGNMENT
+    toc = []
+    for name, typecode, payload in sections:
+        if len(name) > 32:
+            raise ValueError(f"Section name too long: {name}")
+        toc.append(TOC_ENTRY.pack(name.encode("ascii"), typecode.encode("ascii"),
+                                  offset, len(payload) // ITEM_SIZES[typecode]))
+        offset += -(-len(payload) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(sections)))
+        file.write(b"".join(toc))
+        for _, _, payload in sections:
+            file.write(b"\0" * (-file.tell() % ALIGNMENT))
+            file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def build_artifact(csv_path: str, index_path: str, include_tfidf: bool = True) -> Dict:
+    """Compile the dataset into an index artifact and return its metadata"""
+    started = time.perf_counter()
+    entries = load_faq_entries(csv_path)
+    questions, answers = entries.questions, entries.answers
+    bm25 = BM25Index(questions)
+
+    sections = _string_sections("answers", answers) + ResponseTable.from_answers(answers).sections()
+    sections += _bm25_sections(bm25)
+    engines = ["bm25"]
+    if include_tfidf:
+        try:
+            sections += _tfidf_sections(questions)
+            engines.append("tfidf")
+        except ImportError:
+            logger.warning("scikit-learn not installed, building the artifact without TF-IDF sections")
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "analyzer_version": ANALYZER_VERSION,
+        "dataset_sha256": dataset_checksum(csv_path),
+        "num_docs": len(answers),
+        "consolidation": entries.summary,
+        "dedup": dedup_settings(),
+        "engines": engines,
+        "bm25": {"k1": bm25.k1, "b": bm25.b},
+        "built_at": time.time(),
+    }
+    sections.append(("meta", "B", json.dumps(meta).encode("utf-8")))
+    write_artifact(index_path, sections)
+    logger.info(f"Built {index_path} ({os.path.getsize(index_path)} bytes, {len(answers)} entries, "
+                f"engines: {', '.join(engines)}) in {time.perf_counter() - started:.2f}s")
+    return meta
+
+
+def write_shard_artifact(index_path: str, num_docs: int, bm25: Optional[BM25Index] = None,
+                         tfidf: Optional[Tuple[Sequence[str], object, object]] = None):
+    """Write one shard's index (no answers) so worker processes can map it read-only.
+
+    ``tfidf`` is (terms, idf, term-major matrix) over the corpus-wide vocabulary.
+    """
+    sections = []
+    engines = []
+    meta = {"format_version": FORMAT_VERSION, "analyzer_version": ANALYZER_VERSION, "num_docs": num_docs,
+            "built_at": time.time()}
+    if bm25 is not None:
+        sections += _bm25_sections(bm25)
+        engines.append("bm25")
+        meta["bm25"] = {"k1": bm25.k1, "b": bm25.b}
+    if tfidf is not None:
+        sections += _tfidf_matrix_sections(*tfidf)
+        engines.append("tfidf")
+    meta["engines"] = engines
+    sections.append(("meta", "B", json.dumps(meta).encode("utf-8")))
+    write_artifact(index_path, sections)
+
+
+class StringTable:
+    """Read-only sequence of strings decoded lazily from a UTF-8 blob"""
+
+    def __init__(self, offsets: memoryview, blob: memoryview):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, idx: int) -> str:
+        return str(self._blob[self._offsets[idx]:self._offsets[idx + 1]], "utf-8")
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class IndexArtifact:
+    """Read-only, memory-mapped view of an index artifact"""
+
+    def __init__(self, path: str):
+        if sys.byteorder != "little":
+            raise ValueError("Index artifacts can only be mapped on little-endian hosts")
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, version, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an index artifact")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{path} has format version {version}, expected {FORMAT_VERSION}")
+
+        self._sections: Dict[str, Tuple[str, int, int]] = {}
+        for idx in range(count):
+            name, typecode, offset, length = TOC_ENTRY.unpack_from(self._mmap, HEADER.size + idx * TOC_ENTRY.size)
+            self._sections[name.rstrip(b"\0").decode("ascii")] = (typecode.rstrip(b"\0").decode("ascii"), offset, length)
+        self.meta = json.loads(bytes(self.section("meta")))
+
+    def has_section(self, name: str) -> bool:
+        return name in self._sections
+
+    def section(self, name: str) -> memoryview:
+        """Return a zero-copy typed view over a section"""
+        typecode, offset, length = self._sections[name]
+        return self._buffer[offset:offset + length * ITEM_SIZES[typecode]].cast(typecode)
+
+    def numpy_section(self, name: str):
+        """Return a zero-copy, read-only numpy array over a section"""
+        import numpy as np
+
+        typecode, offset, length = self._sections[name]
+        return np.frombuffer(self._mmap, dtype=np.dtype(typecode).newbyteorder("<"), count=length, offset=offset)
+
+    def strings(self, name: str) -> StringTable:
+        return StringTable(self.section(f"{name}.offsets"), self.section(f"{name}.blob"))
+
+    def answers(self) -> StringTable:
+        return self.strings("answers")
+
+    def response_table(self) -> ResponseTable:
+        return ResponseTable(self.section("responses.offsets"), self.section("responses.blob"),
+                             self.section("responses.kinds"))
+
+    def bm25_index(self) -> BM25Index:
+        """Rebuild the BM25 index over the mapped postings"""
+        params = self.meta["bm25"]
+        return BM25Index.from_arrays(
+            self.strings("bm25.vocab"),
+            self.section("bm25.offsets"),
+            self.section("bm25.docs"),
+            self.section("bm25.tfs"),
+            self.section("bm25.idf"),
+            self.section("bm25.doclens"),
+            self.section("bm25.docnorms"),
+            k1=params["k1"],
+            b=params["b"],
+        )
+
+    def tfidf_model(self):
+        """Return a fitted TfidfVectorizer and the mapped term-major matrix"""
+        from scipy.sparse import csr_matrix
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(**TFIDF_PARAMS)
+        vectorizer.vocabulary_ = {term: col for col, term in enumerate(self.strings("tfidf.vocab"))}
+        vectorizer.idf_ = self.numpy_section("tfidf.idf")
+        term_doc_matrix = csr_matrix(
+            (self.numpy_section("tfidf.data"), self.numpy_section("tfidf.indices"), self.numpy_section("tfidf.indptr")),
+            shape=(len(vectorizer.vocabulary_), self.meta["num_docs"]),
+            copy=False,
+        )
+        return vectorizer, term_doc_matrix
+
+
+def load_artifact(index_path: str, csv_path: str, engine: str) -> Optional[IndexArtifact]:
+    """Map the artifact if it exists, is current for the dataset and contains ``engine``.
+
+    Returns None (so callers fall back to building from the CSV) otherwise.
+    """
+    if not index_path or not os.path.exists(index_path):
+        return None
+    try:
+        artifact = IndexArtifact(index_path)
+        if artifact.meta["dataset_sha256"] != dataset_checksum(csv_path):
+            logger.warning(f"{index_path} is stale for {csv_path}, rebuilding the index in process")
+            return None
+        if artifact.meta.get("analyzer_version") != ANALYZER_VERSION:
+            logger.warning(f"{index_path} was built with another text analyzer, rebuilding the index in process")
+            return None
+        if artifact.meta.get("dedup") != dedup_settings():
+            logger.warning(f"{index_path} was built with other FAQ_DEDUP settings, rebuilding the index in process")
+            return None
+        if engine not in artifact.meta["engines"]:
+            logger.warning(f"{index_path} has no {engine} sections, rebuilding the index in process")
+            return None
+        logger.info(f"Mapped index artifact {index_path} ({artifact.meta['num_docs']} entries)")
+        return artifact
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Could not load index artifact {index_path}: {str(e)}")
+        return None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Compile the FAQ dataset into a memory-mappable index artifact")
+    parser.add_argument("csv_path", nargs="?", default="insurance_dataset.csv")
+    parser.add_argument("index_path", nargs="?", default=DEFAULT_INDEX_PATH)
+    parser.add_argument("--no-tfidf", action="store_true", help="only build the BM25 sections")
+    args = parser.parse_args()
+    build_artifact(args.csv_path, args.index_path, include_tfidf=not args.no_tfidf)
@@ -0,0 +1,144 @@
+"""MinHash LSH candidate generation for large FAQ corpora.
+
+Common words ("insurance", "policy", ...) occur in most questions, so
+term-at-a-time scoring degrades to a full scan as the corpus grows. Above
+``FAQ_LSH_MIN_DOCS`` documents the engines first ask this index for a small
+candidate set and rescore only those documents exactly.
+
+Each document is reduced to the set of its indexed terms; terms in more than
+``FAQ_LSH_MAX_DF`` of the documents are left out, since they say little
+about which question was asked. ``FAQ_LSH_BANDS`` x ``FAQ_LSH_ROWS`` MinHash
+values are computed per document and every band of ``rows`` values is hashed
+into a bucket key. A query's candidates are the documents sharing at least
+one bucket with it, ranked by how many bands they share (an estimate of
+Jaccard similarity) and capped at ``FAQ_LSH_MAX_CANDIDATES``.
+
+Tuning: more bands or fewer rows raise recall and candidate counts; a lower
+cap bounds per-query cost. Buckets take ``8 * bands`` bytes per document.
+Queries made only of unindexed terms, or colliding with nothing, return None
+so the caller falls back to exact scoring.
+"""
+import logging
+import os
+from typing import Optional, Sequence
+
+from metrics import Histogram
+
+try:
+    import numpy as np
+except ImportError:  # The ultra-simple deployment ships without numpy; exact scoring only
+    np = None
+
+logger = logging.getLogger(__name__)
+
+LSH_MIN_DOCS = int(os.environ.get("FAQ_LSH_MIN_DOCS", "50000"))
+LSH_BANDS = int(os.environ.get("FAQ_LSH_BANDS", "20"))
+LSH_ROWS = int(os.environ.get("FAQ_LSH_ROWS", "2"))
+LSH_MAX_DF = float(os.environ.get("FAQ_LSH_MAX_DF", "0.05"))
+LSH_MAX_CANDIDATES = int(os.environ.get("FAQ_LSH_MAX_CANDIDATES", "2000"))
+LSH_SEED = 20240601
+
+PRIME = (1 << 31) - 1  # Hash family (a * x + b) mod PRIME keeps products within int64
+
+LSH_CANDIDATES = Histogram("chat_lsh_candidates", "Documents rescored per LSH query",
+                           buckets=(0, 10, 100, 1000, 10000, 100000))
+
+
+class MinHashLSH:
+    """Banded MinHash index mapping a query's terms to candidate document ids"""
+
+    def __init__(self, postings_offsets: Sequence[int], postings_docs: Sequence[int], num_docs: int,
+                 bands: int = LSH_BANDS, rows: int = LSH_ROWS, max_df: float = LSH_MAX_DF,
+                 max_candidates: int = LSH_MAX_CANDIDATES, seed: int = LSH_SEED):
+        self.bands = bands
+        self.rows = rows
+        self.max_candidates = max_candidates
+        self.num_docs = num_docs
+
+        rng = np.random.default_rng(seed)
+        num_perm = bands * rows
+        self._a = rng.integers(1, PRIME, num_perm, dtype=np.int64)
+        self._b = rng.integers(0, PRIME, num_perm, dtype=np.int64)
+        self._mix = rng.integers(1, 1 << 63, rows, dtype=np.uint64) | np.uint64(1)
+
+        offsets = np.asarray(postings_offsets, dtype=np.int64)
+        docs = np.asarray(postings_docs, dtype=np.int64)
+        doc_freq = np.diff(offsets)
+        self.indexed = doc_freq <= max(max_df * num_docs, 1)
+        self.indexed_terms = int(self.indexed.sum())
+
+        # Invert the postings into per-document lists of indexed terms
+        terms = np.repeat(np.arange(len(doc_freq), dtype=np.int64), doc_freq)
+        keep = self.indexed[terms]
+        terms, docs = terms[keep], docs[keep]
+        order = np.argsort(docs, kind="stable")
+        terms, docs = terms[order], docs[order]
+        self.doc_ids, starts = np.unique(docs, return_index=True)
+
+        self._keys = []
+        self._docs = []
+        for band in range(bands):
+            signature = np.empty((len(self.doc_ids), rows), dtype=np.int64)
+            for row in range(rows):
+                perm = band * rows + row
+                hashed = (self._a[perm] * terms + self._b[perm]) % PRIME
+                signature[:, row] = np.minimum.reduceat(hashed, starts) if len(hashed) else hashed
+            keys = self._band_keys(signature)
+            order = np.argsort(keys, kind="stable")
+            self._keys.append(keys[order])
+            self._docs.append(self.doc_ids[order].astype(np.uint32))
+
+    def _band_keys(self, signature: "np.ndarray") -> "np.ndarray":
+        """Hash each row of a (n, rows) signature block to a 32-bit bucket key"""
+        mixed = (signature.astype(np.uint64) * self._mix).sum(axis=1, dtype=np.uint64)
+        return ((mixed >> np.uint64(32)) ^ mixed).astype(np.uint32)
+
+    def candidates(self, term_ids: Sequence[int]) -> Optional["np.ndarray"]:
+        """Return sorted candidate doc ids for a query's term ids (None: score exactly instead)"""
+        ids = np.asarray(term_ids, dtype=np.int64)
+        ids = ids[self.indexed[ids]] if len(ids) else ids
+        if not len(ids):
+            return None
+
+        signature = ((self._a[:, None] * ids[None, :] + self._b[:, None]) % PRIME).min(axis=1)
+        keys = self._band_keys(signature.reshape(self.bands, self.rows))
+        hits = []
+        for band, key in enumerate(keys):
+            bucket = self._keys[band]
+            start, end = np.searchsorted(bucket, key, "left"), np.searchsorted(bucket, key, "right")
+            if end > start:
+                hits.append(self._docs[band][start:end])
+        if not hits:
+            LSH_CANDIDATES.observe(0)
+            return None  # No bucket collisions: let the caller score exactly rather than miss
+
+        docs, counts = np.unique(np.concatenate(hits), return_counts=True)
+        if len(docs) > self.max_candidates:
+            # Keep the documents that share the most bands (highest estimated similarity)
+            best = np.lexsort((docs, -counts))[:self.max_candidates]
+            docs = np.sort(docs[best])
+        LSH_CANDIDATES.observe(len(docs))
+        return docs.astype(np.int64)
+
+    def stats(self):
+        """Return the index parameters and size"""
+        return {
+            "bands": self.bands,
+            "rows": self.rows,
+            "max_candidates": self.max_candidates,
+            "indexed_terms": self.indexed_terms,
+            "indexed_docs": int(len(self.doc_ids)),
+        }
+
+
+def maybe_build_lsh(postings_offsets: Sequence[int], postings_docs: Sequence[int],
+                    num_docs: int) -> Optional[MinHashLSH]:
+    """Build an LSH index for corpora of at least LSH_MIN_DOCS documents (None otherwise)"""
+    if num_docs < LSH_MIN_DOCS:
+        return None
+    if np is None:
+        logger.warning("numpy is not installed; LSH candidate generation disabled")
+        return None
+    lsh = MinHashLSH(postings_offsets, postings_docs, num_docs)
+    logger.info(f"Built LSH candidate index: {lsh.stats()}")
+    return lsh
@@ -0,0 +1,92 @@
+"""MaxScore dynamic pruning: exact top-k over sorted postings lists.
+
+Summing every posting of every query term touches each document that shares
+a word with the query, so a common term ("insurance", "policy") turns a
+query into a near full scan. MaxScore (Turtle and Flood) walks the lists
+document-at-a-time instead and keeps the k best documents in a min-heap.
+Each list carries an upper bound on what it can add to a document's score.
+Sorted by bound, the lists whose bounds together cannot beat the current
+k-th best score are "non-essential": a document is only considered when an
+essential list contains it, and non-essential lists are then probed with a
+binary search only while the document can still enter the heap. As the heap
+fills, more lists become non-essential and their postings are skipped.
+
+The result is exact: the same documents and scores as exhaustive scoring,
+with ties going to the lowest doc id. Lists with equal bounds are ordered
+longest first, so common terms are the first to become non-essential.
+Stdlib only, like the BM25 index that uses it.
+"""
+import heapq
+from bisect import bisect_left
+from itertools import accumulate
+from typing import Callable, List, NamedTuple, Sequence, Tuple
+
+
+class PostingList(NamedTuple):
+    """One query term: ``docs[start:end]`` sorted by doc id (a doc may repeat) and its scoring"""
+    docs: Sequence[int]
+    start: int
+    end: int
+    upper_bound: float                # Most the list adds to any one document
+    weight: Callable[[int], float]    # Score of the posting at a position in docs
+
+
+def top_k(lists: List[PostingList], k: int) -> List[Tuple[int, float]]:
+    """Return up to k (doc id, score) pairs with the highest summed weights, best first"""
+    lists = sorted((posting_list for posting_list in lists if posting_list.start < posting_list.end),
+                   key=lambda posting_list: (posting_list.upper_bound, posting_list.start - posting_list.end))
+    if not lists or k <= 0:
+        return []
+    count = len(lists)
+    docs = [posting_list.docs for posting_list in lists]
+    ends = [posting_list.end for posting_list in lists]
+    weights = [posting_list.weight for posting_list in lists]
+    positions = [posting_list.start for posting_list in lists]
+    # bounds[i]: the most lists[0..i] can add to a document together
+    bounds = list(accumulate(posting_list.upper_bound for posting_list in lists))
+
+    heap: List[Tuple[float, int]] = []  # (score, -doc id): the root is the current k-th best
+    threshold = 0.0
+    essential = 0  # lists[:essential] cannot lift a document into the heap on their own
+
+    while True:
+        doc = None
+        for i in range(essential, count):
+            pos = positions[i]
+            if pos < ends[i]:
+                candidate = docs[i][pos]
+                if doc is None or candidate < doc:
+                    doc = candidate
+        if doc is None:
+            break
+
+        score = 0.0
+        for i in range(essential, count):
+            list_docs, end, pos = docs[i], ends[i], positions[i]
+            while pos < end and list_docs[pos] == doc:
+                score += weights[i](pos)
+                pos += 1
+            positions[i] = pos
+        # Probe the non-essential lists, largest bound first, while the document can still qualify
+        for i in range(essential - 1, -1, -1):
+            if score + bounds[i] <= threshold:
+                break
+            list_docs, end = docs[i], ends[i]
+            pos = bisect_left(list_docs, doc, positions[i], end)
+            while pos < end and list_docs[pos] == doc:
+                score += weights[i](pos)
+                pos += 1
+            positions[i] = pos
+
+        # Documents arrive in id order, so one tied with the k-th best never displaces it
+        if score > threshold:
+            if len(heap) < k:
+                heapq.heappush(heap, (score, -doc))
+            else:
+                heapq.heapreplace(heap, (score, -doc))
+            if len(heap) == k:
+                threshold = heap[0][0]
+                while essential < count and bounds[essential] <= threshold:
+                    essential += 1
+
+    return [(-negated_doc, score) for score, negated_doc in sorted(heap, reverse=True)]
@@ -0,0 +1,192 @@
+"""Low-overhead request metrics in the Prometheus text format.
+
+Stdlib only (the ultra-simple chatbot must not pull in extra packages).
+Counters and histograms keep plain per-label-set totals behind a lock, so an
+observation costs a bisect and a few additions; ``/metrics`` renders them
+on demand. ``log_sampled`` replaces per-request debug lines with a JSON log
+record for a random ``LOG_SAMPLE_RATE`` fraction of requests.
+"""
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONFIDENCE_BUCKETS = (0.2, 0.4, 0.6, 0.8, 1.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    """Collection of metrics rendered together by the /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines: List[str] = []
+        for metric in metrics:
+            samples = metric.samples()
+            if not samples:
+                continue  # Nothing observed yet (e.g. chat metrics in the voice service)
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in values]
+
+
+class Gauge:
+    """Value read from a callback at scrape time (queue depths, pool sizes)"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float], registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        registry.register(self)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.callback())}"]
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels) -> _Timer:
+        """Context manager observing the duration of its block in seconds"""
+        return _Timer(self, labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def log_sampled(logger, event: str, rate: Optional[float] = None, **fields):
+    """Log a structured JSON record for a random sample of calls"""
+    if random.random() >= (LOG_SAMPLE_RATE if rate is None else rate):
+        return
+    logger.info(json.dumps({"event": event, **fields}, default=str, sort_keys=True))
+
+
+# Chat service metrics (shared by the three chatbot apps and their engines)
+CHAT_STAGE_SECONDS = Histogram("chat_stage_seconds", "Time spent in each chat pipeline stage", ["stage"])
+CHAT_MATCHES = Counter("chat_matches_total", "Chat queries by outcome", ["result"])
+CHAT_CONFIDENCE = Histogram("chat_match_confidence", "Confidence of matched chat answers",
+                            buckets=CONFIDENCE_BUCKETS)
+
+
+def record_chat_match(faq_id, confidence: float):
+    """Count a chat outcome and bucket its confidence"""
+    if faq_id is None:
+        CHAT_MATCHES.inc(result="no_match")
+    else:
+        CHAT_MATCHES.inc(result="match")
+        CHAT_CONFIDENCE.observe(confidence)
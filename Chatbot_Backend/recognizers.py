@@ -0,0 +1,187 @@
+"""Pluggable speech recognizer backends for the voice service.
+
+The backend is picked once per worker process with ``SPEECH_BACKEND`` and
+kept warm for every request:
+
+- ``google``: the Google Web Speech API (network round-trip per utterance).
+- ``vosk``: an offline Vosk model loaded once from ``VOSK_MODEL_PATH`` and
+  restricted to the command phrases, so short commands never leave the box.
+- ``stub``: a deterministic local stand-in for benchmarks and tests. It returns
+  ``STUB_TRANSCRIPT`` if set, otherwise a command phrase chosen from a hash of
+  the audio, after an optional ``STUB_DELAY_MS`` of simulated work.
+
+Every backend keeps one SpeechRecognition recognizer for reading clips into
+audio data (``record``) and for the network backends. Backends raise
+``sr.UnknownValueError`` / ``sr.RequestError`` like the SpeechRecognition
+API, and record per-call latency for the stats endpoint.
+"""
+import abc
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List
+
+import speech_recognition as sr
+
+logger = logging.getLogger(__name__)
+
+SPEECH_BACKEND = os.environ.get("SPEECH_BACKEND", "google")
+VOSK_MODEL_PATH = os.environ.get("VOSK_MODEL_PATH", "model")
+VOSK_SAMPLE_RATE = 16000
+STUB_TRANSCRIPT = os.environ.get("STUB_TRANSCRIPT", "")
+STUB_DELAY_MS = float(os.environ.get("STUB_DELAY_MS", "0"))
+LATENCY_WINDOW = 1024
+
+
+class RecognizerBackend(abc.ABC):
+    """Base class: times every transcription and keeps recent latencies"""
+
+    name = "base"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def set_phrases(self, phrases: Iterable[str]):
+        """Update the command phrases the backend should expect"""
+
+    @abc.abstractmethod
+    def _recognize(self, audio: sr.AudioData) -> str:
+        """Return the transcript of audio (the subclass's engine call)"""
+
+    def record(self, wav_audio) -> sr.AudioData:
+        """Read a whole 16-bit PCM WAV buffer or file path into audio data"""
+        with sr.AudioFile(wav_audio) as source:
+            return self.recognizer.record(source)
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """Return the transcript of audio, timing the call"""
+        started = time.perf_counter()
+        try:
+            return self._recognize(audio)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.calls += 1
+                self._latencies.append(elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call counts and latency percentiles over the recent window"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            calls, errors = self.calls, self.errors
+
+        def percentile(pct):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(round(pct / 100 * (len(latencies) - 1))))] * 1000
+
+        return {
+            "backend": self.name,
+            "calls": calls,
+            "errors": errors,
+            "latency_ms": {
+                "p50": percentile(50),
+                "p99": percentile(99),
+                "mean": (sum(latencies) / len(latencies) * 1000) if latencies else 0.0,
+            },
+        }
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech API through a long-lived SpeechRecognition recognizer"""
+
+    name = "google"
+
+    def __init__(self, phrases: Iterable[str] = ()):
+        super().__init__()
+
+    def _recognize(self, audio: sr.AudioData) -> str:
+        return self.recognizer.recognize_google(audio)
+
+
+class VoskBackend(RecognizerBackend):
+    """Offline Vosk model, loaded once and constrained to the command phrases"""
+
+    name = "vosk"
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, phrases: Iterable[str] = ()):
+        super().__init__()
+        import vosk
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+        self.grammar = None
+        self.set_phrases(phrases)
+
+    def set_phrases(self, phrases: Iterable[str]):
+        phrases = sorted({phrase.lower().strip() for phrase in phrases if phrase.strip()})
+        self.grammar = json.dumps(phrases + ["[unk]"]) if phrases else None
+
+    def _recognize(self, audio: sr.AudioData) -> str:
+        if self.grammar:
+            recognizer = self._vosk.KaldiRecognizer(self.model, VOSK_SAMPLE_RATE, self.grammar)
+        else:
+            recognizer = self._vosk.KaldiRecognizer(self.model, VOSK_SAMPLE_RATE)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=VOSK_SAMPLE_RATE, convert_width=2))
+        transcript = json.loads(recognizer.FinalResult()).get("text", "").replace("[unk]", "").strip()
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class StubBackend(RecognizerBackend):
+    """Deterministic local stand-in: same audio in, same transcript out"""
+
+    name = "stub"
+
+    def __init__(self, transcript: str = STUB_TRANSCRIPT, delay_ms: float = STUB_DELAY_MS,
+                 phrases: Iterable[str] = ()):
+        super().__init__()
+        self.transcript = transcript
+        self.delay = delay_ms / 1000
+        self.phrases: List[str] = []
+        self.set_phrases(phrases)
+
+    def set_phrases(self, phrases: Iterable[str]):
+        self.phrases = sorted(phrases)
+
+    def _recognize(self, audio: sr.AudioData) -> str:
+        if self.delay:
+            time.sleep(self.delay)
+        frames = audio.get_raw_data()
+        if not frames.strip(b"\0"):
+            raise sr.UnknownValueError()  # Pure silence
+        if self.transcript or not self.phrases:
+            return self.transcript or "stub transcript"
+        digest = hashlib.sha256(frames).digest()
+        return self.phrases[int.from_bytes(digest[:4], "big") % len(self.phrases)]
+
+
+BACKENDS = {
+    GoogleBackend.name: GoogleBackend,
+    VoskBackend.name: VoskBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def create_backend(name: str = SPEECH_BACKEND, phrases: Iterable[str] = ()) -> RecognizerBackend:
+    """Instantiate (and preload) the configured recognizer backend"""
+    name = name.lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown SPEECH_BACKEND '{name}', expected one of {sorted(BACKENDS)}")
+    backend = BACKENDS[name](phrases=phrases)
+    logger.info("Speech recognizer backend: %s", backend.name)
+    return backend
@@ -0,0 +1,91 @@
+"""Pre-serialized /api/chat response bodies indexed by FAQ id.
+
+Answers are classified once at load time: navigation payloads (answers that
+are themselves JSON objects) are stored as their final body, plain answers as
+the body fragment that follows the confidence value. Serving a match is then
+a lookup plus one ``bytes.join``, with no ``json.loads`` or ``jsonify``.
+"""
+import json
+from array import array
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+NO_MATCH_ANSWER = "I'm sorry, I don't have an answer for that. Please contact our support team."
+
+KIND_ANSWER = 0      # body = CONFIDENCE_PREFIX + confidence + fragment
+KIND_NAVIGATION = 1  # fragment is the complete body
+
+CONFIDENCE_PREFIX = b'{"confidence":'
+
+
+def _dumps(value) -> bytes:
+    # Same key order and separators as Flask's jsonify
+    return json.dumps(value, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+def classify_answer(answer: str) -> Tuple[int, bytes]:
+    """Return (kind, fragment) for an answer"""
+    if answer.lstrip().startswith("{"):
+        try:
+            payload = json.loads(answer)
+            if isinstance(payload, dict):
+                return KIND_NAVIGATION, _dumps(payload)
+        except json.JSONDecodeError:
+            pass
+    return KIND_ANSWER, b',"response":' + _dumps(answer) + b',"status":"success"}'
+
+
+def render_answer(answer: str, confidence: float) -> bytes:
+    """Serialize an answer that is not in a table"""
+    kind, fragment = classify_answer(answer)
+    if kind == KIND_NAVIGATION:
+        return fragment
+    return b"".join((CONFIDENCE_PREFIX, repr(float(confidence)).encode("ascii"), fragment))
+
+
+NO_MATCH_BODY = render_answer(NO_MATCH_ANSWER, 0.0)
+
+
+def render_batch(bodies: Iterable[bytes]) -> bytes:
+    """Wrap rendered bodies into the /api/chat/batch response"""
+    return b'{"results":[' + b",".join(bodies) + b'],"status":"success"}'
+
+
+class ResponseTable:
+    """Compact table of response fragments: one UTF-8 blob, an offsets array and a kind per FAQ id"""
+
+    def __init__(self, offsets: Sequence[int], blob, kinds: Sequence[int]):
+        self._offsets = offsets
+        self._blob = memoryview(blob)
+        self._kinds = kinds
+
+    @classmethod
+    def from_answers(cls, answers: Iterable[str]) -> "ResponseTable":
+        offsets = array("I", [0])
+        kinds = bytearray()
+        blob = bytearray()
+        for answer in answers:
+            kind, fragment = classify_answer(answer)
+            blob += fragment
+            offsets.append(len(blob))
+            kinds.append(kind)
+        return cls(offsets, bytes(blob), bytes(kinds))
+
+    def __len__(self) -> int:
+        return len(self._kinds)
+
+    def render(self, faq_id: Optional[int], confidence: float) -> bytes:
+        """Return the response body for a match (``None`` means no match)"""
+        if faq_id is None:
+            return NO_MATCH_BODY
+        fragment = self._blob[self._offsets[faq_id]:self._offsets[faq_id + 1]]
+        if self._kinds[faq_id] == KIND_NAVIGATION:
+            return bytes(fragment)
+        return b"".join((CONFIDENCE_PREFIX, repr(confidence).encode("ascii"), fragment))
+
+    def sections(self) -> List[Tuple[str, str, bytes]]:
+        """Serialize the table as index artifact sections"""
+        return [
+            ("responses.offsets", "I", array("I", self._offsets).tobytes()),
+            ("responses.blob", "B", self._blob.tobytes()),
+            ("responses.kinds", "B", bytes(self._kinds)),
+        ]
@@ -0,0 +1,494 @@
+"""Sharded FAQ index served by a pool of worker processes.
+
+One chatbot instance scores every query on a single core under the GIL. With
+``FAQ_SHARDS`` > 1 the corpus is split into contiguous row ranges, one per
+worker process. Each worker tokenizes its own rows, the front process merges
+the per-shard term counts into corpus-wide statistics (document frequencies,
+average length) and sends each worker back what it needs, and every worker
+then builds its shard with those global weights. BM25 and cosine scores are
+therefore identical to the single-process engines and can be compared across
+shards. Both build phases run on all workers at once, so build time scales
+with the number of cores.
+
+Each shard is written as a partial index artifact (see ``index_artifact``)
+under ``FAQ_SHARD_DIR`` (``/dev/shm`` when available) and mapped read-only by
+its worker, so the index lives in shared memory outside the Python heap. A
+worker that crashes or misses ``FAQ_SHARD_TIMEOUT`` is replaced by a fresh
+process that maps the same file instead of rebuilding, and the request is
+retried on it once.
+
+The front process tokenizes queries (including typo correction against the
+global vocabulary), fans each query or batch out to every shard in one
+message, and merges the per-shard top-k by score, ties going to the lowest
+FAQ id. Requests are pipelined: every message carries a sequence id, any
+number of web threads may have requests in flight on a shard at once, and a
+reader thread per shard hands each reply to the request that sent it.
+Replies to a request that already gave up on a shard are dropped, so a
+failure never leaves a stale reply for the next request to read.
+
+Workers use the ``spawn`` start method, so they never inherit the web
+worker's threads; spawned workers re-import the main module as
+``__mp_main__``, which the apps skip when building their chatbot.
+"""
+import atexit
+import heapq
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Tuple
+
+from answer_cache import AnswerCache, cached_match, cached_matches, dataset_version
+from analyzer import TermLookup, analyze, tfidf_vectors
+from bm25_index import BM25Index, bm25_idf
+from index_artifact import IndexArtifact, load_faq_entries, write_shard_artifact
+from metrics import CHAT_STAGE_SECONDS
+from response_table import NO_MATCH_ANSWER, ResponseTable
+from spell_correct import build_speller
+
+logger = logging.getLogger(__name__)
+
+FAQ_SHARDS = int(os.environ.get("FAQ_SHARDS", "0"))
+SHARD_TIMEOUT_SECONDS = float(os.environ.get("FAQ_SHARD_TIMEOUT", "10"))
+SHARD_DIR = os.environ.get("FAQ_SHARD_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+ENGINES = ("bm25", "tfidf")
+
+
+class ShardError(Exception):
+    """Raised when a shard cannot answer, even after a restart"""
+
+
+def _count_terms(engine: str, questions: List[str]):
+    """Tokenize a shard; returns (pending build state, document frequencies, total length)"""
+    if engine == "bm25":
+        index = BM25Index(questions)
+        return index, index.term_counts(), sum(index.doc_lengths)
+    term_counts = [Counter(analyze(question)) for question in questions]
+    doc_freqs = Counter()
+    for counts in term_counts:
+        doc_freqs.update(counts.keys())
+    return term_counts, dict(doc_freqs), 0
+
+
+def _build_shard(engine: str, pending, payload, artifact_path: str):
+    """Weight a tokenized shard with the corpus-wide statistics and write its artifact"""
+    if engine == "bm25":
+        num_docs, doc_freqs, avg_doc_length = payload
+        pending.apply_global_stats(num_docs, doc_freqs, avg_doc_length)
+        write_shard_artifact(artifact_path, pending.num_docs, bm25=pending)
+        return
+
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from sklearn.preprocessing import normalize
+
+    terms, idf = payload
+    vocabulary = {term: col for col, term in enumerate(terms)}
+    rows, cols, values = [], [], []
+    for doc_id, counts in enumerate(pending):
+        for term, tf in counts.items():
+            col = vocabulary[term]
+            rows.append(doc_id)
+            cols.append(col)
+            values.append(tf * idf[col])
+    # Same weighting as TfidfVectorizer: raw tf * smoothed idf, rows scaled to unit length
+    doc_matrix = csr_matrix((np.asarray(values, dtype=np.float64), (rows, cols)), shape=(len(pending), len(terms)))
+    term_doc_matrix = normalize(doc_matrix, norm="l2", copy=False).T.tocsr()
+    write_shard_artifact(artifact_path, len(pending), tfidf=(terms, np.asarray(idf), term_doc_matrix))
+
+
+def _load_shard(engine: str, artifact_path: str):
+    artifact = IndexArtifact(artifact_path)
+    if engine == "bm25":
+        return artifact.bm25_index()
+    return artifact.tfidf_model()[1]
+
+
+def _select_top_k(doc_ids, values, k: int) -> List[Tuple[int, float]]:
+    """Top-k (doc id, score) pairs of one sparse score row, best first, ties to the lowest id"""
+    import numpy as np
+
+    if len(values) > k:
+        cutoff = values[np.argpartition(values, -k)[-k:]].min()
+        keep = values >= cutoff
+        doc_ids, values = doc_ids[keep], values[keep]
+    order = np.lexsort((doc_ids, -values))[:k]
+    return [(int(doc_ids[i]), float(values[i])) for i in order]
+
+
+def _query(engine: str, index, payload) -> List[List[Tuple[int, float]]]:
+    queries, k = payload
+    if engine == "bm25":
+        return [index.top_k(terms, k) for terms in queries]
+    scores = (queries @ index).tocsr()
+    return [_select_top_k(scores.indices[scores.indptr[row]:scores.indptr[row + 1]],
+                          scores.data[scores.indptr[row]:scores.indptr[row + 1]], k)
+            for row in range(scores.shape[0])]
+
+
+def _worker_main(conn, engine: str, artifact_path: str):
+    """Worker loop: build or map one shard, then answer (sequence id, command, payload) requests in order"""
+    # A replacement for a crashed worker maps the shard that is already built
+    index = _load_shard(engine, artifact_path) if os.path.exists(artifact_path) else None
+    pending = None
+    while True:
+        try:
+            sequence, command, payload = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            if command == "count":
+                pending, doc_freqs, total_length = _count_terms(engine, payload)
+                conn.send((sequence, True, (doc_freqs, total_length)))
+            elif command == "build":
+                _build_shard(engine, pending, payload, artifact_path)
+                pending = None  # The mapped artifact replaces the heap-built shard
+                index = _load_shard(engine, artifact_path)
+                conn.send((sequence, True, None))
+            elif command == "query":
+                conn.send((sequence, True, _query(engine, index, payload)))
+            else:
+                conn.send((sequence, False, f"Unknown command {command}"))
+        except Exception as e:
+            conn.send((sequence, False, str(e)))
+
+
+class _Shard:
+    """One worker process, with a reader thread routing its replies to the requests waiting on them"""
+
+    def __init__(self, context, engine: str, artifact_path: str, first_doc: int):
+        self.engine = engine
+        self.artifact_path = artifact_path
+        self.first_doc = first_doc
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, engine, artifact_path), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._waiting: Dict[int, futures.Future] = {}
+        self._exited = False
+        self._reader = threading.Thread(target=self._read_replies, name="faq-shard-reader", daemon=True)
+        self._reader.start()
+
+    def request(self, sequence: int, command: str, payload) -> futures.Future:
+        """Send a request; the future resolves to the reply payload"""
+        future = futures.Future()
+        with self._lock:
+            if self._exited:
+                future.set_exception(EOFError("Shard worker exited"))
+                return future
+            self._waiting[sequence] = future
+        try:
+            with self._send_lock:
+                self.conn.send((sequence, command, payload))
+        except (OSError, ValueError) as e:
+            self.forget(sequence)
+            future.set_exception(OSError(f"Could not send to shard worker: {e}"))
+        return future
+
+    def forget(self, sequence: int):
+        """Stop waiting for a reply; if it still arrives, the reader drops it"""
+        with self._lock:
+            self._waiting.pop(sequence, None)
+
+    def _read_replies(self):
+        while True:
+            try:
+                sequence, ok, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._waiting.pop(sequence, None)
+            if future is None:
+                continue  # The request gave up on this shard (timeout or a failed sibling shard)
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(ShardError(payload))
+        with self._lock:
+            self._exited = True
+            waiting, self._waiting = self._waiting, {}
+        for future in waiting.values():
+            future.set_exception(EOFError("Shard worker exited"))
+
+    def stop(self):
+        # Killing the worker ends the reader with EOF and fails whatever was still waiting on it
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join(timeout=1)
+        self._reader.join(timeout=1)
+        self.conn.close()
+
+
+class ShardPool:
+    """Worker processes each holding one contiguous shard of the corpus"""
+
+    def __init__(self, engine: str, shards: int, timeout: float = SHARD_TIMEOUT_SECONDS,
+                 directory: Optional[str] = SHARD_DIR):
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown shard engine '{engine}', expected one of {ENGINES}")
+        self.engine = engine
+        self.timeout = timeout
+        self.directory = tempfile.mkdtemp(prefix="faq-shards-", dir=directory)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._restart_lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._shards: List[_Shard] = []
+        self.size = shards
+        self.queries = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.restarts = 0
+        atexit.register(self.close)
+
+    def build(self, questions: List[str]) -> Tuple[Dict[str, int], int]:
+        """Partition questions across the workers and build every shard.
+
+        Returns the corpus-wide document frequencies and total document length.
+        """
+        bounds = [len(questions) * shard // self.size for shard in range(self.size + 1)]
+        self._shards = [_Shard(self._context, self.engine, os.path.join(self.directory, f"shard-{shard}.bin"),
+                               bounds[shard])
+                        for shard in range(self.size)]
+
+        # Phase 1: every worker tokenizes its rows in parallel
+        sequence = next(self._sequence)
+        pending = [shard.request(sequence, "count", questions[start:end])
+                   for shard, (start, end) in zip(self._shards, zip(bounds, bounds[1:]))]
+        shard_freqs = [self._build_reply(future) for future in pending]
+        doc_freqs = Counter()
+        total_length = 0
+        for freqs, length in shard_freqs:
+            doc_freqs.update(freqs)
+            total_length += length
+
+        # Phase 2: every worker weights its shard with the global statistics and maps it
+        num_docs = len(questions)
+        sequence = next(self._sequence)
+        if self.engine == "bm25":
+            avg_doc_length = total_length / num_docs if num_docs else 0.0
+            pending = [shard.request(sequence, "build",
+                                     (num_docs, {term: doc_freqs[term] for term in freqs}, avg_doc_length))
+                       for shard, (freqs, _) in zip(self._shards, shard_freqs)]
+        else:
+            terms = sorted(doc_freqs)
+            # TfidfVectorizer's smoothed idf, so scores match the single-process engine
+            idf = [math.log((1 + num_docs) / (1 + doc_freqs[term])) + 1 for term in terms]
+            pending = [shard.request(sequence, "build", (terms, idf)) for shard in self._shards]
+        for future in pending:
+            self._build_reply(future)
+        return dict(doc_freqs), total_length
+
+    def _build_reply(self, future: futures.Future):
+        try:
+            return future.result()
+        except EOFError as e:
+            raise ShardError(f"FAQ shard worker exited during the build: {e}")
+
+    def _reply(self, future: futures.Future, timeout: float):
+        """Wait for a query reply, counting worker errors and timeouts"""
+        try:
+            return future.result(max(timeout, 0))
+        except ShardError:
+            with self._lock:
+                self.failures += 1
+            raise
+        except (TimeoutError, futures.TimeoutError):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError("Shard did not answer in time")
+
+    def _restart(self, position: int, failed: _Shard) -> _Shard:
+        """Replace a failed worker, unless a concurrent request already has"""
+        with self._restart_lock:
+            if position >= len(self._shards):
+                raise ShardError("FAQ shard pool is closed")
+            shard = self._shards[position]
+            if shard is not failed:
+                return shard
+            shard.stop()
+            replacement = _Shard(self._context, self.engine, shard.artifact_path, shard.first_doc)
+            with self._lock:
+                self._shards[position] = replacement
+                self.restarts += 1
+        logger.warning(f"Restarted FAQ shard {position} ({self.engine})")
+        return replacement
+
+    def _exchange(self, position: int, shard: _Shard, future: futures.Future, sequence: int, payload,
+                  deadline: float):
+        """Collect one shard's reply, restarting it and retrying once if it crashed or stalled"""
+        try:
+            return self._reply(future, deadline - time.monotonic())
+        except (EOFError, OSError, TimeoutError) as e:
+            logger.error(f"FAQ shard {position} failed ({type(e).__name__}): {str(e)}")
+        shard.forget(sequence)
+        shard = self._restart(position, shard)
+        future = shard.request(sequence, "query", payload)
+        try:
+            return self._reply(future, self.timeout)
+        except (EOFError, OSError, TimeoutError) as e:
+            raise ShardError(f"FAQ shard {position} unavailable: {e}")
+        finally:
+            shard.forget(sequence)
+
+    def top_k(self, queries, count: int, k: int) -> List[List[Tuple[int, float]]]:
+        """Fan a batch of ``count`` queries out to every shard and merge the per-shard top-k"""
+        payload = (queries, k)
+        sequence = next(self._sequence)
+        shards = list(self._shards)
+        deadline = time.monotonic() + self.timeout
+        pending = [shard.request(sequence, "query", payload) for shard in shards]
+        merged: List[List[Tuple[int, float]]] = [[] for _ in range(count)]
+        try:
+            for position, (shard, future) in enumerate(zip(shards, pending)):
+                results = self._exchange(position, shard, future, sequence, payload, deadline)
+                for slot, pairs in enumerate(results):
+                    merged[slot].extend((shard.first_doc + doc_id, score) for doc_id, score in pairs)
+        finally:
+            # Shards not read yet (another shard failed): their late replies are dropped, not left queued
+            for shard in shards:
+                shard.forget(sequence)
+
+        with self._lock:
+            self.queries += count
+        # Ties go to the lowest FAQ id, as in the single-process engines
+        return [heapq.nlargest(k, pairs, key=lambda pair: (pair[1], -pair[0])) for pairs in merged]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool counters"""
+        with self._lock:
+            return {
+                "engine": self.engine,
+                "shards": self.size,
+                "alive": sum(shard.process.is_alive() for shard in self._shards),
+                "queries": self.queries,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+            }
+
+    def close(self):
+        """Stop every worker and delete the shard files"""
+        with self._lock:
+            shards, self._shards = self._shards, []
+        for shard in shards:
+            shard.stop()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class ShardedFAQChatBot:
+    """FAQ chatbot whose index is split across ``shards`` worker processes"""
+
+    def __init__(self, csv_path: str, engine: str = "bm25", shards: int = FAQ_SHARDS):
+        self.answer_cache = AnswerCache(version=lambda: dataset_version(csv_path))
+        entries = load_faq_entries(csv_path)
+        questions, answers = entries.questions, entries.answers
+        self.consolidation = entries.summary
+        self.answers = answers
+        self.responses = ResponseTable.from_answers(answers)
+        self.engine = engine
+        self.pool = ShardPool(engine, max(shards, 1))
+        try:
+            doc_freqs, _ = self.pool.build(questions)
+        except Exception:
+            self.pool.close()
+            raise
+        self.speller = build_speller(doc_freqs)
+        self.terms = TermLookup(doc_freqs, self.speller)
+
+        num_docs = len(questions)
+        if engine == "bm25":
+            self.doc_freqs = doc_freqs
+            self.num_docs = num_docs
+            self.max_idf = bm25_idf(num_docs, 0)
+        else:
+            terms = sorted(doc_freqs)
+            # Same smoothed idf as TfidfVectorizer; the lookup maps query words straight to columns
+            self.idf = [math.log((1 + num_docs) / (1 + doc_freqs[term])) + 1 for term in terms]
+            self.terms = TermLookup({term: col for col, term in enumerate(terms)}, self.speller)
+        logger.info(f"Built {self.pool.size} {engine} shards over {num_docs} FAQ entries")
+
+    def _bm25_terms(self, query: str) -> Tuple[List[str], float]:
+        """Known (or corrected) terms of a query and the score used to normalise confidence"""
+        terms = []
+        ideal_score = 0.0
+        for term, doc_freq in set(self.terms.terms(query)):
+            if doc_freq is None:
+                ideal_score += self.max_idf
+            else:
+                terms.append(term)
+                ideal_score += bm25_idf(self.num_docs, doc_freq)
+        return terms, ideal_score
+
+    def _top_k(self, user_queries: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        """Return the top-k (FAQ id, confidence) pairs for each query, best first"""
+        with CHAT_STAGE_SECONDS.time(stage="tokenize"):
+            if self.engine == "bm25":
+                parsed = [self._bm25_terms(query) for query in user_queries]
+            else:
+                query_matrix = tfidf_vectors(self.terms, user_queries, self.idf)
+        with CHAT_STAGE_SECONDS.time(stage="score"):
+            if self.engine == "bm25":
+                if not any(terms for terms, _ in parsed):
+                    return [[] for _ in user_queries]
+                matches = self.pool.top_k([terms for terms, _ in parsed], len(user_queries), k)
+                return [[(doc_id, min(score / ideal_score, 1.0)) for doc_id, score in pairs]
+                        for pairs, (_, ideal_score) in zip(matches, parsed)]
+            return self.pool.top_k(query_matrix, len(user_queries), k)
+
+    def find_top_k_ids(self, user_query: str, k: int = 5, threshold: float = 0.2) -> List[Tuple[int, float]]:
+        """Return up to k FAQ ids above the threshold with their confidence, best first"""
+        return [(doc_id, float(score)) for doc_id, score in self._top_k([user_query], k)[0] if score > threshold]
+
+    def find_top_k(self, user_query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Return up to k matching FAQ answers with their confidence, best first"""
+        return [(self.answers[doc_id], score) for doc_id, score in self._top_k([user_query], k)[0]]
+
+    @cached_match
+    def find_best_match_id(self, user_query: str, threshold: float = 0.2) -> Tuple[Optional[int], float]:
+        """Find the best matching FAQ id across all shards (None if nothing matches)"""
+        pairs = self._top_k([user_query], 1)[0]
+        if pairs and pairs[0][1] > threshold:
+            return pairs[0][0], float(pairs[0][1])
+        return None, 0.0
+
+    @cached_matches
+    def find_best_match_ids(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[Optional[int], float]]:
+        """Find the best matching FAQ id for each query with one fan-out per batch"""
+        results = []
+        for pairs in self._top_k(user_queries, 1):
+            if pairs and pairs[0][1] > threshold:
+                results.append((pairs[0][0], float(pairs[0][1])))
+            else:
+                results.append((None, 0.0))
+        return results
+
+    def find_best_match(self, user_query: str, threshold: float = 0.2) -> Tuple[str, float]:
+        """Find the best matching FAQ answer"""
+        best_idx, confidence = self.find_best_match_id(user_query, threshold)
+        if best_idx is None:
+            return NO_MATCH_ANSWER, 0.0
+        return self.answers[best_idx], confidence
+
+    def find_best_matches(self, user_queries: List[str], threshold: float = 0.2) -> List[Tuple[str, float]]:
+        """Find the best matching FAQ answer for each query"""
+        return [(NO_MATCH_ANSWER, 0.0) if best_idx is None else (self.answers[best_idx], confidence)
+                for best_idx, confidence in self.find_best_match_ids(user_queries, threshold)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return shard pool counters"""
+        return self.pool.stats()
+
+    def close(self):
+        """Stop the shard workers"""
+        self.pool.close()
@@ -0,0 +1,145 @@
+"""Typo correction for query words via a symmetric-deletion (SymSpell) index.
+
+Users type "insurence" and "cliam"; the engines only score exact vocabulary
+hits, so such words are corrected to the closest indexed term first. At build
+time every vocabulary term is expanded into all strings reachable by deleting
+up to ``max_distance`` characters from its first ``prefix_length``
+characters, and each deletion maps back to the terms that produced it. A
+misspelled word is expanded the same way; the terms sharing a deletion with
+it are the only candidates, and their true (optimal string alignment)
+distance is checked. Lookup cost depends on the word length, not the
+vocabulary size.
+
+Only words missing from the vocabulary are looked up. Words shorter than
+``FAQ_SPELL_MIN_LENGTH`` are never corrected, and words up to five
+characters allow a single edit, so short unknown words are not rewritten into
+unrelated terms. Among equally close terms the one in the most questions
+wins. Stdlib only (the ultra-simple chatbot must not pull in extra packages).
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Set
+
+from metrics import Counter
+
+SPELL_CORRECTION = os.environ.get("FAQ_SPELL_CORRECTION", "1") != "0"
+SPELL_MAX_DISTANCE = int(os.environ.get("FAQ_SPELL_MAX_DISTANCE", "2"))
+SPELL_PREFIX_LENGTH = int(os.environ.get("FAQ_SPELL_PREFIX_LENGTH", "7"))
+SPELL_MIN_LENGTH = int(os.environ.get("FAQ_SPELL_MIN_LENGTH", "4"))
+SPELL_CACHE_SIZE = 10000
+
+SPELL_LOOKUPS = Counter("chat_spelling_lookups_total", "Unknown query words by correction outcome", ["result"])
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance (adjacent transpositions count once), capped at max_distance + 1"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    # Shared prefixes and suffixes never cost anything; only the differing middle needs the table
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < len(a) - start and end < len(b) - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    a, b = a[start:len(a) - end], b[start:len(b) - end]
+    if not a or not b:
+        return min(max(len(a), len(b)), max_distance + 1)
+
+    previous_previous: List[int] = []
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return min(previous[-1], max_distance + 1)
+
+
+def _deletes(word: str, max_distance: int) -> Set[str]:
+    """Every string obtained by deleting up to max_distance characters from word (word included)"""
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        found |= frontier
+    return found
+
+
+class SymSpell:
+    """Precomputed deletion dictionary over a vocabulary with term frequencies"""
+
+    def __init__(self, term_counts: Dict[str, int], max_distance: int = SPELL_MAX_DISTANCE,
+                 prefix_length: int = SPELL_PREFIX_LENGTH, min_length: int = SPELL_MIN_LENGTH):
+        self.term_counts = term_counts
+        self.max_distance = max_distance
+        self.prefix_length = max(prefix_length, max_distance + 1)
+        self.min_length = min_length
+        self._cache: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+
+        self.deletes: Dict[str, List[str]] = {}
+        for term in term_counts:
+            if len(term) < min_length - max_distance:
+                continue
+            for key in _deletes(term[:self.prefix_length], max_distance):
+                self.deletes.setdefault(key, []).append(term)
+
+    def _allowed_distance(self, word: str) -> int:
+        return min(self.max_distance, 1 if len(word) <= 5 else 2)
+
+    def lookup(self, word: str) -> Optional[str]:
+        """Return the closest vocabulary term to an unknown word, or None"""
+        cached = self._cache.get(word, self)
+        if cached is not self:
+            return cached
+
+        best = None
+        if len(word) >= self.min_length:
+            allowed = self._allowed_distance(word)
+            best_key = None
+            seen = set()
+            for key in _deletes(word[:self.prefix_length], allowed):
+                for term in self.deletes.get(key, ()):
+                    if term in seen:
+                        continue
+                    seen.add(term)
+                    distance = edit_distance(word, term, allowed)
+                    if distance > allowed:
+                        continue
+                    rank = (distance, -self.term_counts[term], term)
+                    if best_key is None or rank < best_key:
+                        best, best_key = term, rank
+
+        with self._lock:
+            if len(self._cache) >= SPELL_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[word] = best
+        SPELL_LOOKUPS.inc(result="unknown" if best is None else "corrected")
+        return best
+
+    def correct(self, word: str) -> str:
+        """Return word unchanged if it is known or uncorrectable, else its correction"""
+        if word in self.term_counts:
+            return word
+        return self.lookup(word) or word
+
+    def stats(self):
+        """Return the dictionary size and settings"""
+        return {
+            "terms": len(self.term_counts),
+            "deletes": len(self.deletes),
+            "max_distance": self.max_distance,
+            "prefix_length": self.prefix_length,
+            "cached": len(self._cache),
+        }
+
+
+def build_speller(term_counts: Dict[str, int]) -> Optional[SymSpell]:
+    """Build the typo corrector for an engine's vocabulary (None when FAQ_SPELL_CORRECTION=0)"""
+    return SymSpell(term_counts) if SPELL_CORRECTION else None
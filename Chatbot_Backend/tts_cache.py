@@ -0,0 +1,168 @@
+"""Content-addressed cache of synthesized speech for voice replies.
+
+Spoken replies come from a small, fixed set of command messages, so audio is
+rendered once and reused. Each clip is stored as ``<sha256>.<format>`` where
+the hash covers (text, voice, format): identical replies share one file, a
+file's content never changes, and clients may cache it forever. Every
+command message is pre-rendered at startup so replies never wait on
+synthesis.
+
+The synthesizer is chosen with ``TTS_BACKEND``: ``gtts`` (Google Text-to-Speech,
+MP3) or ``stub``, a deterministic local stand-in that writes a short tone as
+WAV for tests and benchmarks.
+"""
+import hashlib
+import io
+import logging
+import math
+import os
+import re
+import tempfile
+import threading
+import wave
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "gtts")
+TTS_LANGUAGE = os.environ.get("TTS_LANGUAGE", "en")
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", "static")
+
+CACHE_MAX_AGE_SECONDS = 365 * 24 * 3600  # Content-addressed files never change
+CACHE_FILENAME = re.compile(r"^[0-9a-f]{64}\.(mp3|wav)$")
+MIMETYPES = {"mp3": "audio/mpeg", "wav": "audio/wav"}
+
+
+class GTTSSynthesizer:
+    """Google Text-to-Speech (network call per clip)"""
+
+    format = "mp3"
+
+    def __init__(self, language: str = TTS_LANGUAGE):
+        self.language = language
+        self.voice = f"gtts-{language}"
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=self.language).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class StubSynthesizer:
+    """Deterministic local stand-in: a tone whose pitch and length depend on the text"""
+
+    format = "wav"
+    voice = "stub"
+    rate = 16000
+
+    def synthesize(self, text: str) -> bytes:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        frequency = 200 + digest[0] * 2
+        samples = int(self.rate * min(0.05 * len(text), 3.0))
+        frames = bytearray()
+        for i in range(samples):
+            value = int(6000 * math.sin(2 * math.pi * frequency * i / self.rate))
+            frames += value.to_bytes(2, "little", signed=True)
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.rate)
+            wav.writeframes(bytes(frames))
+        return buffer.getvalue()
+
+
+SYNTHESIZERS = {
+    "gtts": GTTSSynthesizer,
+    "stub": StubSynthesizer,
+}
+
+
+def create_synthesizer(name: str = TTS_BACKEND):
+    """Instantiate the configured synthesizer"""
+    name = name.lower()
+    if name not in SYNTHESIZERS:
+        raise ValueError(f"Unknown TTS_BACKEND '{name}', expected one of {sorted(SYNTHESIZERS)}")
+    return SYNTHESIZERS[name]()
+
+
+def cache_key(text: str, voice: str, fmt: str) -> str:
+    """Content address of a clip: sha256 over (text, voice, format)"""
+    return hashlib.sha256("\0".join((text, voice, fmt)).encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """On-disk, content-addressed store of rendered replies"""
+
+    def __init__(self, synthesizer, directory: str = TTS_CACHE_DIR):
+        self.synthesizer = synthesizer
+        self.directory = directory
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+        self.errors = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, text: str) -> str:
+        """Return the cache filename for text with the current voice and format"""
+        fmt = self.synthesizer.format
+        return f"{cache_key(text, self.synthesizer.voice, fmt)}.{fmt}"
+
+    def lookup(self, text: str) -> Optional[str]:
+        """Return the filename of an already rendered clip, or None"""
+        filename = self.filename(text)
+        found = os.path.exists(os.path.join(self.directory, filename))
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return filename if found else None
+
+    def render(self, text: str) -> str:
+        """Return the clip filename for text, synthesizing it if it is not cached"""
+        filename = self.filename(text)
+        path = os.path.join(self.directory, filename)
+        with self._lock:
+            key_lock = self._locks.setdefault(filename, threading.Lock())
+        with key_lock:  # One synthesis per clip even under concurrent requests
+            if os.path.exists(path):
+                return filename
+            audio = self.synthesizer.synthesize(text)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(audio)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self.renders += 1
+        return filename
+
+    def prerender(self, texts: Iterable[str]) -> int:
+        """Render every distinct text; returns how many are available"""
+        rendered = 0
+        for text in sorted(set(texts)):
+            try:
+                self.render(text)
+                rendered += 1
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                logger.warning(f"Could not pre-render reply '{text}': {str(e)}")
+        return rendered
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters"""
+        with self._lock:
+            return {
+                "voice": self.synthesizer.voice,
+                "format": self.synthesizer.format,
+                "hits": self.hits,
+                "misses": self.misses,
+                "renders": self.renders,
+                "errors": self.errors,
+            }
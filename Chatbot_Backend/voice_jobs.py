@@ -0,0 +1,158 @@
+"""Asynchronous voice transcription jobs.
+
+Transcribing an upload takes seconds (decoding, noise calibration and the
+recognizer round-trip), which would otherwise pin a web worker per request.
+``JobQueue`` runs that work on a fixed set of background threads fed by a
+bounded queue: submitting returns a job id immediately, callers long-poll
+``wait()`` for the result, and ``JobQueueFull`` is raised when the queue is
+at capacity so the endpoint can shed load. Finished jobs are kept for
+``result_ttl`` seconds so clients can still fetch their result.
+
+Jobs live in the process that accepted them, so the voice service should run
+as a single (threaded) web worker.
+"""
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+VOICE_JOB_WORKERS = int(os.environ.get("VOICE_JOB_WORKERS", "4"))
+VOICE_JOB_QUEUE_SIZE = int(os.environ.get("VOICE_JOB_QUEUE_SIZE", "32"))
+VOICE_JOB_RESULT_TTL = float(os.environ.get("VOICE_JOB_RESULT_TTL", "300"))
+VOICE_JOB_MAX_WAIT = float(os.environ.get("VOICE_JOB_MAX_WAIT", "25"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class Job:
+    """A unit of work and its outcome"""
+
+    def __init__(self, func: Callable[..., Any], args: tuple):
+        self.id = uuid.uuid4().hex
+        self.func = func
+        self.args = args
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job state for the results endpoint"""
+        data = {"job_id": self.id, "status": self.status}
+        if self.status == DONE:
+            data["response"] = self.result
+        elif self.status == FAILED:
+            data["error"] = self.error
+        return data
+
+
+class JobQueue:
+    """Bounded job queue drained by a fixed pool of worker threads"""
+
+    def __init__(self, workers: int = VOICE_JOB_WORKERS, queue_size: int = VOICE_JOB_QUEUE_SIZE,
+                 result_ttl: float = VOICE_JOB_RESULT_TTL):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.result_ttl = result_ttl
+        self._queue: "queue.Queue[Job]" = queue.Queue(maxsize=queue_size)
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_run = 0.0
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"voice-job-{index}", daemon=True).start()
+
+    def submit(self, func: Callable[..., Any], *args) -> Job:
+        """Queue func(*args) and return its job, or raise JobQueueFull"""
+        job = Job(func, args)
+        with self._lock:
+            self._expire()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise JobQueueFull("Voice job queue is full")
+            self._jobs[job.id] = job
+            self.submitted += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job by id, or None if it is unknown or expired"""
+        with self._lock:
+            self._expire()
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Job]:
+        """Long-poll: block up to timeout seconds for the job to finish, then return it"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done.wait(timeout)
+        return job
+
+    def _expire(self):
+        """Forget finished jobs older than result_ttl (caller holds the lock)"""
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            job.started_at = time.time()
+            job.status = RUNNING
+            with self._lock:
+                self.running += 1
+            try:
+                job.result = job.func(*job.args)
+                job.status = DONE
+            except Exception as e:
+                logger.error(f"Voice job {job.id} failed: {str(e)}")
+                job.error = str(e)
+                job.status = FAILED
+            job.finished_at = time.time()
+            with self._lock:
+                self.running -= 1
+                self.total_wait += job.started_at - job.submitted_at
+                self.total_run += job.finished_at - job.started_at
+                if job.status == DONE:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            job.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth and job counters"""
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self.queue_size,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_seconds": (self.total_wait / finished) if finished else 0.0,
+                "avg_run_seconds": (self.total_run / finished) if finished else 0.0,
+                "retained_jobs": len(self._jobs),
+            }
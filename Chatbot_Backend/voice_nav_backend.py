@@ -1,59 +1,65 @@
 import os
 import json
+import logging
+import threading
 import speech_recognition as sr
-from flask import Flask, request, jsonify, send_file
-from gtts import gTTS
-import tempfile
-from flask_cors import CORS
-from pydub import AudioSegment
+from flask import Flask, Response, request, jsonify, send_file
+from werkzeug.exceptions import RequestEntityTooLarge
 
+from admission import AdmissionGate, Overloaded
+from audio_pipeline import UPLOAD_FOLDER, VOICE_MAX_SECONDS, VOICE_MAX_UPLOAD_BYTES, clip_seconds, read_upload
+from command_matcher import CommandMatcher
+from cors import CorsPolicy, default_allowed_origins
+from decoder_pool import DecoderBusy, DecoderPool
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, log_sampled
+from recognizers import create_backend
+from tts_cache import CACHE_FILENAME, CACHE_MAX_AGE_SECONDS, MIMETYPES, TTS_CACHE_DIR, TTSCache, create_synthesizer
+from vad import trim_silence
+from voice_jobs import VOICE_JOB_MAX_WAIT, JobQueue, JobQueueFull
+
+# Configure logging (per-request details go out as sampled structured records)
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Oversized uploads are refused from the Content-Length header, before the body is read
+app.config["MAX_CONTENT_LENGTH"] = VOICE_MAX_UPLOAD_BYTES
 
 # Get the frontend URL from environment variable, with fallback for local development
 frontend_url = os.environ.get("FRONTEND_URL", "http://localhost:3000")
 
-# Define allowed origins - include common Vercel domains
-allowed_origins = [
-    "http://localhost:3000",
-    "https://localhost:3000"
-]
-
-# Add production frontend URL if provided
-if frontend_url:
-    allowed_origins.append(frontend_url)
-
-# Add common Vercel domains
-vercel_domains = [
-    "https://*.vercel.app",
-    "https://*.vercel.app/*"
-]
-allowed_origins.extend(vercel_domains)
-
-# Configure CORS with more permissive settings
-CORS(app, 
-     origins=allowed_origins,
-     supports_credentials=True,
-     methods=["GET", "POST", "OPTIONS"],
-     allow_headers=["Content-Type", "Authorization"])
-
-# Add CORS headers to all responses
-@app.after_request
-def after_request(response):
-    origin = request.headers.get('Origin')
-    if origin in allowed_origins or any(origin.endswith('.vercel.app') for origin in allowed_origins if '*' in origin):
-        response.headers.add('Access-Control-Allow-Origin', origin)
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
-    response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    response.headers.add('Access-Control-Allow-Credentials', 'true')
-    return response
+# Local development, the frontend URL and Vercel deployments; compiled once and
+# applied to every response (preflights are answered before routing)
+allowed_origins = default_allowed_origins(frontend_url)
+cors = CorsPolicy(allowed_origins)
+cors.install(app)
 
-# Ensure necessary folders exist
-UPLOAD_FOLDER = "uploads"
-STATIC_FOLDER = "static"
+# Ensure necessary folders exist (uploads only holds per-request scratch dirs); spoken
+# replies are cached and served from TTS_CACHE_DIR
+STATIC_FOLDER = TTS_CACHE_DIR
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(STATIC_FOLDER, exist_ok=True)
 
+# Warm decoder processes shared by all requests in this worker (started on first use)
+decoder_pool = DecoderPool()
+
+# Background transcription jobs for /voice-jobs (bounded queue, fixed worker threads)
+voice_jobs = JobQueue()
+
+# Concurrency limit and bounded wait queue for /voice-command; the rest is shed with a 503
+command_gate = AdmissionGate("voice_command")
+
+# Prometheus metrics served from /metrics
+VOICE_STAGE_SECONDS = Histogram("voice_stage_seconds", "Time spent in each voice pipeline stage", ["stage"])
+VOICE_COMMANDS = Counter("voice_commands_total", "Voice and text commands by outcome", ["result"])
+Gauge("voice_job_queue_depth", "Voice jobs waiting for a worker", lambda: voice_jobs.stats()["queue_depth"])
+Gauge("voice_jobs_running", "Voice jobs being processed", lambda: voice_jobs.stats()["running"])
+Gauge("voice_decoder_waiting", "Requests waiting for an audio decoder", lambda: decoder_pool.stats()["waiting"])
+Gauge("voice_command_active", "Voice commands holding a processing slot", lambda: command_gate.active)
+Gauge("voice_command_waiting", "Voice commands queued for a processing slot", lambda: command_gate.waiting)
+VOICE_UPLOADS_REJECTED = Counter("voice_uploads_rejected_total", "Uploads refused before decoding", ["reason"])
+VOICE_ERRORS = Counter("voice_errors_total", "Voice pipeline failures by stage", ["stage"])
+
 # Predefined commands with actions - Updated to match the chatbot navigation
 COMMANDS = {
     "policy": {"action": "navigate", "page": "/user-dashboard", "message": "I'll take you to your policies"},
@@ -94,95 +100,113 @@ COMMANDS = {
     "customer support": {"action": "response", "message": "You can contact our support team at support@insure.com or call us at 1-800-INSURE"},
 }
 
-def convert_to_wav(audio_path):
-    """Convert audio file to WAV format with PCM encoding."""
-    try:
-        print(f"🔄 Converting {audio_path} to WAV format...")  # Debugging
+# Spoken replies, content-addressed under static/ and pre-rendered in the background
+tts_cache = TTSCache(create_synthesizer(), STATIC_FOLDER)
 
-        audio = AudioSegment.from_file(audio_path)
-        wav_path = os.path.join(UPLOAD_FOLDER, "converted_audio.wav")
-        audio.export(wav_path, format="wav", parameters=["-acodec", "pcm_s16le"])  # Ensure PCM format
-        
-        print(f"✅ Conversion successful: {wav_path}")  # Debugging
-        return wav_path
-    except Exception as e:
-        print(f"❌ Error converting file: {e}")
-        return None
+def prerender_replies(commands):
+    """Render the audio for every command message without blocking startup."""
+    messages = [command["message"] for command in commands.values()]
+    threading.Thread(target=tts_cache.prerender, args=(messages,), daemon=True).start()
 
-def transcribe_audio(audio_path):
-    """Convert speech in an audio file to text."""
-    print(f"🎙️ Processing file: {audio_path}")  # Debugging
-    recognizer = sr.Recognizer()
+prerender_replies(COMMANDS)
 
-    # Force conversion to WAV (even if already WAV, this ensures correct format)
-    audio_path = convert_to_wav(audio_path)
-    if not audio_path:
-        return "❌ Audio conversion failed."
+# Recognizer engine chosen by SPEECH_BACKEND, loaded once per worker process
+speech_backend = create_backend(phrases=COMMANDS)
 
+def transcribe_audio(wav_audio):
+    """Convert speech in a 16-bit PCM WAV buffer (or file path) to text."""
     try:
-        with sr.AudioFile(audio_path) as source:
-            # Adjust for ambient noise
-            print("🔊 Adjusting for ambient noise...")
-            recognizer.adjust_for_ambient_noise(source, duration=0.5)
-            
-            print("🎤 Recording audio...")
-            audio_data = recognizer.record(source)
+        # Silence was already trimmed by the VAD stage, so read the whole clip
+        audio_data = speech_backend.record(wav_audio)
         
-        print("🔍 Recognizing speech...")
-        transcript = recognizer.recognize_google(audio_data)  # Google Speech API
-        print(f"✅ Transcribed: '{transcript}'")  # Debugging
-        return transcript
+        with VOICE_STAGE_SECONDS.time(stage="recognize"):
+            return speech_backend.transcribe(audio_data)
     except sr.UnknownValueError:
-        print("❌ Speech could not be recognized - audio may be too quiet or unclear")
+        VOICE_ERRORS.inc(stage="unrecognized")
+        logger.warning("Speech could not be recognized - audio may be too quiet or unclear")
         return "❌ Speech could not be recognized. Please speak more clearly and try again."
     except sr.RequestError as e:
-        print(f"❌ Speech recognition service error: {e}")
+        VOICE_ERRORS.inc(stage="recognizer_service")
+        logger.error(f"Speech recognition service error: {str(e)}")
         return "❌ Could not connect to speech recognition service. Please check your internet connection."
     except Exception as e:
-        print(f"❌ Unexpected error in speech recognition: {e}")
+        VOICE_ERRORS.inc(stage="recognize")
+        logger.error(f"Unexpected error in speech recognition: {str(e)}")
         return f"❌ Speech recognition error: {str(e)}"
 
+def transcribe_upload(data, file_ext):
+    """Decode an uploaded clip on the decoder pool and transcribe it."""
+    try:
+        with VOICE_STAGE_SECONDS.time(stage="convert"):
+            wav_audio = decoder_pool.decode(data, file_ext)
+    except DecoderBusy:
+        raise
+    except Exception as e:
+        VOICE_ERRORS.inc(stage="convert")
+        logger.error(f"Error converting file: {str(e)}")
+        return "❌ Audio conversion failed."
+
+    # Clips whose header did not declare a duration are measured once decoded, before recognition
+    check_duration(clip_seconds(wav_audio.getvalue()))
+
+    try:
+        with VOICE_STAGE_SECONDS.time(stage="vad"):
+            vad = trim_silence(wav_audio.getvalue())
+    except Exception as e:
+        VOICE_ERRORS.inc(stage="vad")
+        logger.warning(f"Voice activity detection failed, using the full clip: {str(e)}")
+        return transcribe_audio(wav_audio)
+    log_sampled(logger, "voice_audio", bytes=len(data), format=file_ext, seconds=round(vad.original_seconds, 3),
+                speech_seconds=round(vad.speech_seconds, 3), noise_floor=round(vad.noise_floor, 1))
+    if vad.wav is None:
+        return "❌ No speech detected. Please speak into the microphone and try again."
+    return transcribe_audio(vad.wav)
+
+# Compiled matcher over the command phrases; rebuilt by set_commands()
+command_matcher = CommandMatcher(COMMANDS)
+
+def set_commands(commands):
+    """Replace the command table and rebuild the phrase matcher."""
+    global COMMANDS, command_matcher
+    matcher = CommandMatcher(commands)
+    COMMANDS, command_matcher = commands, matcher
+    speech_backend.set_phrases(commands)
+    prerender_replies(commands)
+
+def command_response(value):
+    """Build the response for a matched command."""
+    if value["action"] == "navigate":
+        response = {
+            "type": "navigation", 
+            "destination": value["page"],
+            "message": value["message"]
+        }
+    else:
+        response = {"type": "response", "message": value["message"]}
+
+    # Attach the spoken reply once it has been rendered
+    audio_file = tts_cache.lookup(value["message"])
+    if audio_file:
+        response["audio_url"] = f"/get-audio/{audio_file}"
+    return response
+
 def process_command(transcript):
     """Match transcript with predefined commands and return appropriate action."""
-    print(f"🔍 Processing command: '{transcript}'")  # Debug the input
-    
     # Check if transcript is an error message
     if "Speech could not be recognized" in transcript or "❌" in transcript:
-        print(f"❌ Error message detected: {transcript}")
+        VOICE_COMMANDS.inc(result="error")
+        log_sampled(logger, "voice_command", transcript=transcript, result="error")
         return {"type": "response", "message": transcript}
     
-    transcript = transcript.lower().strip()
-    print(f"🔍 Looking for matches in: '{transcript}'")  # Debug the processed input
+    # Longest command phrase on word boundaries (an exact match is always the longest)
+    commands, matcher = COMMANDS, command_matcher
+    with VOICE_STAGE_SECONDS.time(stage="match"):
+        phrase = matcher.best_match(transcript.strip())
+    VOICE_COMMANDS.inc(result="no_match" if phrase is None else "match")
+    log_sampled(logger, "voice_command", transcript=transcript, command=phrase)
+    if phrase is not None:
+        return command_response(commands[phrase])
     
-    # Check for exact matches first
-    if transcript in COMMANDS:
-        print(f"✅ Exact match found: '{transcript}'")
-        value = COMMANDS[transcript]
-        if value["action"] == "navigate":
-            return {
-                "type": "navigation", 
-                "destination": value["page"],
-                "message": value["message"]
-            }
-        elif value["action"] == "response":
-            return {"type": "response", "message": value["message"]}
-    
-    # Check for partial matches
-    for key, value in COMMANDS.items():
-        print(f"🔍 Checking partial match: '{key}' in '{transcript}'")  # Debug each command check
-        if key in transcript:  # Allow partial match
-            print(f"✅ Partial match found: '{key}' in '{transcript}'")  # Debug successful match
-            if value["action"] == "navigate":
-                return {
-                    "type": "navigation", 
-                    "destination": value["page"],
-                    "message": value["message"]
-                }
-            elif value["action"] == "response":
-                return {"type": "response", "message": value["message"]}
-    
-    print(f"❌ No matches found for: '{transcript}'")  # Debug no match
-    print(f"🔍 Available commands: {list(COMMANDS.keys())}")  # Debug available commands
     return {"type": "response", "message": "I'm sorry, I couldn't understand your request. Please try saying 'policy', 'claims', 'vault', or 'health insurance'."}
 
 @app.route("/debug-command/<text>")
@@ -198,12 +222,9 @@ def debug_command(text):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/test-command", methods=["POST", "OPTIONS"])
+@app.route("/test-command", methods=["POST"])
 def test_command():
     """Test endpoint to verify command matching"""
-    if request.method == "OPTIONS":
-        return jsonify({"status": "preflight"}), 200
-        
     try:
         data = request.get_json()
         if not data or 'text' not in data:
@@ -213,55 +234,151 @@ def test_command():
         result = process_command(text)
         return jsonify({"response": result})
     except Exception as e:
-        print(f"❌ Error in test-command: {e}")
+        VOICE_ERRORS.inc(stage="test_command")
+        logger.error(f"Error in test-command: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route("/voice-command", methods=["POST", "OPTIONS"])
-def voice_command():
-    """Handles voice commands by processing uploaded audio."""
-    if request.method == "OPTIONS":
-        return jsonify({"status": "preflight"}), 200
-        
-    if "file" not in request.files:
-        return jsonify({"error": "No file uploaded"}), 400
+class UploadError(Exception):
+    """Raised when a voice upload is missing or unusable"""
 
-    file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "Empty file"}), 400
+class UploadTooLarge(UploadError):
+    """Raised when a voice upload exceeds the size or duration cap"""
+
+def check_duration(seconds):
+    """Refuse clips longer than VOICE_MAX_SECONDS (None means the length is unknown)."""
+    if seconds is not None and seconds > VOICE_MAX_SECONDS:
+        VOICE_UPLOADS_REJECTED.inc(reason="duration")
+        raise UploadTooLarge(f"Recording is too long (max {VOICE_MAX_SECONDS:g} seconds)")
+
+def check_upload_limits(data):
+    """Apply the size and declared-duration caps before any decoding work."""
+    if len(data) > VOICE_MAX_UPLOAD_BYTES:
+        VOICE_UPLOADS_REJECTED.inc(reason="size")
+        raise UploadTooLarge(f"Upload is too large (max {VOICE_MAX_UPLOAD_BYTES} bytes)")
+    check_duration(clip_seconds(data))
 
+def read_voice_upload():
+    """Validate the uploaded clip and return (data, file_ext)."""
     try:
-        # Extract file extension
-        file_ext = os.path.splitext(file.filename)[1]
-        if not file_ext:
-            return jsonify({"error": "Invalid file format"}), 400
+        files = request.files
+    except RequestEntityTooLarge:
+        VOICE_UPLOADS_REJECTED.inc(reason="size")
+        raise UploadTooLarge(f"Upload is too large (max {VOICE_MAX_UPLOAD_BYTES} bytes)")
+    if "file" not in files:
+        raise UploadError("No file uploaded")
+
+    file = files["file"]
+    if file.filename == "":
+        raise UploadError("Empty file")
+
+    # Extract file extension
+    file_ext = os.path.splitext(file.filename)[1]
+    if not file_ext:
+        raise UploadError("Invalid file format")
 
-        # Save uploaded file with extension
-        temp_audio_path = os.path.join(UPLOAD_FOLDER, f"received_audio{file_ext}")
-        file.save(temp_audio_path)
+    # Keep the upload in memory; nothing is written to a shared path
+    with VOICE_STAGE_SECONDS.time(stage="upload"):
+        data = read_upload(file)
+    if not data:
+        raise UploadError("Empty file")
+    check_upload_limits(data)
+    return data, file_ext
 
-        print(f"📂 File saved: {temp_audio_path}")  # Debugging
+def run_voice_command(data, file_ext):
+    """Transcribe an uploaded clip and match it against the commands."""
+    transcript = transcribe_upload(data, file_ext)
+    return process_command(transcript)
 
-        # Convert speech to text
-        transcript = transcribe_audio(temp_audio_path)
+def run_admitted_voice_command(data, file_ext):
+    """Run a voice command once /voice-command admission control grants it a slot."""
+    with command_gate.admit():
+        return run_voice_command(data, file_ext)
 
-        print(f"✅ Received transcript: {transcript}")  # Debugging
+def busy_response(retry_after):
+    """503 for a shed request, telling the client when to retry."""
+    response = jsonify({"error": "Voice service is busy, please try again"})
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 503
 
-        # Process the command
-        result = process_command(transcript)
+@app.route("/voice-command", methods=["POST"])
+def voice_command():
+    """Handles voice commands by processing uploaded audio."""
+    try:
+        data, file_ext = read_voice_upload()
+        result = run_admitted_voice_command(data, file_ext)
         return jsonify({"response": result})
 
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except Overloaded as e:
+        return busy_response(e.retry_after)
+    except DecoderBusy:
+        return busy_response(1)
     except Exception as e:
-        print(f"❌ Error processing voice command: {e}")  # Log the actual error
+        VOICE_ERRORS.inc(stage="voice_command")
+        logger.error(f"Error processing voice command: {str(e)}")
         return jsonify({"error": "Failed to process command"}), 500
 
+@app.route("/voice-jobs", methods=["POST"])
+def submit_voice_job():
+    """Queue a voice command for background transcription and return its job id."""
+    try:
+        data, file_ext = read_voice_upload()
+        job = voice_jobs.submit(run_voice_command, data, file_ext)
+    except UploadTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except UploadError as e:
+        return jsonify({"error": str(e)}), 400
+    except JobQueueFull:
+        return busy_response(1)
+
+    response = jsonify({"job_id": job.id, "status": job.status, "result_url": f"/voice-jobs/{job.id}"})
+    response.headers["Location"] = f"/voice-jobs/{job.id}"
+    return response, 202
+
+@app.route("/voice-jobs/stats", methods=["GET"])
+def voice_job_stats():
+    """Queue depth and job counters for the voice job pool"""
+    return jsonify({"jobs": voice_jobs.stats(), "decoder": decoder_pool.stats(),
+                    "recognizer": speech_backend.stats(), "tts": tts_cache.stats(),
+                    "admission": command_gate.stats()})
+
+@app.route("/voice-jobs/<job_id>", methods=["GET"])
+def voice_job_result(job_id):
+    """Return a job's status; ?wait=N long-polls up to N seconds for it to finish."""
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), VOICE_JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    job = voice_jobs.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
 
 @app.route("/get-audio/<filename>")
 def get_audio(filename):
     """Serves the generated audio file to the frontend."""
     audio_path = os.path.join(STATIC_FOLDER, filename)
-    if os.path.exists(audio_path):
-        return send_file(audio_path, mimetype="audio/mp3")
-    return jsonify({"error": "File not found"}), 404
+    if not os.path.exists(audio_path):
+        return jsonify({"error": "File not found"}), 404
+
+    if CACHE_FILENAME.match(filename):
+        # Content-addressed clip: the name is the ETag and the bytes never change
+        key, fmt = filename.split(".")
+        response = send_file(audio_path, mimetype=MIMETYPES[fmt], conditional=True,
+                             etag=key, max_age=CACHE_MAX_AGE_SECONDS)
+        response.headers["Cache-Control"] = f"public, max-age={CACHE_MAX_AGE_SECONDS}, immutable"
+        return response
+    return send_file(audio_path, mimetype="audio/mp3")
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms, command counters and queue gauges in Prometheus text format"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route("/health", methods=["GET"])
 def health_check():